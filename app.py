@@ -1,74 +1,165 @@
 
 import os
 import subprocess
-from flask import Flask, send_from_directory
-from src.api import api
-from src.oled_display import OLEDDisplay 
-oled_display = OLEDDisplay()
-
-app = Flask(__name__, static_folder='static')
+import time
+from flask import Flask, Response, abort, g, jsonify, redirect, request, send_from_directory, url_for
+from src.api import (api, metrics_text, queue_missing_proxies, start_next_queued_test, thermal_governor,
+                     oled_display, ir_monitor, bandwidth, warmup)
+from src.capture import start_camera
+from src.metrics import histogram
+from src.segments import recover_segments
+from src.timelapse import recover_timelapses
+from src.static_assets import AssetStore, IMMUTABLE, REVALIDATE
+from src.video_tools import probe_ffmpeg
+
+# /static/ is served from the fingerprinted asset store below.
+app = Flask(__name__, static_folder=None)
 
 # --- Paths ---
 # Define the absolute path to the directory containing video logs.
-LOGS_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'test_logs')
+PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
+LOGS_DIR = os.path.join(PROJECT_ROOT, 'test_logs')
+
+# Pages and static files, hashed and precompressed once at startup.
+assets = AssetStore(os.path.join(PROJECT_ROOT, 'src'), os.path.join(PROJECT_ROOT, 'static')).build()
 
 
 # --- Start Camera Simulator ---
+SIMULATOR_STARTUP_SECONDS = 2
+
 def start_camera_simulator():
-    """Starts the camera simulator script in a separate process."""
+    """Starts the camera simulator script in a separate process. It runs as
+    a module from the project root so its `src.` imports resolve."""
+    subprocess.run(["pkill", "-f", "src.camera_simulator"], check=False)
+    python_executable = os.path.join(PROJECT_ROOT, '.venv', 'bin', 'python')
+    process = subprocess.Popen([python_executable, "-m", "src.camera_simulator"], cwd=PROJECT_ROOT)
+    # Fail the warm-up device if the simulator dies on start-up (an import
+    # error, say) rather than reporting it ready.
     try:
-        subprocess.run(["pkill", "-f", "src/camera_simulator.py"], check=False)
-        python_executable = os.path.join(os.getcwd(), '.venv', 'bin', 'python')
-        subprocess.Popen([python_executable, "src/camera_simulator.py"])
-        print("Camera simulator started.")
-    except Exception as e:
-        print(f"Error starting camera simulator: {e}")
+        returncode = process.wait(timeout=SIMULATOR_STARTUP_SECONDS)
+    except subprocess.TimeoutExpired:
+        returncode = None
+    if returncode:
+        raise RuntimeError(f"camera simulator exited with status {returncode}")
+    print("Camera simulator started.")
+
+
+# --- Device Warm-up ---
+# Devices start in parallel in the background at boot; /healthz and /readyz
+# report on them, and camera requests get a 503 until the camera is up.
+def warm_up_oled():
+    if not oled_display.initialize():
+        raise RuntimeError("no display found on I2C")
+    oled_display.display_initializing()
+
+def on_warmup_complete():
+    # Status screen once everything is up, then any tests queued meanwhile.
+    oled_display.start_status_updates()
+    start_next_queued_test()
+
+warmup.add('camera', lambda: start_camera().backend.name)
+warmup.add('ir_sensor', ir_monitor.setup)
+warmup.add('oled', warm_up_oled, required=False)
+warmup.add('ffmpeg', probe_ffmpeg, required=False)
+warmup.add('camera_simulator', start_camera_simulator, required=False)
+warmup.when_ready(on_warmup_complete)
 
 
 # --- App Setup ---
 app.register_blueprint(api, url_prefix='/api')
 
+@app.route('/healthz')
+def healthz():
+    """Liveness: the server is up. Includes each device's warm-up state."""
+    return jsonify({'status': 'ok', **warmup.status()})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 once every required device is up, 503 until then."""
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+# --- Request Metrics ---
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        histogram('http_request_duration_seconds', 'Flask request latency by route.',
+                  route=route, method=request.method).observe(time.perf_counter() - started)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of the app's metrics."""
+    return Response(metrics_text(), mimetype='text/plain; version=0.0.4')
+
 
 # --- Main Application Routes ---
+def serve_asset(asset, cache_control):
+    """Serves the best precompressed variant the client accepts, or an empty
+    304 if it already has this content."""
+    encoding, body, etag = asset.negotiate(request.headers.get('Accept-Encoding'))
+    headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+    if asset.matches(request.headers.get('If-None-Match')):
+        return Response(status=304, headers=headers)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype=asset.mimetype, headers=headers)
+
 @app.route("/")
 def index():
-    return send_from_directory('src', 'index.html')
+    return serve_asset(assets.page('index.html'), REVALIDATE)
 
 @app.route("/history")
 def history():
-    return send_from_directory('src', 'history.html')
+    return serve_asset(assets.page('history.html'), REVALIDATE)
 
 @app.route("/system-info")
 def system_info():
-    return send_from_directory('src', 'system-info.html')
+    return serve_asset(assets.page('system-info.html'), REVALIDATE)
 
 @app.route("/play/<filename>")
 def play(filename):
-    return send_from_directory('src', 'player.html')
+    return serve_asset(assets.page('player.html'), REVALIDATE)
 
 
 # --- Static File and Video Routes ---
+@app.route('/static/<filename>')
+def static_file(filename):
+    """Fingerprinted static files; the name changes whenever the content does."""
+    asset = assets.file(filename)
+    if asset is None:
+        abort(404)
+    return serve_asset(asset, IMMUTABLE)
+
 @app.route('/live_feed')
 def live_feed():
-    """Serves the live feed image."""
-    return send_from_directory(app.static_folder, 'live_feed.png')
+    """Serves the latest live feed image."""
+    return redirect(url_for('api.camera_snapshot'))
 
 @app.route('/videos/<path:filename>')
 def serve_video(filename):
-    """Serves video files directly from the test_logs directory."""
-    return send_from_directory(LOGS_DIR, filename)
+    """Serves video files directly from the test_logs directory, shaped so
+    playback and downloads don't starve a running test."""
+    return bandwidth.wrap(send_from_directory(LOGS_DIR, filename), filename, request.remote_addr)
 
 
 # --- Main ---
 if __name__ == "__main__":
-    oled_display = OLEDDisplay()
-    if oled_display.is_active:
-        oled_display.display_initializing()
-        
-    start_camera_simulator()
+    warmup.start()
+    # Finalize any recording a crash or power loss left in segments.
+    recover_segments(LOGS_DIR)
+    recover_timelapses(LOGS_DIR)
+    queue_missing_proxies()
 
+    # Slows the live feed, OLED and background transcodes as the Pi heats up.
+    thermal_governor.on_change(lambda level: setattr(oled_display, 'refresh_seconds', level.oled_refresh_seconds))
+    thermal_governor.start()
 
-    if oled_display.is_active:
-        oled_display.start_status_updates()
-        
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)), debug=True, use_reloader=False)
@@ -0,0 +1,38 @@
+# Measures the frame rate and per-frame cost of a capture backend.
+# Usage: python capture_bench.py <picamera2|opencv|simulator|replay> [seconds]
+#   CAMERA_DEVICE and CAMERA_REPLAY_FILE select the webcam or video file.
+import sys
+import time
+from src.capture import open_backend
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python capture_bench.py <picamera2|opencv|simulator|replay> [seconds]")
+        sys.exit(2)
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    backend = open_backend(sys.argv[1])
+    backend.start()
+    frames = 0
+    buffers = set()
+    wait = 0.0
+    slowest = 0.0
+    started = time.perf_counter()
+    last = started
+    try:
+        for frame in backend.frames():
+            now = time.perf_counter()
+            wait += now - last
+            slowest = max(slowest, now - last)
+            last = now
+            frames += 1
+            # Distinct buffer addresses; a handful means frames are not copied.
+            buffers.add(frame.array.__array_interface__['data'][0])
+            if now - started >= seconds:
+                break
+    finally:
+        backend.stop()
+    elapsed = time.perf_counter() - started
+    print(f"{backend.name}: {frames} frames of {backend.width}x{backend.height} in {elapsed:.1f}s "
+          f"= {frames / elapsed:.1f} fps (target {backend.framerate}), "
+          f"mean {wait / max(frames, 1) * 1000:.2f} ms, max {slowest * 1000:.2f} ms per frame, "
+          f"{len(buffers)} distinct buffers")
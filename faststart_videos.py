@@ -0,0 +1,13 @@
+# Rewrites archived recordings so their MP4 index sits at the front of the file.
+# Usage: python faststart_videos.py [directory]   (defaults to test_logs/)
+import os
+import sys
+from src.video_tools import faststart_directory
+
+LOGS_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'test_logs')
+
+if __name__ == '__main__':
+    directory = sys.argv[1] if len(sys.argv) > 1 else LOGS_DIR
+    counts = faststart_directory(directory)
+    print(f"Done: {counts['fixed']} fixed, {counts['skipped']} already faststart, {counts['failed']} failed.")
+    sys.exit(1 if counts['failed'] else 0)
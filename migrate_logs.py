@@ -0,0 +1,66 @@
+# Converts test_logs.json to the compact version 2 log schema and validates it.
+# The file is streamed entry by entry, so any size can be migrated on a Pi.
+# Usage: python migrate_logs.py [input] [output]
+#   With no output the input is replaced atomically once the new file validates.
+#   Use --check to only validate the input.
+import os
+import sys
+from src.log_schema import iter_log_file, upgrade_entry, validate_entry, write_entries
+
+LOGS_FILE = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'test_logs', 'test_logs.json')
+
+
+def migrate(input_path, output_path):
+    counts = {'entries': 0, 'upgraded': 0, 'invalid': 0}
+
+    def entries():
+        for entry, version in iter_log_file(input_path):
+            if version == 1:
+                entry = upgrade_entry(entry)
+                counts['upgraded'] += 1
+            errors = validate_entry(entry)
+            if errors:
+                counts['invalid'] += 1
+                print(f"Entry {entry.get('id', '?')}: {', '.join(errors)}")
+            counts['entries'] += 1
+            yield entry
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        write_entries(f, entries())
+    return counts
+
+
+def check(path):
+    counts = {'entries': 0, 'invalid': 0}
+    for entry, version in iter_log_file(path):
+        if version == 1:
+            entry = upgrade_entry(entry)
+        errors = validate_entry(entry)
+        if errors:
+            counts['invalid'] += 1
+            print(f"Entry {entry.get('id', '?')}: {', '.join(errors)}")
+        counts['entries'] += 1
+    return counts
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a != '--check']
+    input_path = args[0] if args else LOGS_FILE
+    if '--check' in sys.argv:
+        counts = check(input_path)
+        print(f"{counts['entries']} entries, {counts['invalid']} invalid.")
+        sys.exit(1 if counts['invalid'] else 0)
+
+    in_place = len(args) < 2
+    output_path = input_path + '.migrating' if in_place else args[1]
+    counts = migrate(input_path, output_path)
+    print(f"{counts['entries']} entries written ({counts['upgraded']} upgraded), {counts['invalid']} invalid.")
+
+    # Re-read the output to prove it parses and holds every entry.
+    verified = check(output_path)
+    if verified['entries'] != counts['entries'] or counts['invalid']:
+        print(f"Validation failed; original left untouched. Output kept at {output_path}.")
+        sys.exit(1)
+    if in_place:
+        os.replace(output_path, input_path)
+        print(f"Replaced {input_path}.")
@@ -6,15 +6,38 @@ import psutil
 import socket
 import subprocess
 import time
-from src.camera import get_camera_instance
+import math
+import itertools
+from src.capture import get_camera_instance, current_camera_instance, camera_state
+from src.warmup import Warmup, PENDING, STARTING, READY
+from src.segments import segment_index_path, SegmentIndex
+from src.integrity import sha256_file
+from src.timelapse import tail_path_for, MIN_INTERVAL_SECONDS
+from src.test_queue import TestQueue
+from src.change_feed import ChangeFeed
+from src.log_search import LogSearchIndex, DEFAULT_LIMIT, MAX_LIMIT
+from src.proxies import ProxyTranscoder, proxy_path_for
+from src.keyframes import load_index, snap_to_keyframe, index_path_for
+from src.video_tools import cut_clip
+from src.telemetry import TelemetryRecorder, telemetry_path_for, read_telemetry
+from src.thermal import ThermalGovernor, LEVELS
+from src.bandwidth import BandwidthShaper
+from src.live_view import latency_seconds as live_latency_seconds
+from src.log_schema import (load_entries, write_serialized, dumps_entry, to_api, now_ms, ms_to_datetime, iso_to_ms,
+                            STATUS_RUNNING, STATUS_CODES, STATUS_NAMES)
+from src import conversion
+from src.metrics import histogram, render_metrics
+from src.profiling import sample_stacks, dump_thread_stacks
 from src.ir_sensor import IRSensorMonitor
+from src.ir_signal import IRSignalRecorder, ir_signal_path_for, read_ir_signal
 from PIL import Image, ImageDraw, ImageFont
 import adafruit_ssd1306
 import threading
 import io
 import re
+import hmac
 from src.oled_display import OLEDDisplay
-oled_display = OLEDDisplay() 
+oled_display = OLEDDisplay()
 api = Blueprint('api', __name__)
 
 # --- Timezone ---
@@ -24,6 +47,14 @@ IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 LOGS_DIR = os.path.join(PROJECT_ROOT, 'test_logs')
 LOGS_FILE = os.path.join(LOGS_DIR, 'test_logs.json')
+QUEUE_FILE = os.path.join(LOGS_DIR, 'test_queue.json')
+CHANGES_FILE = os.path.join(LOGS_DIR, 'changes.jsonl')
+CLIPS_DIR = os.path.join(LOGS_DIR, 'clips')
+# Cut clips are a cache: the least recently used go first above the size
+# cap, and any unused for CLIP_MAX_AGE_SECONDS are dropped.
+CLIP_CACHE_MAX_BYTES = 512 * 1024 ** 2
+CLIP_MAX_AGE_SECONDS = 7 * 24 * 3600
+THERMAL_EVENTS_FILE = os.path.join(LOGS_DIR, 'thermal_events.jsonl')
 
 
 # --- Globals ---
@@ -33,12 +64,48 @@ last_net_stats = psutil.net_io_counters()
 psutil.cpu_percent(interval=None)
 active_tests = {}
 lock = threading.Lock()
+test_queue = TestQueue(QUEUE_FILE)
+change_feed = ChangeFeed(CHANGES_FILE)
+search_index = LogSearchIndex()
+BATCH_ACTIONS = ('delete_log', 'delete_video', 'set_status')
+MAX_BATCH_ITEMS = 10000
+# Background file removals started by /test/logs/batch, by job id. Only the
+# last MAX_BATCH_JOBS are kept, and a job's file list is dropped once done.
+MAX_BATCH_JOBS = 20
+batch_jobs = {}
+_batch_ids = itertools.count(1)
+# Proxies wait while a test records or while the governor holds back background work.
+proxy_transcoder = ProxyTranscoder(LOGS_DIR, is_busy=lambda: bool(active_tests) or thermal_governor.level.pause_background)
+
+def _record_buffer_fill():
+    camera = current_camera_instance()
+    buffer = camera.record_buffer if camera else None
+    return buffer.buffered / buffer.capacity if buffer else 0.0
+
+# Downloads yield to the recording and the live view while a test runs.
+bandwidth = BandwidthShaper(
+    is_busy=lambda: bool(active_tests),
+    sources={
+        'recording': lambda: current_camera_instance() and current_camera_instance().record_stats.bytes,
+        'live': lambda: current_camera_instance() and current_camera_instance().live_bytes_sent
+    },
+    record_pressure=_record_buffer_fill)
 
 # Assuming the IR sensor is connected to BCM pin 17
 IR_SENSOR_PIN = 17
 ir_monitor = IRSensorMonitor(sensor_pin=IR_SENSOR_PIN)
+# Boot warm-up of the rig's devices; app.py registers them and starts it.
+warmup = Warmup()
+
+# Token for the admin-only endpoints; they are disabled when it is unset.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
 
 # --- Helper Functions ---
+def is_admin_request():
+    """Checks the X-Admin-Token header against the ADMIN_TOKEN environment variable."""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(),
+                                                    ADMIN_TOKEN.encode())
+
 def get_cpu_temperature():
     """Reads the CPU temperature from the system file on a Raspberry Pi."""
     try:
@@ -48,19 +115,47 @@ def get_cpu_temperature():
     except (FileNotFoundError, ValueError):
         return None
 
+thermal_governor = ThermalGovernor(get_cpu_temperature, events_path=THERMAL_EVENTS_FILE)
+
+def apply_thermal_level(level):
+    """Applies the governor's live-feed limits to the camera, if it is running."""
+    camera = current_camera_instance()
+    if camera:
+        camera.set_stream_limits(level.stream_max_fps, level.stream_quality)
+
+thermal_governor.on_change(apply_thermal_level)
+
+_read_logs_seconds = histogram('log_store_operation_seconds', 'Time spent reading or writing the test log file.', operation='read')
+_write_logs_seconds = histogram('log_store_operation_seconds', 'Time spent reading or writing the test log file.', operation='write')
+
 def read_logs():
+    """Returns the log entries in the compact schema (see src/log_schema.py).
+    A file still in the original format is upgraded as it is read."""
     if not os.path.exists(LOGS_FILE):
         return []
+    started = time.perf_counter()
     try:
         with open(LOGS_FILE, 'r') as f:
-            return json.load(f)
+            return load_entries(json.load(f))
     except (json.JSONDecodeError, FileNotFoundError):
         return []
+    finally:
+        _read_logs_seconds.observe(time.perf_counter() - started)
 
 def write_logs(logs):
     os.makedirs(LOGS_DIR, exist_ok=True)
-    with open(LOGS_FILE, 'w') as f:
-        json.dump(logs, f, indent=4)
+    started = time.perf_counter()
+    serialized = [dumps_entry(log) for log in logs]
+    # Written to a temporary file and renamed, so the log is replaced in
+    # one step and a crash mid-write can't leave it truncated.
+    tmp_path = LOGS_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        write_serialized(f, serialized)
+    os.replace(tmp_path, LOGS_FILE)
+    ids = [log.get('id') for log in logs]
+    change_feed.record(ids, serialized)
+    search_index.record(ids, serialized, logs)
+    _write_logs_seconds.observe(time.perf_counter() - started)
 
 def format_duration(seconds):
     h = seconds // 3600
@@ -68,14 +163,6 @@ def format_duration(seconds):
     s = seconds % 60
     return f"{h}h {m}m {s}s"
 
-def get_video_filename_from_log(log):
-    """Gets the video filename from a log entry, supporting both old and new formats."""
-    if 'video_filename' in log and log['video_filename']:
-        return log['video_filename']
-    if 'video_path' in log and log['video_path']:
-        return os.path.basename(log['video_path'])
-    return None
-
 def stop_test_internally(log_id, status, reason=None):
     with lock:
         if log_id not in active_tests:
@@ -86,32 +173,118 @@ def stop_test_internally(log_id, status, reason=None):
 
         if 'timer' in test_info and test_info['timer'].is_alive():
             test_info['timer'].cancel()
+        keep_tail = status == 'Fail' and 'keep_tail_event' in test_info
+        if keep_tail:
+            test_info['keep_tail_event'].set()
         if 'stop_event' in test_info:
             test_info['stop_event'].set()
         if 'recording_thread' in test_info and test_info['recording_thread'].is_alive():
             test_info['recording_thread'].join()
+
+        telemetry = test_info['telemetry'].stop() if 'telemetry' in test_info else None
+        ir_signal = test_info['ir_signal'].stop() if 'ir_signal' in test_info else None
+
+        camera = get_camera_instance()
+        capture_health = None
+        if camera and 'keep_tail_event' not in test_info:
+            capture_health = camera.record_stats.snapshot()
+            if camera.record_buffer is not None:
+                capture_health['write_buffer'] = camera.record_buffer.snapshot()
+        if camera and camera.overlay is not None:
+            if capture_health is not None:
+                capture_health['overlay_cost_us'] = camera.overlay.cost_us.snapshot()
+            camera.clear_overlay()
         
         logs = read_logs()
         for log in logs:
-            if log.get('id') == log_id and log['status'] == 'Running':
-                log['status'] = status
-                log['end_time'] = datetime.datetime.now(IST).isoformat()
+            if log.get('id') == log_id and log['status'] == STATUS_RUNNING:
+                log['status'] = STATUS_CODES[status]
+                log['end_ms'] = now_ms()
+                log['actual_duration'] = (log['end_ms'] - log['start_ms']) // 1000
                 if reason:
                     log['failure_reason'] = reason
+                if capture_health:
+                    log['capture_health'] = capture_health
+                if telemetry:
+                    log['telemetry'] = telemetry
+                if ir_signal:
+                    log['ir_signal'] = ir_signal
+                thermal_events = thermal_governor.events_since(log['start_ms'])
+                if thermal_events:
+                    log['thermal_events'] = thermal_events
+                if keep_tail and log.get('video_filename'):
+                    log['tail_video_filename'] = os.path.basename(tail_path_for(log['video_filename']))
+                if log.get('queued_at'):
+                    log['turnaround_seconds'] = round((log['end_ms'] - log['queued_at']) / 1000, 1)
                 break
         write_logs(logs)
 
+    start_next_queued_test()
 
-# --- API Routes ---
-@api.route('/test/start', methods=['POST'])
-def start_test():
+def record_integrity(log_id, integrity):
+    """Stores a finalized recording's hashes on its log entry."""
     with lock:
-        if active_tests:
-            return jsonify({'status': 'An existing test is already running'}), 409
+        logs = read_logs()
+        for log in logs:
+            if log.get('id') == log_id:
+                log['integrity'] = integrity
+                write_logs(logs)
+                break
 
-    data = request.get_json()
-    duration = int(data.get('duration'))
-    sample_code = data['sample_code']
+def queue_missing_proxies():
+    """Queues proxies for finished recordings that don't have one yet."""
+    for log in read_logs():
+        video_filename = log.get('video_filename')
+        if log.get('status') != STATUS_RUNNING and video_filename and \
+                os.path.exists(os.path.join(LOGS_DIR, video_filename)):
+            proxy_transcoder.submit(video_filename)
+
+def normalize_status(status):
+    """Accepts a status name from the API and returns the stored name."""
+    return status if status in STATUS_CODES else 'Fail'
+
+
+def parse_test_params(data):
+    """Validates a test start payload. Returns (params, error)."""
+    if not data or not data.get('sample_code'):
+        return None, 'sample_code is required'
+    try:
+        duration = int(data.get('duration'))
+    except (TypeError, ValueError):
+        return None, 'duration must be a number of seconds'
+    recording_mode = data.get('recording_mode', 'full')
+    if recording_mode not in ('full', 'timelapse'):
+        return None, f"Unknown recording mode '{recording_mode}'"
+    params = {'sample_code': data['sample_code'], 'duration': duration, 'recording_mode': recording_mode,
+              'overlay': bool(data.get('overlay', False))}
+    if recording_mode == 'timelapse':
+        try:
+            params['timelapse_interval'] = float(data.get('timelapse_interval', 5))
+        except (TypeError, ValueError):
+            return None, 'timelapse_interval must be a number of seconds'
+        if not math.isfinite(params['timelapse_interval']):
+            return None, 'timelapse_interval must be a number of seconds'
+        if params['timelapse_interval'] < MIN_INTERVAL_SECONDS:
+            return None, f'Time-lapse interval must be at least {MIN_INTERVAL_SECONDS}s'
+    return params, None
+
+def start_test_internally(params, queued_at=None):
+    """Starts a test from validated parameters. Returns the new log entry,
+    or None if a test is already running."""
+    with lock:
+        return _start_test_locked(params, queued_at)
+
+def _start_test_locked(params, queued_at=None):
+    """start_test_internally() with `lock` already held, so checking that
+    the rig is idle and registering the new test can't interleave with
+    another start or with a stop that is still winding down."""
+    if active_tests:
+        return None
+
+    duration = params['duration']
+    sample_code = params['sample_code']
+    recording_mode = params['recording_mode']
+    timelapse_interval = params.get('timelapse_interval')
     log_id = int(time.time() * 1000)
     # Generate a filename-safe timestamp and sample code
     now = datetime.datetime.now(IST)
@@ -123,21 +296,51 @@ def start_test():
     
     new_log = {
         'id': log_id,
-        'time': datetime.datetime.now(IST).isoformat(),
-        'sample_code': data.get('sample_code'),
+        'start_ms': log_id,
+        'sample_code': sample_code,
         'duration': duration,
-        'status': 'Running',
-        'video_filename': video_filename
+        'status': STATUS_RUNNING,
+        'video_filename': video_filename,
+        'recording_mode': recording_mode
     }
+    if recording_mode == 'timelapse':
+        new_log['timelapse_interval'] = timelapse_interval
+    else:
+        new_log['segment_index'] = os.path.basename(segment_index_path(video_path))
+    new_log['telemetry_filename'] = os.path.basename(telemetry_path_for(video_path))
+    if ir_monitor.edges is not None:
+        new_log['ir_signal_filename'] = os.path.basename(ir_signal_path_for(video_path))
+    if queued_at is not None:
+        new_log['queued_at'] = queued_at
+        new_log['queue_wait_seconds'] = round(log_id / 1000 - queued_at / 1000, 1)
 
     def handle_inactivity():
         print(f"Inactivity detected, stopping test {log_id}.")
         stop_test_internally(log_id, 'Fail', reason='Weight Fallen Down!')
 
+    def handle_finalized(integrity):
+        record_integrity(log_id, integrity)
+        try:
+            load_index(video_path)
+        except (OSError, ValueError) as e:
+            print(f"Could not build keyframe index for {video_filename}: {e}")
+        proxy_transcoder.submit(video_filename)
+
     camera = get_camera_instance()
+    if params.get('overlay'):
+        new_log['overlay'] = True
+        camera.set_overlay(sample_code, log_id / 1000)
     stop_event = threading.Event()
-    recording_thread = threading.Thread(target=camera.start_recording, args=(video_path, stop_event))
+    if recording_mode == 'timelapse':
+        keep_tail_event = threading.Event()
+        recording_thread = threading.Thread(target=camera.start_timelapse, name='recording',
+                                            args=(video_path, stop_event, timelapse_interval, keep_tail_event),
+                                            kwargs={'on_finalized': handle_finalized})
+    else:
+        recording_thread = threading.Thread(target=camera.start_recording, name='recording',
+                                            args=(video_path, stop_event), kwargs={'on_finalized': handle_finalized})
     timer = threading.Timer(duration, stop_test_internally, args=[log_id, 'Pass'])
+    timer.name = 'test-timer'
 
     active_tests[log_id] = {
         'recording_thread': recording_thread,
@@ -145,21 +348,86 @@ def start_test():
         'timer': timer,
         'log': new_log
     }
+    if recording_mode == 'timelapse':
+        active_tests[log_id]['keep_tail_event'] = keep_tail_event
 
     logs = read_logs()
     logs.insert(0, new_log)
     write_logs(logs)
 
+    active_tests[log_id]['telemetry'] = TelemetryRecorder(video_path, ir_state=lambda: ir_monitor.last_state).start()
+    if ir_monitor.edges is not None:
+        active_tests[log_id]['ir_signal'] = IRSignalRecorder(video_path, ir_monitor.edges).start()
     recording_thread.start()
     timer.start()
     ir_monitor.start_monitoring(callback=handle_inactivity)
+    return new_log
+
+def start_next_queued_test():
+    """Starts the test at the head of the queue if the rig is idle. While
+    the camera or IR sensor is warming up the queue waits; warm-up calls
+    this again."""
+    if get_camera_instance() is None or ir_sensor_state() != READY:
+        return
+    with lock:
+        if active_tests:
+            return
+        entry = test_queue.pop_next()
+        if entry is None:
+            return
+        print(f"Starting queued test {entry['sample_code']} (queue id {entry['id']}).")
+        _start_test_locked(entry, queued_at=entry['queued_at'])
+
+
+# Build the search index, and seed a new change feed, from the existing history.
+_existing_logs = read_logs()
+_existing_ids = [log.get('id') for log in _existing_logs]
+_existing_serialized = [dumps_entry(log) for log in _existing_logs]
+search_index.record(_existing_ids, _existing_serialized, _existing_logs)
+if change_feed.seq == 0 and _existing_logs:
+    change_feed.record(_existing_ids, _existing_serialized)
+del _existing_logs, _existing_ids, _existing_serialized
 
-    return jsonify({'status': 'Test started', 'log': new_log})
+
+def camera_unavailable():
+    """503 response for requests that need the camera while it is warming
+    up or failed to start."""
+    state = camera_state()
+    message = 'Camera is still warming up.' if state == 'starting' else 'Camera is not available.'
+    return jsonify({'status': message, 'camera': state}), 503, {'Retry-After': '2'}
+
+def ir_sensor_state():
+    """The IR sensor's warm-up state; ready if warm-up doesn't manage it."""
+    device = warmup.devices.get('ir_sensor')
+    return device.state if device is not None else READY
+
+def ir_sensor_unavailable():
+    """503 response for test starts before the IR sensor pin is set up, or
+    after setting it up failed."""
+    state = ir_sensor_state()
+    message = 'IR sensor is still warming up.' if state in (PENDING, STARTING) else 'IR sensor is not available.'
+    return jsonify({'status': message, 'ir_sensor': state}), 503, {'Retry-After': '2'}
+
+
+# --- API Routes ---
+@api.route('/test/start', methods=['POST'])
+def start_test():
+    params, error = parse_test_params(request.get_json())
+    if error:
+        return jsonify({'status': error}), 400
+    if get_camera_instance() is None:
+        return camera_unavailable()
+    if ir_sensor_state() != READY:
+        return ir_sensor_unavailable()
+    new_log = start_test_internally(params)
+    if new_log is None:
+        return jsonify({'status': 'An existing test is already running'}), 409
+    return jsonify({'status': 'Test started', 'log': to_api(new_log)})
 
 @api.route('/test/stop', methods=['POST'])
 def stop_test():
     data = request.get_json()
-    stop_test_internally(data.get('id'), data.get('status', 'Fail'))
+    stop_test_internally(data.get('id'), normalize_status(data.get('status', 'Fail')))
     return jsonify({'status': 'Test stopped'})
 
 @api.route('/test/status', methods=['GET'])
@@ -167,42 +435,268 @@ def get_test_status():
     with lock:
         if not active_tests:
             return jsonify({'running': False})
-        log_info = next(iter(active_tests.values()))['log']
-        return jsonify({'running': True, 'log': log_info})
+        test_info = next(iter(active_tests.values()))
+        status = {'running': True, 'log': to_api(test_info['log'])}
+        if 'ir_signal' in test_info:
+            status['ir_signal'] = test_info['ir_signal'].status()
+        return jsonify(status)
+
+@api.route('/queue', methods=['GET'])
+def get_queue():
+    """Lists pending tests in run order with how long each has waited."""
+    now_ms = int(time.time() * 1000)
+    entries = test_queue.list()
+    for position, entry in enumerate(entries):
+        entry['position'] = position
+        entry['waiting_seconds'] = round((now_ms - entry['queued_at']) / 1000, 1)
+    return jsonify(entries)
+
+@api.route('/queue', methods=['POST'])
+def enqueue_test():
+    """Queues a test; it starts immediately if the rig is idle."""
+    params, error = parse_test_params(request.get_json())
+    if error:
+        return jsonify({'status': error}), 400
+    entry = test_queue.add(params)
+    start_next_queued_test()
+    return jsonify({'status': 'Test queued', 'entry': entry})
+
+@api.route('/queue/<int:entry_id>', methods=['DELETE'])
+def cancel_queued_test(entry_id):
+    if not test_queue.remove(entry_id):
+        return jsonify({'status': 'Queued test not found'}), 404
+    return jsonify({'status': 'Queued test cancelled'})
+
+@api.route('/queue/order', methods=['POST'])
+def reorder_queue():
+    """Moves the listed queue ids to the front, in the given order."""
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return jsonify({'status': 'ids must be a list of queue ids'}), 400
+    unknown = test_queue.reorder(ids)
+    if unknown:
+        return jsonify({'status': 'Queued test not found', 'ids': unknown}), 404
+    return jsonify({'status': 'Queue reordered', 'queue': test_queue.list()})
+
+@api.route('/changes')
+def get_changes():
+    """Log entries created, updated or deleted after ?since=<cursor>, in
+    compact schema form, for replicating history to a central server."""
+    since = request.args.get('since', 0, type=int)
+    limit = min(request.args.get('limit', 500, type=int), 5000)
+    return Response(change_feed.changes(since, limit), mimetype='application/json')
 
 @api.route('/test/logs', methods=['GET'])
 def get_logs():
-    return jsonify(read_logs())
+    return jsonify([to_api(log) for log in read_logs()])
+
+def parse_time_param(value):
+    """Accepts epoch milliseconds or an ISO date/time (IST if no zone is given)."""
+    if value is None or value == '':
+        return None
+    if value.isdigit():
+        return int(value)
+    return iso_to_ms(value)
+
+def parse_search_filter(args):
+    """Reads q, prefix, from, to and status (as used by /test/logs/search)
+    from a dict-like. Returns (search keyword arguments, error)."""
+    try:
+        start_ms = parse_time_param(args.get('from'))
+        end_ms = parse_time_param(args.get('to'))
+    except (ValueError, AttributeError):
+        return None, 'from and to must be epoch milliseconds or ISO dates'
+    status = None
+    if args.get('status'):
+        names = args['status'].split(',')
+        unknown = [name for name in names if name not in STATUS_CODES]
+        if unknown:
+            return None, f"Unknown status {', '.join(unknown)}"
+        status = {STATUS_CODES[name] for name in names}
+    return {'sample_code': str(args.get('q') or '').strip(), 'prefix': str(args.get('prefix')) in ('1', 'true', 'True'),
+            'start_ms': start_ms, 'end_ms': end_ms, 'status': status}, None
+
+@api.route('/test/logs/search')
+def search_logs():
+    """Searches the log by sample code (?q=, substring, or prefix with
+    ?prefix=1), start time (?from=, ?to=) and ?status=Pass,Fail, newest first."""
+    started = time.perf_counter()
+    search, error = parse_search_filter(request.args)
+    if error:
+        return jsonify({'status': error}), 400
+    limit = max(1, min(request.args.get('limit', DEFAULT_LIMIT, type=int), MAX_LIMIT))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    total, logs = search_index.search(**search, limit=limit, offset=offset)
+    return jsonify({
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'logs': [to_api(log) for log in logs],
+        'took_ms': round((time.perf_counter() - started) * 1000, 2)
+    })
+
+def clip_paths_for(video_path):
+    """Cached clips cut from a video."""
+    prefix = os.path.splitext(os.path.basename(video_path))[0] + '.clip_'
+    try:
+        return [os.path.join(CLIPS_DIR, name) for name in os.listdir(CLIPS_DIR) if name.startswith(prefix)]
+    except FileNotFoundError:
+        return []
+
+def log_clip_paths(log):
+    """Cached clips of a log entry's video and time-lapse tail."""
+    if not log.get('video_filename'):
+        return []
+    video_path = os.path.join(LOGS_DIR, log['video_filename'])
+    return clip_paths_for(video_path) + clip_paths_for(tail_path_for(video_path))
+
+def video_files_for(video_filename):
+    """The video and every file derived from it."""
+    video_path = os.path.join(LOGS_DIR, video_filename)
+    tail_path = tail_path_for(video_path)
+    return [video_path, segment_index_path(video_path), tail_path, proxy_path_for(video_path),
+            index_path_for(video_path), index_path_for(tail_path)] + clip_paths_for(video_path) + clip_paths_for(tail_path)
+
+def _unlink_files(job):
+    for path in job['paths']:
+        try:
+            os.remove(path)
+            job['removed'] += 1
+        except FileNotFoundError:
+            job['missing'] += 1
+        except OSError as e:
+            job['errors'].append({'file': os.path.basename(path), 'error': str(e)})
+    del job['paths']
+    job['done'] = True
+    print(f"Batch {job['id']}: removed {job['removed']} files, {job['missing']} already gone, "
+          f"{len(job['errors'])} errors.")
+
+@api.route('/test/logs/batch', methods=['POST'])
+def batch_logs():
+    """Applies one action to many log entries, chosen by `ids` or by a search
+    `filter`: delete_log, delete_video or set_status. The log is rewritten
+    once; files are unlinked afterwards in the background."""
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action not in BATCH_ACTIONS:
+        return jsonify({'status': f"action must be one of {', '.join(BATCH_ACTIONS)}"}), 400
+    new_status = data.get('status')
+    if action == 'set_status' and new_status not in ('Pass', 'Fail'):
+        return jsonify({'status': 'set_status needs status Pass or Fail'}), 400
+
+    if 'ids' in data:
+        if not isinstance(data['ids'], list) or not all(isinstance(i, int) for i in data['ids']):
+            return jsonify({'status': 'ids must be a list of log ids'}), 400
+        ids = list(dict.fromkeys(data['ids']))
+    elif isinstance(data.get('filter'), dict) and data['filter']:
+        criteria = dict(data['filter'])
+        if isinstance(criteria.get('status'), list):
+            criteria['status'] = ','.join(map(str, criteria['status']))
+        search, error = parse_search_filter(criteria)
+        if error:
+            return jsonify({'status': error}), 400
+        _, matches = search_index.search(**search, limit=MAX_BATCH_ITEMS + 1)
+        ids = [log['id'] for log in matches]
+    else:
+        return jsonify({'status': 'Give either ids or a non-empty filter'}), 400
+    if len(ids) > MAX_BATCH_ITEMS:
+        return jsonify({'status': f'At most {MAX_BATCH_ITEMS} entries per batch'}), 400
+
+    results = []
+    paths = []
+    with lock:
+        logs = read_logs()
+        by_id = {log.get('id'): log for log in logs}
+        deleted = set()
+        for log_id in ids:
+            log = by_id.get(log_id)
+            if log is None:
+                results.append({'id': log_id, 'result': 'not_found'})
+            elif log['status'] == STATUS_RUNNING or log_id in active_tests:
+                results.append({'id': log_id, 'result': 'running'})
+            elif action == 'delete_log':
+                deleted.add(log_id)
+                for key in ('telemetry_filename', 'ir_signal_filename'):
+                    if log.get(key):
+                        paths.append(os.path.join(LOGS_DIR, log[key]))
+                paths.extend(log_clip_paths(log))
+                results.append({'id': log_id, 'result': 'deleted'})
+            elif action == 'delete_video':
+                if not log.get('video_filename'):
+                    results.append({'id': log_id, 'result': 'no_video'})
+                    continue
+                paths.extend(video_files_for(log['video_filename']))
+                log['video_filename'] = None
+                results.append({'id': log_id, 'result': 'video_deleted'})
+            elif log['status'] == STATUS_CODES[new_status]:
+                results.append({'id': log_id, 'result': 'unchanged'})
+            else:
+                log['status'] = STATUS_CODES[new_status]
+                results.append({'id': log_id, 'result': 'updated'})
+        changed = any(result['result'] in ('deleted', 'video_deleted', 'updated') for result in results)
+        if changed:
+            write_logs([log for log in logs if log.get('id') not in deleted])
+
+        job = None
+        if paths:
+            job = {'id': next(_batch_ids), 'paths': paths, 'files': len(paths), 'removed': 0, 'missing': 0,
+                   'errors': [], 'done': False}
+            batch_jobs[job['id']] = job
+            finished = [i for i, old in batch_jobs.items() if old['done']]
+            for old_id in finished[:max(0, len(batch_jobs) - MAX_BATCH_JOBS)]:
+                del batch_jobs[old_id]
+    if job is not None:
+        threading.Thread(target=_unlink_files, args=(job,), name='batch-unlink', daemon=True).start()
+    counts = {}
+    for result in results:
+        counts[result['result']] = counts.get(result['result'], 0) + 1
+    return jsonify({'status': 'Batch applied', 'action': action, 'counts': counts, 'results': results,
+                    'unlink_job': job['id'] if job else None})
+
+@api.route('/test/logs/batch/<int:job_id>')
+def batch_unlink_status(job_id):
+    """Progress of a batch's background file removal."""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({'status': 'Batch job not found'}), 404
+    status = job.copy()
+    status.pop('paths', None)
+    return jsonify(status)
 
 @api.route('/test/logs/log/<int:log_id>', methods=['DELETE'])
 def delete_log_entry(log_id):
-    logs = read_logs()
-    log_exists = any(l.get('id') == log_id for l in logs)
-    if not log_exists:
-        return jsonify({'status': 'Log not found'}), 404
-
-    updated_logs = [l for l in logs if l.get('id') != log_id]
-    write_logs(updated_logs)
+    with lock:
+        logs = read_logs()
+        log_data = next((l for l in logs if l.get('id') == log_id), None)
+        if log_data is None:
+            return jsonify({'status': 'Log not found'}), 404
+        write_logs([l for l in logs if l.get('id') != log_id])
+    for filename in (log_data.get('telemetry_filename'), log_data.get('ir_signal_filename')):
+        if filename and os.path.exists(os.path.join(LOGS_DIR, filename)):
+            os.remove(os.path.join(LOGS_DIR, filename))
+    for path in log_clip_paths(log_data):
+        if os.path.exists(path):
+            os.remove(path)
     return jsonify({'status': 'Log entry deleted'})
 
 @api.route('/test/logs/video/<int:log_id>', methods=['DELETE'])
 def delete_video(log_id):
-    logs = read_logs()
-    log_to_update = next((l for l in logs if l.get('id') == log_id), None)
-    if not log_to_update:
-        return jsonify({'status': 'Log not found'}), 404
-
-    video_filename = log_to_update.get('video_filename')
-    if video_filename:
-        video_path = os.path.join(LOGS_DIR, video_filename)
-        if os.path.exists(video_path):
-            os.remove(video_path)
-
+    with lock:
+        logs = read_logs()
+        log_to_update = next((l for l in logs if l.get('id') == log_id), None)
+        if not log_to_update:
+            return jsonify({'status': 'Log not found'}), 404
+        video_filename = log_to_update.get('video_filename')
+        if not video_filename:
+            return jsonify({'status': 'No video found for this log'}), 404
         log_to_update['video_filename'] = None
         write_logs(logs)
-        return jsonify({'status': 'Video deleted'})
-    else:
-        return jsonify({'status': 'No video found for this log'}), 404
+
+    for path in video_files_for(video_filename):
+        if os.path.exists(path):
+            os.remove(path)
+    return jsonify({'status': 'Video deleted'})
 
 
 @api.route('/test/logs/download/<int:log_id>')
@@ -215,12 +709,8 @@ def download_log_txt(log_id):
     log_string = "Test Log Details\n==================\n"
 
     # Time
-    time_str = log_data.get('time')
-    if time_str:
-        try:
-            time_str = datetime.datetime.fromisoformat(time_str).strftime("%Y-%m-%d %H:%M:%S")
-        except (ValueError, TypeError):
-            pass # keep original
+    start_dt = ms_to_datetime(log_data['start_ms']) if log_data.get('start_ms') is not None else None
+    time_str = start_dt.strftime("%Y-%m-%d %H:%M:%S") if start_dt else None
     log_string += f"Time: {time_str or 'N/A'}\n"
 
     # Sample Code
@@ -235,15 +725,9 @@ def download_log_txt(log_id):
         log_string += "  Set Duration: N/A\n"
 
     # Actual Duration (if applicable)
-    status = log_data.get('status')
-    if status == 'Fail' and log_data.get('time') and log_data.get('end_time'):
-        try:
-            start_dt = datetime.datetime.fromisoformat(log_data['time'])
-            end_dt = datetime.datetime.fromisoformat(log_data['end_time'])
-            actual_duration_seconds = int((end_dt - start_dt).total_seconds())
-            log_string += f"  Actual Duration: {format_duration(actual_duration_seconds)}\n"
-        except (ValueError, TypeError):
-            pass
+    status = STATUS_NAMES.get(log_data.get('status'))
+    if status == 'Fail' and log_data.get('actual_duration') is not None:
+        log_string += f"  Actual Duration: {format_duration(log_data['actual_duration'])}\n"
     
     # Status
     log_string += f"Status: {status or 'N/A'}\n"
@@ -252,24 +736,13 @@ def download_log_txt(log_id):
         log_string += f"Failure Reason: {log_data['failure_reason']}\n"
 
     # End Time
-    end_time_str = log_data.get('end_time')
-    if end_time_str:
-        try:
-            end_time_str = datetime.datetime.fromisoformat(end_time_str).strftime("%Y-%m-%d %H:%M:%S")
-        except (ValueError, TypeError):
-            pass # keep original
+    if log_data.get('end_ms') is not None:
+        end_time_str = ms_to_datetime(log_data['end_ms']).strftime("%Y-%m-%d %H:%M:%S")
         log_string += f"End Time: {end_time_str}\n"
 
     sample_code = log_data.get('sample_code', 'UnknownSample')
-    time_str = log_data.get('time', '')
     safe_sample_code = re.sub(r'[^a-zA-Z0-9_.-]', '_', sample_code)
-    safe_time = ''
-    if time_str:
-        try:
-            dt_obj = datetime.datetime.fromisoformat(time_str)
-            safe_time = dt_obj.strftime("%Y%m%d_%H%M%S")
-        except ValueError:
-             safe_time = time_str.replace(':', '-').replace(' ', '_')
+    safe_time = start_dt.strftime("%Y%m%d_%H%M%S") if start_dt else ''
 
     download_filename = f"log_{safe_sample_code}_{safe_time}.txt"
 
@@ -295,12 +768,227 @@ def download_video(log_id):
     if not os.path.exists(video_path):
         return jsonify({'status': 'Video file not found'}), 404
 
-    return send_file(video_path, as_attachment=True)
+    return bandwidth.wrap(send_file(video_path, as_attachment=True), video_filename, request.remote_addr)
+
+
+@api.route('/test/logs/telemetry/<int:log_id>')
+def download_telemetry(log_id):
+    """Serves a test's telemetry series: the compact binary file by default,
+    or parsed with ?format=json."""
+    logs = read_logs()
+    log_data = next((l for l in logs if l.get('id') == log_id), None)
+    if not log_data:
+        return jsonify({'status': 'Log not found'}), 404
+    telemetry_filename = log_data.get('telemetry_filename')
+    telemetry_path = os.path.join(LOGS_DIR, telemetry_filename) if telemetry_filename else None
+    if not telemetry_path or not os.path.exists(telemetry_path):
+        return jsonify({'status': 'No telemetry recorded for this test'}), 404
+    if request.args.get('format') == 'json':
+        return jsonify(read_telemetry(telemetry_path))
+    return send_file(telemetry_path, mimetype='application/octet-stream', max_age=0)
+
+
+@api.route('/test/logs/ir_signal/<int:log_id>')
+def download_ir_signal(log_id):
+    """Serves a test's IR transition frequency and jitter series and its
+    raw edges: the binary file by default, or parsed with ?format=json."""
+    logs = read_logs()
+    log_data = next((l for l in logs if l.get('id') == log_id), None)
+    if not log_data:
+        return jsonify({'status': 'Log not found'}), 404
+    ir_signal_filename = log_data.get('ir_signal_filename')
+    ir_signal_path = os.path.join(LOGS_DIR, ir_signal_filename) if ir_signal_filename else None
+    if not ir_signal_path or not os.path.exists(ir_signal_path):
+        return jsonify({'status': 'No IR signal recorded for this test'}), 404
+    if request.args.get('format') == 'json':
+        return jsonify(read_ir_signal(ir_signal_path))
+    return send_file(ir_signal_path, mimetype='application/octet-stream', max_age=0)
+
+
+@api.route('/test/logs/verify/<int:log_id>')
+def verify_video(log_id):
+    """Re-hashes a test's video and compares it with the hash recorded when
+    it was written."""
+    logs = read_logs()
+    log_data = next((l for l in logs if l.get('id') == log_id), None)
+    if not log_data:
+        return jsonify({'status': 'Log not found'}), 404
+    video_filename = log_data.get('video_filename')
+    if not video_filename:
+        return jsonify({'status': 'Video not found for this log'}), 404
+    video_path = os.path.join(LOGS_DIR, video_filename)
+    if not os.path.exists(video_path):
+        return jsonify({'status': 'Video file not found'}), 404
+
+    integrity = log_data.get('integrity')
+    index_path = segment_index_path(video_path)
+    if not integrity and os.path.exists(index_path):
+        # Finalized by crash recovery, so the hashes are only in the index.
+        integrity = SegmentIndex.load(index_path).integrity()
+    expected = integrity.get('video_sha256') if integrity else None
+    if not expected:
+        return jsonify({'status': 'No hash recorded for this video'}), 404
+
+    actual, seconds = sha256_file(video_path)
+    return jsonify({
+        'status': 'Verified' if actual == expected else 'Mismatch',
+        'verified': actual == expected,
+        'expected_sha256': expected,
+        'actual_sha256': actual,
+        'hash_seconds': round(seconds, 3),
+        'integrity': integrity
+    })
+
+
+def evict_clips(max_bytes=CLIP_CACHE_MAX_BYTES, max_age=CLIP_MAX_AGE_SECONDS):
+    """Deletes cached clips unused for `max_age` seconds, then the least
+    recently used until the cache fits in `max_bytes`."""
+    clips = []
+    for name in os.listdir(CLIPS_DIR):
+        path = os.path.join(CLIPS_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        clips.append((stat.st_mtime, stat.st_size, path))
+    clips.sort()
+    total = sum(size for _, size, _ in clips)
+    cutoff = time.time() - max_age
+    while clips and (total > max_bytes or clips[0][0] < cutoff):
+        _, size, path = clips.pop(0)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        print(f"Evicted clip {os.path.basename(path)}")
+
+@api.route('/test/logs/clip/<int:log_id>')
+def download_clip(log_id):
+    """Cuts a clip around the end of a test without re-encoding.
+
+    ?before=10&after=5 selects a window around the end of the recording;
+    ?start=&end= select one in seconds from the start of the video. The start
+    is snapped back to the previous keyframe and the clip is cached."""
+    logs = read_logs()
+    log_data = next((l for l in logs if l.get('id') == log_id), None)
+    if not log_data:
+        return jsonify({'status': 'Log not found'}), 404
+    video_filename = log_data.get('video_filename')
+    if log_data.get('recording_mode') == 'timelapse':
+        # The full-rate footage of a time-lapse test is its failure clip.
+        video_filename = log_data.get('tail_video_filename')
+    if not video_filename:
+        return jsonify({'status': 'Video not found for this log'}), 404
+    video_path = os.path.join(LOGS_DIR, video_filename)
+    if not os.path.exists(video_path):
+        return jsonify({'status': 'Video file not found'}), 404
+
+    try:
+        index = load_index(video_path)
+    except (OSError, ValueError) as e:
+        return jsonify({'status': f'Could not index video: {e}'}), 500
+
+    duration = index['duration']
+    if 'start' in request.args or 'end' in request.args:
+        start = request.args.get('start', 0.0, type=float)
+        end = request.args.get('end', duration, type=float)
+    else:
+        anchor = min(log_data.get('actual_duration', duration), duration)
+        start = anchor - request.args.get('before', 10.0, type=float)
+        end = anchor + request.args.get('after', 5.0, type=float)
+    start = snap_to_keyframe(index, max(start, 0.0))
+    end = min(end, duration)
+    if end <= start:
+        return jsonify({'status': 'Empty clip window'}), 400
+
+    base = os.path.splitext(video_filename)[0]
+    clip_filename = f"{base}.clip_{int(start * 1000)}_{int(end * 1000)}.mp4"
+    clip_path = os.path.join(CLIPS_DIR, clip_filename)
+    if os.path.exists(clip_path):
+        # Marks the clip as recently used for eviction.
+        os.utime(clip_path)
+    else:
+        os.makedirs(CLIPS_DIR, exist_ok=True)
+        evict_clips()
+        tmp_path = clip_path + '.tmp.mp4'
+        ok, stderr = cut_clip(video_path, tmp_path, start, end - start)
+        if not ok:
+            print(f"ffmpeg error cutting clip {clip_filename}: {stderr}")
+            return jsonify({'status': 'Clip extraction failed'}), 500
+        os.replace(tmp_path, clip_path)
+    return bandwidth.wrap(send_file(clip_path, as_attachment=True), clip_filename, request.remote_addr)
 
 
 @api.route('/camera/feed')
 def camera_feed():
-    return Response(get_camera_instance().video_feed(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    instance = get_camera_instance()
+    if not instance:
+        return camera_unavailable()
+    return Response(instance.video_feed(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@api.route('/camera/live')
+def camera_live():
+    """H.264 live view as fragmented MP4, for Media Source Extensions."""
+    instance = get_camera_instance()
+    if not instance:
+        return camera_unavailable()
+    return Response(instance.live_view(), mimetype='video/mp4', headers={'Cache-Control': 'no-cache'})
+
+@api.route('/camera/live/clock')
+def camera_live_clock():
+    """Server wall-clock time, so a page can correct for clock offset when it
+    measures live-view latency."""
+    return jsonify({'time_ms': time.time() * 1000})
+
+@api.route('/camera/live/latency', methods=['POST'])
+def camera_live_latency():
+    """Records the glass-to-browser latency a live-view page measured."""
+    data = request.get_json(silent=True) or {}
+    latency_ms = data.get('latency_ms')
+    if not isinstance(latency_ms, (int, float)) or not 0 <= latency_ms < 60000:
+        return jsonify({'status': 'latency_ms must be a number of milliseconds.'}), 400
+    live_latency_seconds.observe(latency_ms / 1000)
+    return jsonify({'status': 'ok'})
+
+@api.route('/camera/snapshot')
+def camera_snapshot():
+    """Returns the newest live-feed JPEG without opening a stream."""
+    instance = get_camera_instance()
+    if not instance:
+        return camera_unavailable()
+    snapshot = instance.snapshot()
+    if snapshot is None:
+        return jsonify({'status': 'No frame available yet.'}), 503
+    data, sequence, age = snapshot
+    etag = f'"{sequence}"'
+    headers = {
+        'ETag': etag,
+        'X-Frame-Age-Ms': str(int(age * 1000)),
+        'Cache-Control': 'no-cache'
+    }
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers=headers)
+    return Response(data, mimetype='image/jpeg', headers=headers)
+
+@api.route('/camera/health')
+def camera_health():
+    """Frame rate, dropped frames, bytes and write latency per encoder."""
+    instance = get_camera_instance()
+    if instance:
+        return jsonify(instance.health())
+    return camera_unavailable()
+
+@api.route('/bandwidth')
+def bandwidth_status():
+    """Achieved rate per priority class, the download limits in force and
+    the transfers in progress."""
+    return jsonify(bandwidth.status())
+
+@api.route('/camera/thermal')
+def camera_thermal():
+    """The thermal governor's level, the limits it applies and recent changes."""
+    return jsonify(thermal_governor.status())
 
 @api.route('/camera/release', methods=['POST'])
 def release_camera():
@@ -309,7 +997,7 @@ def release_camera():
     if instance:
         instance.release()
         return jsonify({'status': 'Camera feed stopped.'})
-    return jsonify({'status': 'Camera not initialized.'}), 500
+    return camera_unavailable()
     
 @api.route('/shutdown', methods=['POST'])
 def shutdown():
@@ -349,6 +1037,27 @@ def shutdown():
         return jsonify({"status": "error", "message": error_message}), 500
 
 
+@api.route('/admin/profile')
+def admin_profile():
+    """Samples all thread stacks for ?seconds=N and returns collapsed stacks
+    for flamegraph tools."""
+    if not is_admin_request():
+        return jsonify({'status': 'Forbidden'}), 403
+    seconds = request.args.get('seconds', 10, type=float)
+    interval_ms = request.args.get('interval_ms', 10, type=float)
+    profile = sample_stacks(seconds, interval=max(interval_ms, 1) / 1000)
+    if profile is None:
+        return jsonify({'status': 'A profile is already running'}), 409
+    return Response(profile, mimetype='text/plain')
+
+@api.route('/admin/threads')
+def admin_threads():
+    """Dumps the current stack of every named thread."""
+    if not is_admin_request():
+        return jsonify({'status': 'Forbidden'}), 403
+    return Response(dump_thread_stacks(), mimetype='text/plain')
+
+
 @api.route("/stats")
 def stats():
     global last_net_stats, last_time
@@ -382,3 +1091,71 @@ def stats():
         disk_used=disk.used, disk_total=disk.total, disk_usage=disk.percent,
         net_upload_speed=upload_speed, net_download_speed=download_speed
     )
+
+
+
+def metrics_text():
+    """Collects the app-wide Prometheus metrics. Nothing here blocks or
+    initializes hardware, so it is safe to scrape every few seconds."""
+    mem = psutil.virtual_memory()
+    disk = psutil.disk_usage('/')
+    net = psutil.net_io_counters()
+    camera = current_camera_instance()
+    samples = [
+        ('app_uptime_seconds', 'Seconds since the app started.', 'gauge', [({}, time.time() - start_time)]),
+        ('active_tests', 'Tests currently running.', 'gauge', [({}, len(active_tests))]),
+        ('queued_tests', 'Tests waiting in the queue.', 'gauge', [({}, len(test_queue.entries))]),
+        ('proxy_transcodes_queued', 'Proxy transcodes waiting to run.', 'gauge', [({}, proxy_transcoder.jobs.qsize())]),
+        ('proxy_transcoder_paused', 'Whether the proxy transcoder is paused for a recording or heat.', 'gauge',
+         [({}, proxy_transcoder.paused)]),
+        ('conversion_queue_depth', 'Video conversion jobs queued or running.', 'gauge', [({}, conversion.pending_count())]),
+        ('ir_sensor_monitoring', 'Whether the IR sensor is being monitored.', 'gauge',
+         [({}, bool(ir_monitor.monitor_thread and ir_monitor.monitor_thread.is_alive()))]),
+        ('ir_sensor_state', 'Last IR sensor input level read.', 'gauge', [({}, ir_monitor.last_state)]),
+        ('cpu_usage_percent', 'CPU usage since the previous scrape.', 'gauge', [({}, psutil.cpu_percent(interval=None))]),
+        ('cpu_temperature_celsius', 'CPU temperature.', 'gauge', [({}, get_cpu_temperature())]),
+        ('thermal_level', 'Thermal governor level (0 is normal, %d the most restricted).' % (len(LEVELS) - 1), 'gauge',
+         [({}, thermal_governor.level_index)]),
+        ('memory_used_bytes', 'Memory in use.', 'gauge', [({}, mem.used)]),
+        ('memory_total_bytes', 'Total memory.', 'gauge', [({}, mem.total)]),
+        ('disk_used_bytes', 'Disk space used on /.', 'gauge', [({}, disk.used)]),
+        ('disk_total_bytes', 'Disk size of /.', 'gauge', [({}, disk.total)]),
+        ('network_sent_bytes_total', 'Bytes sent on all interfaces.', 'counter', [({}, net.bytes_sent)]),
+        ('network_received_bytes_total', 'Bytes received on all interfaces.', 'counter', [({}, net.bytes_recv)]),
+    ]
+    if ir_monitor.edges is not None:
+        samples.append(('ir_sensor_edges_total', 'IR sensor edges captured.', 'counter', [({}, ir_monitor.edges.total)]))
+    extra_histograms = []
+    if camera:
+        encoders = (camera.stream_stats, camera.record_stats, camera.live.stats)
+        samples += [
+            ('mjpeg_viewers', 'Open live-feed MJPEG streams.', 'gauge', [({}, camera.viewers)]),
+            ('live_view_viewers', 'Open H.264 live-view streams.', 'gauge', [({}, len(camera.live.viewers))]),
+            ('camera_streaming', 'Whether the live-feed encoder is running.', 'gauge', [({}, camera.is_streaming)]),
+            ('camera_recording', 'Whether the recording encoder is running.', 'gauge', [({}, camera.is_recording)]),
+            ('encoder_frames_total', 'Frames written by each encoder since it last started.', 'counter',
+             [({'encoder': e.name}, e.frames) for e in encoders]),
+            ('encoder_bytes_total', 'Bytes written by each encoder since it last started.', 'counter',
+             [({'encoder': e.name}, e.bytes) for e in encoders]),
+            ('encoder_dropped_frames_total', 'Frames estimated dropped from timestamp gaps.', 'counter',
+             [({'encoder': e.name}, e.dropped_frames) for e in encoders]),
+        ]
+        buffer = camera.record_buffer
+        if buffer is not None:
+            samples += [
+                ('record_buffer_bytes', 'Recording bytes buffered in memory, not yet written.', 'gauge',
+                 [({}, buffer.buffered)]),
+                ('record_buffer_capacity_bytes', 'Size of the recording write-behind buffer.', 'gauge',
+                 [({}, buffer.capacity)]),
+                ('record_buffer_alarm', 'Whether the recording buffer is near capacity.', 'gauge', [({}, buffer.alarm)]),
+                ('record_buffer_alarms_total', 'Times the recording buffer neared capacity.', 'counter',
+                 [({}, buffer.alarms)]),
+                ('record_buffer_stalls_total', 'Times the encoder waited for room in the recording buffer.', 'counter',
+                 [({}, buffer.stalls)]),
+            ]
+        for e in encoders:
+            extra_histograms.append(('encoder_write_latency_milliseconds', 'Time to write one encoded frame to its output.',
+                                     {'encoder': e.name}, e.write_latency_ms))
+            extra_histograms.append(('encoder_frame_gap_milliseconds', 'Gap between consecutive frame timestamps.',
+                                     {'encoder': e.name}, e.frame_gap_ms))
+    return render_metrics(samples, extra_histograms)
@@ -0,0 +1,199 @@
+import os
+import time
+import itertools
+import threading
+
+# Bandwidth shaping for bulk file transfers (video, proxy and clip
+# downloads), so one big download can't starve the recording or the live
+# view of SD-card or network bandwidth.
+#
+# Traffic falls into three priority classes. Recording I/O comes first and
+# live view second; neither is ever throttled. Downloads share what's left.
+# While a test runs, the download budget is re-computed every second from the
+# storage budget minus the measured recording rate and the network budget
+# minus the measured live-view rate, keeping HEADROOM in reserve. Each
+# download is also capped per connection. With no test running, downloads
+# get the whole link.
+STORAGE_BUDGET_BPS = float(os.environ.get('BANDWIDTH_STORAGE_MBPS', 20)) * 1e6
+NETWORK_BUDGET_BPS = float(os.environ.get('BANDWIDTH_NETWORK_MBIT', 40)) * 1e6 / 8
+PER_CONNECTION_BPS = float(os.environ.get('BANDWIDTH_PER_CONNECTION_MBPS', 1)) * 1e6
+MIN_DOWNLOAD_BPS = 256 * 1024
+HEADROOM = 0.8
+# A nearly full recording buffer means storage is behind: downloads drop to
+# the minimum until it drains.
+RECORD_BUFFER_PRESSURE = 0.5
+ADJUST_SECONDS = 1.0
+BURST_SECONDS = 0.25
+RATE_SMOOTHING = 0.5
+CLASSES = ('recording', 'live', 'download')
+
+
+class TokenBucket:
+    """Rate limiter; a rate of None means unlimited. Callers may go into
+    debt and then sleep it off, so large chunks pass without starving."""
+    def __init__(self, rate=None):
+        self.lock = threading.Lock()
+        self.rate = None
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self.lock:
+            if rate != self.rate:
+                self.rate = rate
+                self.tokens = rate * BURST_SECONDS if rate else 0.0
+                self.last = time.monotonic()
+
+    def consume(self, amount):
+        """Takes `amount` bytes of budget, sleeping if there isn't enough.
+        Returns the time slept."""
+        with self.lock:
+            if not self.rate:
+                return 0.0
+            now = time.monotonic()
+            self.tokens = min(self.rate * BURST_SECONDS, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class CounterRate:
+    """Smoothed bytes/second from a cumulative byte counter that may reset."""
+    def __init__(self, read_total):
+        self.read_total = read_total
+        self.last_total = None
+        self.last_time = None
+        self.rate = 0.0
+
+    def sample(self):
+        try:
+            total = self.read_total() or 0
+        except Exception:
+            total = 0
+        now = time.monotonic()
+        if self.last_total is not None and now > self.last_time:
+            delta = total - self.last_total if total >= self.last_total else total
+            instant = delta / (now - self.last_time)
+            self.rate += (instant - self.rate) * RATE_SMOOTHING
+        self.last_total, self.last_time = total, now
+        return self.rate
+
+
+class Transfer:
+    def __init__(self, transfer_id, name, client, per_connection):
+        self.id = transfer_id
+        self.name = name
+        self.client = client
+        self.started = time.monotonic()
+        self.bytes = 0
+        self.throttled_seconds = 0.0
+        self.bucket = TokenBucket(per_connection)
+
+    def status(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            'id': self.id,
+            'name': self.name,
+            'client': self.client,
+            'bytes': self.bytes,
+            'elapsed_seconds': round(elapsed, 1),
+            'rate_bps': round(self.bytes / elapsed) if elapsed > 0 else 0,
+            'throttled_seconds': round(self.throttled_seconds, 2),
+            'limit_bps': self.bucket.rate
+        }
+
+
+class BandwidthShaper:
+    """Throttles bulk transfers around the higher-priority traffic.
+
+    `is_busy()` says whether a test is running. `sources` maps 'recording'
+    and 'live' to functions returning cumulative byte counts, and
+    `record_pressure()` returns how full the recording buffer is (0-1)."""
+    def __init__(self, is_busy, sources, record_pressure=lambda: 0.0):
+        self.is_busy = is_busy
+        self.record_pressure = record_pressure
+        self.lock = threading.Lock()
+        self.download_bytes = 0
+        self.meters = {name: CounterRate(read_total) for name, read_total in sources.items()}
+        self.meters['download'] = CounterRate(lambda: self.download_bytes)
+        self.bucket = TokenBucket()
+        self.per_connection = None
+        self.transfers = {}
+        self._ids = itertools.count(1)
+        self._last_adjust = 0.0
+        self.mode = 'idle'
+
+    def _adjust(self):
+        now = time.monotonic()
+        with self.lock:
+            if now - self._last_adjust < ADJUST_SECONDS:
+                return
+            self._last_adjust = now
+            rates = {name: meter.sample() for name, meter in self.meters.items()}
+            if not self.is_busy():
+                self.mode = 'idle'
+                limit = per_connection = None
+            elif self.record_pressure() >= RECORD_BUFFER_PRESSURE:
+                self.mode = 'storage-pressure'
+                limit = per_connection = MIN_DOWNLOAD_BPS
+            else:
+                self.mode = 'test-running'
+                storage_left = STORAGE_BUDGET_BPS - rates.get('recording', 0.0)
+                network_left = NETWORK_BUDGET_BPS - rates.get('live', 0.0)
+                limit = max(MIN_DOWNLOAD_BPS, HEADROOM * min(storage_left, network_left))
+                per_connection = min(limit, PER_CONNECTION_BPS)
+            self.per_connection = per_connection
+            transfers = list(self.transfers.values())
+        self.bucket.set_rate(limit)
+        for transfer in transfers:
+            transfer.bucket.set_rate(per_connection)
+
+    def shape(self, chunks, name, client=None):
+        """Yields `chunks` (an iterable of bytes) at the download rate."""
+        self._adjust()
+        with self.lock:
+            transfer = Transfer(next(self._ids), name, client, self.per_connection)
+            self.transfers[transfer.id] = transfer
+        try:
+            for chunk in chunks:
+                self._adjust()
+                transfer.throttled_seconds += transfer.bucket.consume(len(chunk)) + self.bucket.consume(len(chunk))
+                yield chunk
+                transfer.bytes += len(chunk)
+                with self.lock:
+                    self.download_bytes += len(chunk)
+        finally:
+            with self.lock:
+                self.transfers.pop(transfer.id, None)
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def wrap(self, response, name, client=None):
+        """Shapes a file response (from send_file or send_from_directory,
+        including range requests) in place and returns it."""
+        response.response = self.shape(response.response, name, client)
+        response.direct_passthrough = False
+        return response
+
+    def status(self):
+        self._adjust()
+        with self.lock:
+            rates = {name: meter.rate for name, meter in self.meters.items()}
+            transfers = [transfer.status() for transfer in self.transfers.values()]
+            mode = self.mode
+        return {
+            'mode': mode,
+            'classes': [
+                {'name': name, 'priority': priority, 'rate_bps': round(rates.get(name, 0.0)),
+                 'limit_bps': self.bucket.rate if name == 'download' else None}
+                for priority, name in enumerate(CLASSES, start=1)
+            ],
+            'per_connection_limit_bps': self.per_connection,
+            'budgets': {'storage_bps': STORAGE_BUDGET_BPS, 'network_bps': NETWORK_BUDGET_BPS},
+            'transfers': transfers
+        }
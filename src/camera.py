@@ -1,95 +1,118 @@
 
-import io
 import os
 import time
-import subprocess
-from threading import Condition, Lock, Thread
-from picamera2 import Picamera2
+from picamera2 import MappedArray
 from picamera2.encoders import JpegEncoder, H264Encoder
-from picamera2.outputs import FileOutput
-
-# --- FFmpeg Conversion Utility ---
-def _convert_h264_to_mp4(h264_file, mp4_file, delete_h264=True):
-    """Converts an H.264 file to MP4 using ffmpeg and runs in a background thread."""
-    def convert():
-        print(f"Starting conversion: {h264_file} -> {mp4_file}")
-        try:
-            command = [
-                'ffmpeg',
-                '-i', h264_file,
-                '-c:v', 'copy',  # Fast, no re-encoding
-                '-y',            # Overwrite if exists
-                mp4_file
-            ]
-            result = subprocess.run(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            if result.returncode == 0:
-                print(f"Successfully converted to {mp4_file}")
-                if delete_h264:
-                    os.remove(h264_file)
-                    print(f"Deleted temporary file {h264_file}")
-            else:
-                print(f"ffmpeg error converting {h264_file}: {result.stderr}")
-        except Exception as e:
-            print(f"Error during video conversion: {e}")
-
-    thread = Thread(target=convert)
-    thread.daemon = True
-    thread.start()
+from picamera2.outputs import FileOutput, CircularOutput, Output
+from src.capture import CaptureCamera
+from src.live_view import LIVE_BITRATE
+from src.write_behind import WriteBehindWriter
+from src.segments import SegmentIndex, SegmentWriter, SEGMENT_SECONDS
+from src.timelapse import frames_dir_for, finalize_timelapse, finalize_tail, TAIL_SECONDS, FRAME_PATTERN
+
+# --- Instrumented Outputs ---
+class InstrumentedFileOutput(FileOutput):
+    """A FileOutput that records frame, byte, gap and write-latency
+    statistics for the encoder feeding it."""
+    def __init__(self, file=None, stats=None):
+        self.stats = stats
+        super().__init__(file)
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, *args, **kwargs):
+        started = time.perf_counter()
+        super().outputframe(frame, keyframe, timestamp, *args, **kwargs)
+        if self.stats is not None:
+            self.stats.record(len(frame), keyframe, timestamp, time.perf_counter() - started)
+
+
+class SegmentedFileOutput(InstrumentedFileOutput):
+    """Writes the hardware encoder's output through a SegmentWriter, rolling
+    to a new segment file on the first keyframe after each interval."""
+    def __init__(self, segment_index, segment_seconds=SEGMENT_SECONDS, stats=None, writer=None):
+        self.segments = SegmentWriter(segment_index, segment_seconds, writer=writer)
+        super().__init__(self.segments.file, stats=stats)
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, *args, **kwargs):
+        if self.segments.roll(keyframe):
+            self.fileoutput = self.segments.file
+        super().outputframe(frame, keyframe, timestamp, *args, **kwargs)
+
+    def close_segment(self):
+        self.segments.close_segment()
+
+
+class LiveViewOutput(Output):
+    """Hands the live encoder's access units to the LiveView muxer."""
+    def __init__(self, live):
+        super().__init__()
+        self.live = live
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, *args, **kwargs):
+        self.live.write_unit(frame, keyframe, timestamp)
+
+
+class ThrottledJpegEncoder(JpegEncoder):
+    """A JpegEncoder that can be capped to a maximum frame rate. Frames over
+    the cap are skipped before they are encoded, which is what saves CPU."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_interval = 0.0
+        self._last_encoded = 0.0
+
+    def encode(self, stream, request):
+        now = time.monotonic()
+        # 10% slack so a cap at half the camera rate doesn't drop to a third.
+        if now - self._last_encoded < 0.9 * self.min_interval:
+            return
+        self._last_encoded = now
+        super().encode(stream, request)
 
 
 # --- Camera Streaming and Control ---
-class StreamingOutput(io.BufferedIOBase):
-    """A thread-safe, in-memory stream for the camera encoder."""
-    def __init__(self):
-        self.frame = None
-        self.condition = Condition()
-
-    def write(self, buf):
-        with self.condition:
-            self.frame = buf
-            self.condition.notify_all()
-
-class Camera:
-    """A singleton-managed class to control the PiCamera, providing both a
+class Camera(CaptureCamera):
+    """Controls the PiCamera through its hardware encoders, providing both a
     live MJPEG stream and H.264 video recording with background MP4 conversion."""
-    def __init__(self, width=1280, height=720):
-        self.picam2 = Picamera2()
-        self.config = self.picam2.create_video_configuration(
-            main={"size": (width, height)},
-            lores={"size": (640, 480), "format": "YUV420"}, 
-            encode="main"
-        )
-        self.picam2.configure(self.config)
-
-        self.streaming_output = StreamingOutput()
-        self.stream_encoder = JpegEncoder()
-        self.record_encoder = H264Encoder(bitrate=10000000)
-        self.is_streaming = False
-        self.is_recording = False
+    def __init__(self, backend):
+        super().__init__(backend)
+        self.picam2 = backend.picam2
+        # Runs on every frame before it reaches the encoders.
+        self.picam2.pre_callback = self._apply_overlay
+
+        self.stream_encoder = ThrottledJpegEncoder(q=self.stream_quality)
+        # A keyframe every second (with SPS/PPS repeated) lets segments be
+        # cut on any second boundary and decoded independently.
+        self.record_encoder = H264Encoder(bitrate=10000000, repeat=True, iperiod=self.framerate)
+        # Second hardware H.264 session on the lores stream for the MSE live
+        # view; a keyframe a second so new viewers start quickly.
+        self.live_encoder = H264Encoder(bitrate=LIVE_BITRATE, repeat=True, iperiod=self.framerate)
+
+    def start(self):
+        self.backend.start()
+
+    def set_stream_limits(self, max_fps, quality):
+        super().set_stream_limits(max_fps, quality)
+        self.stream_encoder.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.stream_encoder.q = quality
 
     def start_streaming(self):
         """Starts the MJPEG encoder on the low-resolution stream."""
         if self.is_streaming: return
         try:
-            self.picam2.start_encoder(self.stream_encoder, FileOutput(self.streaming_output), name='lores')
+            self.stream_stats.reset()
+            output = InstrumentedFileOutput(self.streaming_output, stats=self.stream_stats)
+            self.picam2.start_encoder(self.stream_encoder, output, name='lores')
             self.is_streaming = True
             print("Camera streaming started.")
         except Exception as e:
             print(f"Failed to start streaming encoder: {e}")
 
-    def video_feed(self):
-        """Generator that yields JPEG frames for the live feed."""
-        if not self.is_streaming: self.start_streaming()
-        while self.is_streaming:
-            with self.streaming_output.condition:
-                self.streaming_output.condition.wait()
-                frame = self.streaming_output.frame
-            if frame: yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+    def _start_live(self):
+        self.picam2.start_encoder(self.live_encoder, LiveViewOutput(self.live), name='lores')
+        print("H.264 live view started.")
+
+    def _stop_live(self):
+        self.picam2.stop_encoder(self.live_encoder)
+        print("H.264 live view stopped.")
 
     def release(self):
         """Stops the live feed without affecting recording."""
@@ -101,16 +124,26 @@ class Camera:
         except Exception as e:
             print(f"Error stopping stream encoder: {e}")
 
-    def start_recording(self, filepath, stop_event):
-        """Records video to an H.264 file and converts it to MP4 on completion."""
+    def start_recording(self, filepath, stop_event, on_finalized=None):
+        """Records video as H.264 segments, finalizing each one to MP4 in the
+        background and joining them into `filepath` when recording stops.
+
+        `on_finalized` is called with the recording's integrity hashes once
+        the final MP4 exists."""
         if self.is_recording: return
-        
-        h264_path = filepath.replace('.mp4', '.h264')
-        
+
+        segment_index = SegmentIndex(filepath, framerate=self.framerate, on_finalized=on_finalized)
+        output = None
+        writer = None
+
         try:
-            self.picam2.start_encoder(self.record_encoder, h264_path, name='main')
+            self.record_stats.reset()
+            # The encoder only appends to memory; a writer thread does the SD card writes.
+            writer = self.record_buffer = WriteBehindWriter()
+            output = SegmentedFileOutput(segment_index, stats=self.record_stats, writer=writer)
+            self.picam2.start_encoder(self.record_encoder, output, name='main')
             self.is_recording = True
-            print(f"Started recording to {h264_path}")
+            print(f"Started segmented recording for {filepath}")
             
             while not stop_event.is_set():
                 time.sleep(0.1)
@@ -121,39 +154,75 @@ class Camera:
             if self.is_recording:
                 self.picam2.stop_encoder(self.record_encoder)
                 self.is_recording = False
-                print(f"Stopped recording to {h264_path}.")
-                # Start background conversion to MP4
-                _convert_h264_to_mp4(h264_path, filepath)
+                print(f"Stopped recording for {filepath}.")
+            if output is not None:
+                # Only the last, partial segment is left to finalize.
+                output.close_segment()
+            if writer is not None:
+                writer.close()
+            if output is not None:
+                segment_index.recording_complete(stream_sha256=output.segments.stream_hasher.hexdigest())
+
+    def start_timelapse(self, filepath, stop_event, interval, keep_tail_event, tail_seconds=TAIL_SECONDS,
+                        on_finalized=None):
+        """Captures a still every `interval` seconds for a time-lapse of the test.
+
+        The hardware H.264 encoder keeps the last `tail_seconds` of full-rate
+        video in memory only; if `keep_tail_event` is set when the test stops
+        (i.e. it failed) that buffer is saved as a separate clip."""
+        if self.is_recording: return
+
+        frames_dir = frames_dir_for(filepath)
+        tail_h264 = os.path.splitext(filepath)[0] + '.tail.h264'
+        os.makedirs(frames_dir, exist_ok=True)
+        tail_output = None
+        count = len(os.listdir(frames_dir))
+
+        try:
+            tail_output = CircularOutput(buffersize=int(self.framerate * tail_seconds))
+            self.picam2.start_encoder(self.record_encoder, tail_output, name='main')
+            self.is_recording = True
+            print(f"Started time-lapse for {filepath}, one frame every {interval}s")
+
+            next_capture = time.monotonic()
+            while not stop_event.is_set():
+                if time.monotonic() >= next_capture:
+                    request = self.picam2.capture_request()
+                    try:
+                        request.save('main', os.path.join(frames_dir, FRAME_PATTERN % count))
+                    finally:
+                        request.release()
+                    count += 1
+                    next_capture += interval
+                stop_event.wait(min(0.1, max(0.0, next_capture - time.monotonic())))
+
+        except Exception as e:
+            print(f"Failed during time-lapse capture: {e}")
+        finally:
+            keep_tail = self.is_recording and keep_tail_event.is_set()
+            if keep_tail:
+                # Flushes the buffered full-rate frames when the encoder stops.
+                tail_output.fileoutput = tail_h264
+                tail_output.start()
+            if self.is_recording:
+                self.picam2.stop_encoder(self.record_encoder)
+                self.is_recording = False
+                print(f"Stopped time-lapse for {filepath} after {count} frames.")
+            if keep_tail:
+                finalize_tail(tail_h264, filepath, self.framerate)
+            finalize_timelapse(filepath, on_finalized)
+
+    def _apply_overlay(self, request):
+        overlay = self.overlay
+        if overlay is None:
+            return
+        with MappedArray(request, 'main') as main, MappedArray(request, 'lores') as lores:
+            overlay.apply(main.array, lores.array)
 
     def shutdown(self):
         """Stops all camera activity and releases the hardware."""
         self.release()
+        if self.is_live: self.picam2.stop_encoder(self.live_encoder)
         if self.is_recording: self.picam2.stop_encoder(self.record_encoder)
-        self.picam2.stop()
+        self.backend.stop()
         print("Camera shut down.")
-
-# --- Singleton Instance Management ---
-_camera_instance = None
-_camera_lock = Lock()
-
-def get_camera_instance():
-    """Provides a thread-safe, global singleton camera instance."""
-    global _camera_instance
-    with _camera_lock:
-        if _camera_instance is None:
-            print("Initializing camera for the first time...")
-            # Check for ffmpeg before initializing
-            try:
-                subprocess.run(['ffmpeg', '-version'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-            except FileNotFoundError:
-                print("\n*** WARNING: ffmpeg is not installed! ***")
-                print("Video recordings will be saved as .h264 and will not be playable in the browser.")
-                print("Install it with: sudo apt-get install ffmpeg\n")
-            
-            try:
-                _camera_instance = Camera()
-                _camera_instance.picam2.start()
-            except Exception as e:
-                print(f"FATAL: Could not initialize camera: {e}")
-                _camera_instance = None
-    return _camera_instance
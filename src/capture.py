@@ -0,0 +1,466 @@
+import io
+import os
+import time
+from collections import namedtuple
+from threading import Condition, Lock, Timer
+import numpy as np
+from src.video_tools import DEFAULT_FRAMERATE
+from src.metrics import EncoderStats
+from src.overlay import GlyphAtlas, FrameOverlay
+from src.live_view import LiveView
+from src.warmup import PENDING, STARTING, READY, FAILED
+
+# --- Capture Backends ---
+# Every frame source (the Pi camera, a V4L2 webcam, the simulator or a video
+# file being replayed) implements the same small interface: start(), stop()
+# and a frames() generator. Frames are handed around as NumPy views of the
+# backend's own buffer (the camera's mapped dmabuf, or a buffer OpenCV decodes
+# into in place), never copied. A frame's array is only valid until the next
+# frame is requested; anything that keeps a frame must copy it.
+#
+# Arrays are height x width x 3, uint8, BGR byte order (what OpenCV and
+# picamera2's 'RGB888' format both use).
+Frame = namedtuple('Frame', 'array timestamp sequence')
+
+# The backend is chosen at startup: picamera2 on the Pi, anything else on a
+# bench PC. CAMERA_DEVICE is the V4L2 device for 'opencv' and
+# CAMERA_REPLAY_FILE the video for 'replay'.
+CAMERA_BACKEND = os.environ.get('CAMERA_BACKEND', 'picamera2')
+CAMERA_DEVICE = os.environ.get('CAMERA_DEVICE', '0')
+CAMERA_REPLAY_FILE = os.environ.get('CAMERA_REPLAY_FILE')
+LORES_SIZE = (640, 480)
+DEFAULT_JPEG_QUALITY = 85
+# A live feed started only for snapshots is stopped again after this long
+# without a snapshot request, unless someone is watching it by then.
+SNAPSHOT_IDLE_SECONDS = 30
+
+
+class CaptureBackend:
+    name = None
+
+    def __init__(self, width=1280, height=720, framerate=DEFAULT_FRAMERATE):
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def frames(self):
+        """Yields Frame tuples until stop() is called."""
+        raise NotImplementedError
+
+    def _pace(self, started, sequence):
+        """Sleeps until frame `sequence` is due, for sources that aren't
+        clocked by hardware."""
+        delay = started + sequence / self.framerate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Picamera2Backend(CaptureBackend):
+    """The Pi camera. The main stream feeds the hardware H.264 encoder and
+    the lores stream the JPEG live feed; frames() maps the main buffer."""
+    name = 'picamera2'
+
+    def __init__(self, width=1280, height=720, framerate=DEFAULT_FRAMERATE):
+        from picamera2 import Picamera2
+        super().__init__(width, height, framerate)
+        self.picam2 = Picamera2()
+        self.config = self.picam2.create_video_configuration(
+            main={"size": (width, height), "format": "RGB888"},
+            lores={"size": LORES_SIZE, "format": "YUV420"},
+            encode="main",
+            controls={"FrameRate": framerate}
+        )
+        self.picam2.configure(self.config)
+
+    def start(self):
+        self.picam2.start()
+        super().start()
+
+    def stop(self):
+        super().stop()
+        self.picam2.stop()
+
+    def frames(self):
+        from picamera2 import MappedArray
+        sequence = 0
+        while self.running:
+            request = self.picam2.capture_request()
+            try:
+                with MappedArray(request, 'main') as mapped:
+                    sequence += 1
+                    yield Frame(mapped.array, time.monotonic(), sequence)
+            finally:
+                request.release()
+
+
+class OpenCVBackend(CaptureBackend):
+    """A V4L2 webcam through OpenCV, decoded into one reused buffer."""
+    name = 'opencv'
+
+    def __init__(self, width=1280, height=720, framerate=DEFAULT_FRAMERATE, device=0):
+        super().__init__(width, height, framerate)
+        self.device = device
+        self.capture = None
+
+    def start(self):
+        import cv2
+        self.capture = cv2.VideoCapture(self.device, cv2.CAP_V4L2)
+        if not self.capture.isOpened():
+            raise RuntimeError(f"Could not open video device {self.device}")
+        # MJPG is the only format most USB webcams deliver at 720p30.
+        self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.capture.set(cv2.CAP_PROP_FPS, self.framerate)
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        # The device may not support the size asked for.
+        self.width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        super().start()
+
+    def stop(self):
+        super().stop()
+        if self.capture is not None:
+            self.capture.release()
+
+    def frames(self):
+        buffer = np.empty((self.height, self.width, 3), np.uint8)
+        sequence = 0
+        while self.running:
+            ok, image = self.capture.read(buffer)
+            if not ok:
+                raise RuntimeError(f"Video device {self.device} stopped delivering frames")
+            # read() decodes into `buffer` in place; it only returns a new
+            # array if the frame size changed.
+            buffer = image
+            sequence += 1
+            yield Frame(image, time.monotonic(), sequence)
+
+
+class ReplayBackend(CaptureBackend):
+    """Replays a recorded video file at its own frame rate, looping at the end."""
+    name = 'replay'
+
+    def __init__(self, path, framerate=None, loop=True):
+        super().__init__(None, None, framerate or DEFAULT_FRAMERATE)
+        self.use_file_rate = framerate is None
+        self.path = path
+        self.loop = loop
+        self.capture = None
+
+    def start(self):
+        import cv2
+        if not self.path or not os.path.exists(self.path):
+            raise RuntimeError(f"Replay file {self.path!r} does not exist")
+        self.capture = cv2.VideoCapture(self.path)
+        self.width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if self.use_file_rate:
+            self.framerate = self.capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FRAMERATE
+        super().start()
+
+    def stop(self):
+        super().stop()
+        if self.capture is not None:
+            self.capture.release()
+
+    def frames(self):
+        import cv2
+        buffer = np.empty((self.height, self.width, 3), np.uint8)
+        sequence = 0
+        started = time.monotonic()
+        while self.running:
+            ok, image = self.capture.read(buffer)
+            if not ok:
+                if not self.loop or sequence == 0:
+                    return
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            buffer = image
+            self._pace(started, sequence)
+            sequence += 1
+            yield Frame(image, time.monotonic(), sequence)
+
+
+class SimulatorBackend(CaptureBackend):
+    """Synthetic frames for working without any camera: a sweeping bar, so
+    motion and dropped frames are visible, and the wall-clock time."""
+    name = 'simulator'
+    BAR_WIDTH = 16
+
+    def __init__(self, width=1280, height=720, framerate=DEFAULT_FRAMERATE):
+        super().__init__(width, height, framerate)
+        self.atlas = GlyphAtlas(size=32)
+
+    def frames(self):
+        buffer = np.zeros((self.height, self.width, 3), np.uint8)
+        # The clock is monospaced, so it always covers the same region.
+        h, w = self.atlas.render('0000-00-00 00:00:00').shape
+        top, left = max((self.height - h) // 2, 0), max((self.width - w) // 2, 0)
+        clock = buffer[top:top + h, left:left + w]
+        second = None
+        bar = 0
+        sequence = 0
+        started = time.monotonic()
+        while self.running:
+            now = int(time.time())
+            if now != second:
+                second = now
+                mask = self.atlas.render(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)))
+                clock[...] = 0
+                clock[mask[:clock.shape[0], :clock.shape[1]]] = 255
+            buffer[:self.height // 4, bar:bar + self.BAR_WIDTH] = 0
+            bar = (sequence * self.BAR_WIDTH) % (self.width - self.BAR_WIDTH)
+            buffer[:self.height // 4, bar:bar + self.BAR_WIDTH] = (0, 200, 255)
+            self._pace(started, sequence)
+            sequence += 1
+            yield Frame(buffer, time.monotonic(), sequence)
+
+
+def open_backend(name=CAMERA_BACKEND, width=1280, height=720, framerate=DEFAULT_FRAMERATE):
+    """Creates the named capture backend (not yet started)."""
+    if name == 'picamera2':
+        return Picamera2Backend(width, height, framerate)
+    if name == 'opencv':
+        device = int(CAMERA_DEVICE) if CAMERA_DEVICE.isdigit() else CAMERA_DEVICE
+        return OpenCVBackend(width, height, framerate, device=device)
+    if name == 'replay':
+        return ReplayBackend(CAMERA_REPLAY_FILE)
+    if name == 'simulator':
+        return SimulatorBackend(width, height, framerate)
+    raise ValueError(f"Unknown camera backend {name!r}")
+
+
+# --- Shared Camera Behaviour ---
+class StreamingOutput(io.BufferedIOBase):
+    """A thread-safe, in-memory stream for the camera encoder."""
+    def __init__(self):
+        self.frame = None
+        self.frame_time = None
+        self.sequence = 0
+        self.condition = Condition()
+
+    def write(self, buf):
+        with self.condition:
+            self.frame = buf
+            self.frame_time = time.monotonic()
+            self.sequence += 1
+            self.condition.notify_all()
+
+
+class CaptureCamera:
+    """The live feed, snapshot, overlay and statistics that every camera
+    implementation shares. Subclasses provide start(), start_streaming(),
+    release(), _start_live(), _stop_live(), start_recording(),
+    start_timelapse() and shutdown()."""
+    def __init__(self, backend):
+        self.backend = backend
+        self.framerate = backend.framerate
+        self.streaming_output = StreamingOutput()
+        self.is_streaming = False
+        self.is_recording = False
+        self.viewers = 0
+        self._snapshot = (None, None)
+        self._snapshot_stream = False     # the live feed was started by snapshot()
+        self._snapshot_used = 0.0
+        self._viewers_lock = Lock()
+        self.overlay = None
+        self._glyphs = None
+        # Live-feed limits set by the thermal governor; None is the full rate.
+        self.stream_max_fps = None
+        self.stream_quality = DEFAULT_JPEG_QUALITY
+        self.stream_stats = EncoderStats('stream', self.framerate)
+        self.record_stats = EncoderStats('record', self.framerate)
+        self.live = LiveView(*LORES_SIZE, self.framerate)
+        self.is_live = False
+        # Write-behind buffer of the current (or last) recording.
+        self.record_buffer = None
+        # Bytes sent to all live-feed and live-view viewers, updated from
+        # every viewer's request thread.
+        self.live_bytes_sent = 0
+        self._bytes_lock = Lock()
+
+    def video_feed(self):
+        """Generator that yields JPEG frames for the live feed."""
+        if not self.is_streaming: self.start_streaming()
+        with self._viewers_lock:
+            self.viewers += 1
+            # A viewer owns the feed now; the snapshot idle stop leaves it running.
+            self._snapshot_stream = False
+        try:
+            while self.is_streaming:
+                with self.streaming_output.condition:
+                    self.streaming_output.condition.wait()
+                    frame = self.streaming_output.frame
+                if frame:
+                    self._count_sent(len(frame))
+                    yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        finally:
+            with self._viewers_lock:
+                self.viewers -= 1
+
+    def live_view(self):
+        """Generator that yields fragmented-MP4 chunks of the H.264 live view.
+        The live encoder runs only while someone is watching."""
+        viewer = self.live.subscribe()
+        with self._viewers_lock:
+            if not self.is_live:
+                self.live.reset()
+                self._start_live()
+                self.is_live = True
+        try:
+            for chunk in self.live.stream(viewer):
+                self._count_sent(len(chunk))
+                yield chunk
+        finally:
+            with self._viewers_lock:
+                if self.live.unsubscribe(viewer) == 0 and self.is_live:
+                    self._stop_live()
+                    self.is_live = False
+
+    def _count_sent(self, size):
+        with self._bytes_lock:
+            self.live_bytes_sent += size
+
+    def snapshot(self, timeout=2.0):
+        """Returns (jpeg_bytes, sequence, age_seconds) for the newest live-feed
+        frame, or None if no frame arrives within `timeout`.
+
+        Requests within one frame interval share the same cached bytes. If
+        the live feed is off it is started, the frame returned is one encoded
+        after that, and the feed is stopped again once snapshots stop coming."""
+        output = self.streaming_output
+        newer_than = -1
+        with self._viewers_lock:
+            self._snapshot_used = time.monotonic()
+            if not self.is_streaming:
+                # output.frame may be left over from before the feed was released.
+                newer_than = output.sequence
+                self.start_streaming()
+                if self.is_streaming and not self._snapshot_stream:
+                    self._snapshot_stream = True
+                    self._schedule_snapshot_stop(SNAPSHOT_IDLE_SECONDS)
+        with output.condition:
+            if not output.condition.wait_for(lambda: output.frame is not None and output.sequence > newer_than,
+                                             timeout):
+                return None
+            sequence, data = self._snapshot
+            if sequence != output.sequence:
+                sequence, data = output.sequence, bytes(output.frame)
+                self._snapshot = (sequence, data)
+            age = time.monotonic() - output.frame_time
+        return data, sequence, age
+
+    def _schedule_snapshot_stop(self, delay):
+        timer = Timer(delay, self._stop_idle_snapshot_stream)
+        timer.name = 'snapshot-idle'
+        timer.daemon = True
+        timer.start()
+
+    def _stop_idle_snapshot_stream(self):
+        with self._viewers_lock:
+            if not self._snapshot_stream:
+                return
+            idle = time.monotonic() - self._snapshot_used
+            if idle < SNAPSHOT_IDLE_SECONDS:
+                self._schedule_snapshot_stop(SNAPSHOT_IDLE_SECONDS - idle)
+                return
+            self._snapshot_stream = False
+            if self.viewers:
+                return
+        print("No snapshot requests for a while; stopping the live feed.")
+        self.release()
+
+    def set_stream_limits(self, max_fps, quality):
+        """Caps the live feed's frame rate and JPEG quality. Recording is not affected."""
+        if (max_fps, quality) == (self.stream_max_fps, self.stream_quality):
+            return
+        self.stream_max_fps = max_fps
+        self.stream_quality = quality
+        self.stream_stats.set_framerate(min(max_fps or self.framerate, self.framerate))
+        print(f"Live feed limited to {max_fps or 'full'} fps at quality {quality}.")
+
+    def set_overlay(self, sample_code, started):
+        """Burns sample code, time and elapsed time into recorded and live frames."""
+        if self._glyphs is None:
+            self._glyphs = GlyphAtlas()
+        self.overlay = FrameOverlay(sample_code, started, self._glyphs)
+
+    def clear_overlay(self):
+        self.overlay = None
+
+    def health(self):
+        """Capture statistics for the live-feed and recording encoders."""
+        overlay = self.overlay
+        return {
+            'backend': self.backend.name,
+            'streaming': self.is_streaming,
+            'recording': self.is_recording,
+            'overlay_cost_us': overlay.cost_us.snapshot() if overlay else None,
+            'live_viewers': len(self.live.viewers),
+            'stream': self.stream_stats.snapshot(),
+            'record': self.record_stats.snapshot(),
+            'live': self.live.stats.snapshot(),
+            'record_buffer': self.record_buffer.snapshot() if self.record_buffer else None
+        }
+
+
+# --- Singleton Instance Management ---
+_camera_instance = None
+_camera_state = PENDING
+_camera_lock = Lock()
+
+def current_camera_instance():
+    """Returns the camera if it has been initialized, without initializing it."""
+    return _camera_instance
+
+def camera_state():
+    """'pending', 'starting', 'ready' or 'failed'."""
+    return _camera_state
+
+def start_camera():
+    """Initializes the camera singleton, blocking until it is running, and
+    returns it. Raises if the camera can't be started. Boot warm-up calls
+    this in the background; a later call retries after a failure."""
+    global _camera_instance, _camera_state
+    with _camera_lock:
+        if _camera_instance is not None:
+            return _camera_instance
+        _camera_state = STARTING
+        print(f"Initializing camera ({CAMERA_BACKEND} backend)...")
+        try:
+            if CAMERA_BACKEND == 'picamera2':
+                # Hardware encoders; imported here so bench PCs never need picamera2.
+                from src.camera import Camera
+                instance = Camera(open_backend(CAMERA_BACKEND))
+            else:
+                from src.frame_camera import FrameCamera
+                instance = FrameCamera(open_backend(CAMERA_BACKEND))
+            instance.start()
+        except Exception:
+            _camera_state = FAILED
+            raise
+        _camera_instance = instance
+        _camera_state = READY
+        return instance
+
+def get_camera_instance():
+    """Provides a thread-safe, global singleton camera instance. Returns None
+    at once while the camera is still warming up rather than waiting for it,
+    and None if it can't be started."""
+    if _camera_instance is not None:
+        return _camera_instance
+    if _camera_state == STARTING:
+        return None
+    try:
+        return start_camera()
+    except Exception as e:
+        print(f"FATAL: Could not initialize camera: {e}")
+        return None
@@ -0,0 +1,103 @@
+import os
+import json
+import uuid
+import threading
+
+# Incremental change feed over the test log, for replicating history to a
+# central server. Every change made through write_logs() is appended to a
+# JSONL journal with a monotonically increasing sequence number; clients pull
+# everything after the last sequence number (cursor) they saw.
+#
+# The journal's first line holds an epoch id. If the journal is ever lost the
+# epoch changes, telling clients to discard their cursor and resync.
+COMPACT_RATIO = 4
+
+
+class ChangeFeed:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.epoch = None
+        self.seq = 0
+        # id -> (seq, op, serialized entry or None); only the latest change
+        # per entry matters to a client catching up.
+        self.latest = {}
+        self._load()
+
+    def _load(self):
+        lines = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                header = f.readline()
+                if header.strip():
+                    self.epoch = json.loads(header)['epoch']
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        change = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a power cut; everything before it is intact.
+                        break
+                    entry = change.get('entry')
+                    self.latest[change['id']] = (change['seq'], change['op'],
+                                                 json.dumps(entry, separators=(',', ':'), ensure_ascii=False) if entry is not None else None)
+                    self.seq = change['seq']
+                    lines += 1
+        if self.epoch is None:
+            self.epoch = uuid.uuid4().hex
+            self._rewrite()
+        elif lines > COMPACT_RATIO * max(len(self.latest), 1):
+            self._rewrite()
+
+    def _rewrite(self):
+        """Rewrites the journal keeping only the latest change per entry."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'epoch': self.epoch}) + '\n')
+            for entry_id, (seq, op, entry_json) in sorted(self.latest.items(), key=lambda item: item[1][0]):
+                f.write(self._format(seq, op, entry_id, entry_json))
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _format(seq, op, entry_id, entry_json):
+        return '{"seq":%d,"op":"%s","id":%s,"entry":%s}\n' % (seq, op, json.dumps(entry_id), entry_json or 'null')
+
+    def record(self, ids, serialized):
+        """Records the difference between the journal and the log as written:
+        `ids` and `serialized` are the entry ids and their compact JSON."""
+        with self.lock:
+            lines = []
+            seen = set()
+            for entry_id, entry_json in zip(ids, serialized):
+                seen.add(entry_id)
+                current = self.latest.get(entry_id)
+                if current is None or current[2] != entry_json:
+                    self.seq += 1
+                    self.latest[entry_id] = (self.seq, 'upsert', entry_json)
+                    lines.append(self._format(self.seq, 'upsert', entry_id, entry_json))
+            for entry_id, (_, op, _) in list(self.latest.items()):
+                if entry_id not in seen and op != 'delete':
+                    self.seq += 1
+                    self.latest[entry_id] = (self.seq, 'delete', None)
+                    lines.append(self._format(self.seq, 'delete', entry_id, None))
+            if lines:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.writelines(lines)
+
+    def changes(self, since=0, limit=500):
+        """Returns the changes after cursor `since`, oldest first, as the raw
+        JSON text of the response body (entries are already serialized)."""
+        with self.lock:
+            pending = sorted((seq, op, entry_id, entry_json)
+                             for entry_id, (seq, op, entry_json) in self.latest.items() if seq > since)
+            head = self.seq
+            epoch = self.epoch
+        page = pending[:limit]
+        more = len(pending) > limit
+        cursor = page[-1][0] if more else max(head, since)
+        changes = ','.join(self._format(seq, op, entry_id, entry_json).rstrip('\n')
+                           for seq, op, entry_id, entry_json in page)
+        return '{"epoch":%s,"cursor":%d,"more":%s,"changes":[%s]}' % (
+            json.dumps(epoch), cursor, 'true' if more else 'false', changes)
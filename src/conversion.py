@@ -0,0 +1,35 @@
+import queue
+import threading
+
+# Single background worker for ffmpeg jobs. Running conversions one at a time
+# keeps a long recording's rolling finalization from competing with itself
+# for the Pi's CPU and SD card.
+_jobs = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _run():
+    while True:
+        func, args, kwargs = _jobs.get()
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            print(f"Error in conversion job {getattr(func, '__name__', func)}: {e}")
+        finally:
+            _jobs.task_done()
+
+
+def submit(func, *args, **kwargs):
+    """Queues a conversion job to run on the background worker."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='conversion', daemon=True)
+            _worker.start()
+    _jobs.put((func, args, kwargs))
+
+
+def pending_count():
+    """Number of conversion jobs queued or running."""
+    return _jobs.unfinished_tasks
@@ -0,0 +1,308 @@
+import os
+import time
+import queue
+import threading
+import subprocess
+from collections import deque
+import cv2
+from src.capture import CaptureCamera, LORES_SIZE
+from src.live_view import LIVE_BITRATE
+from src.write_behind import WriteBehindWriter
+from src.metrics import EncoderStats
+from src.segments import SegmentIndex, SegmentWriter
+from src.timelapse import frames_dir_for, finalize_timelapse, finalize_tail, TAIL_SECONDS, FRAME_PATTERN
+
+# Camera pipeline for backends without hardware encoders (a webcam, the
+# simulator or a replayed file on a bench PC). One capture thread pulls
+# frames from the backend and, per frame, applies the overlay, feeds the
+# recording encoder and JPEG-encodes the live feed. Recordings go through the
+# same SegmentWriter and SegmentIndex as on the Pi, so finalization, hashing,
+# time-lapses and failure clips behave identically.
+AUD = b'\x00\x00\x00\x01\x09'
+NAL_IDR = 5
+_READ_SIZE = 1 << 16
+
+
+class SoftwareH264Encoder:
+    """libx264 in an ffmpeg subprocess, configured like the Pi's hardware
+    encoder: a keyframe every second with SPS/PPS repeated, no B-frames.
+
+    Raw frames are written straight from the backend's buffer to ffmpeg's
+    stdin. A reader thread splits the output into access units (ffmpeg is
+    told to emit an access unit delimiter before each one) and passes
+    (data, keyframe) to `sink`."""
+    def __init__(self, width, height, framerate, sink, bitrate='10M'):
+        self.sink = sink
+        self.failed = None
+        self.process = subprocess.Popen([
+            'ffmpeg', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(framerate), '-i', '-',
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency', '-b:v', bitrate,
+            '-g', str(int(framerate)), '-bf', '0', '-x264-params', 'repeat-headers=1:aud=1',
+            '-f', 'h264', '-'
+        ], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.reader = threading.Thread(target=self._read, name='software-encoder', daemon=True)
+        self.reader.start()
+
+    def encode(self, array):
+        """Queues one frame; blocks if the encoder falls behind. If ffmpeg
+        stops taking input the error is kept and later frames are dropped."""
+        if self.failed:
+            return
+        try:
+            self.process.stdin.write(array.data if array.flags.c_contiguous else array.copy(order='C').data)
+        except (OSError, ValueError) as e:
+            self.failed = str(e)
+            print(f"Software encoder stopped taking frames: {e}")
+
+    @staticmethod
+    def _is_keyframe(unit):
+        start = unit.find(b'\x00\x00\x01')
+        while start >= 0 and start + 3 < len(unit):
+            if unit[start + 3] & 0x1f == NAL_IDR:
+                return True
+            start = unit.find(b'\x00\x00\x01', start + 3)
+        return False
+
+    def _read(self):
+        pending = b''
+        while True:
+            chunk = self.process.stdout.read1(_READ_SIZE)
+            if not chunk:
+                break
+            pending += chunk
+            # Everything before the last delimiter is complete.
+            end = pending.rfind(AUD)
+            if end <= 0:
+                continue
+            units, pending = pending[:end], pending[end:]
+            start = 0
+            while start < len(units):
+                next_start = units.find(AUD, start + len(AUD))
+                unit = units[start:] if next_start < 0 else units[start:next_start]
+                self.sink(unit, self._is_keyframe(unit))
+                start = len(units) if next_start < 0 else next_start
+        if pending:
+            self.sink(pending, self._is_keyframe(pending))
+
+    def close(self):
+        """Flushes the encoder and waits for the last frames to reach the sink."""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+        self.reader.join()
+
+
+class FrameCamera(CaptureCamera):
+    """Camera built on any capture backend, encoding in software."""
+    def __init__(self, backend):
+        super().__init__(backend)
+        self.capture_stats = None
+        self._encoder = None
+        self._live_encoder = None
+        # Held by the capture thread while it feeds the encoders, and taken
+        # to swap one out, so an encoder is never closed mid-frame.
+        self._encoders_lock = threading.Lock()
+        self._stills = queue.Queue()
+        self._lores = None
+        self._last_streamed = 0.0
+        self._thread = None
+
+    def start(self):
+        self.backend.start()
+        # The backend may have adjusted its size and rate to the device.
+        self.framerate = self.backend.framerate
+        self.stream_stats.set_framerate(self.framerate)
+        self.record_stats.set_framerate(self.framerate)
+        self.capture_stats = EncoderStats('capture', self.framerate)
+        self._thread = threading.Thread(target=self._capture_loop, name='capture', daemon=True)
+        self._thread.start()
+
+    def _capture_loop(self):
+        try:
+            for frame in self.backend.frames():
+                started = time.perf_counter()
+                overlay = self.overlay
+                if overlay is not None:
+                    overlay.apply(frame.array)
+                with self._encoders_lock:
+                    if self._encoder is not None:
+                        self._encoder.encode(frame.array)
+                while not self._stills.empty():
+                    path, done = self._stills.get_nowait()
+                    cv2.imwrite(path, frame.array)
+                    done.set()
+                if self.is_streaming or self._live_encoder is not None:
+                    with self._encoders_lock:
+                        self._downscale(frame)
+                self.capture_stats.record(frame.array.nbytes, True, frame.timestamp * 1_000_000,
+                                          time.perf_counter() - started)
+        except Exception as e:
+            # Encoder failures are handled per frame; this is the backend failing.
+            print(f"Capture from {self.backend.name} backend stopped: {e}")
+
+    def _downscale(self, frame):
+        """Feeds the live-view encoder and the JPEG feed from one lores copy,
+        as the Pi does from its lores stream. Called with _encoders_lock held."""
+        live_encoder = self._live_encoder
+        streaming = self.is_streaming and not (
+            self.stream_max_fps and frame.timestamp - self._last_streamed < 0.9 / self.stream_max_fps)
+        if live_encoder is None and not streaming:
+            return
+        self._lores = cv2.resize(frame.array, LORES_SIZE, dst=self._lores, interpolation=cv2.INTER_AREA)
+        if live_encoder is not None:
+            live_encoder.encode(self._lores)
+        if streaming:
+            self._stream(frame)
+
+    def _stream(self, frame):
+        self._last_streamed = frame.timestamp
+        started = time.perf_counter()
+        ok, jpeg = cv2.imencode('.jpg', self._lores, [cv2.IMWRITE_JPEG_QUALITY, self.stream_quality])
+        if ok:
+            self.streaming_output.write(jpeg.tobytes())
+            self.stream_stats.record(len(jpeg), True, frame.timestamp * 1_000_000, time.perf_counter() - started)
+
+    def start_streaming(self):
+        """Starts JPEG-encoding a downscaled copy of each frame."""
+        if self.is_streaming: return
+        self.stream_stats.reset()
+        self.is_streaming = True
+        print("Camera streaming started.")
+
+    def release(self):
+        """Stops the live feed without affecting recording."""
+        if not self.is_streaming: return
+        self.is_streaming = False
+        print("Camera streaming stopped.")
+
+    def _start_live(self):
+        encoder = SoftwareH264Encoder(*LORES_SIZE, self.framerate,
+                                      lambda unit, keyframe: self.live.write_unit(unit, keyframe),
+                                      bitrate=str(LIVE_BITRATE))
+        with self._encoders_lock:
+            self._live_encoder = encoder
+        print("H.264 live view started.")
+
+    def _take_encoder(self, name):
+        """Detaches an encoder from the capture thread; the caller closes it."""
+        with self._encoders_lock:
+            encoder = getattr(self, name)
+            setattr(self, name, None)
+        return encoder
+
+    def _stop_live(self):
+        encoder = self._take_encoder('_live_encoder')
+        if encoder is not None:
+            encoder.close()
+        print("H.264 live view stopped.")
+
+    def _record_sink(self, segments):
+        def sink(unit, keyframe):
+            started = time.perf_counter()
+            segments.roll(keyframe)
+            segments.file.write(unit)
+            self.record_stats.record(len(unit), keyframe, None, time.perf_counter() - started)
+        return sink
+
+    def start_recording(self, filepath, stop_event, on_finalized=None):
+        """Records video as H.264 segments, finalizing each one to MP4 in the
+        background and joining them into `filepath` when recording stops."""
+        if self.is_recording: return
+
+        segment_index = SegmentIndex(filepath, framerate=self.framerate, on_finalized=on_finalized)
+        segments = None
+        writer = None
+
+        try:
+            self.record_stats.reset()
+            writer = self.record_buffer = WriteBehindWriter()
+            segments = SegmentWriter(segment_index, writer=writer)
+            encoder = SoftwareH264Encoder(self.backend.width, self.backend.height, self.framerate,
+                                          self._record_sink(segments))
+            with self._encoders_lock:
+                self._encoder = encoder
+            self.is_recording = True
+            print(f"Started segmented recording for {filepath} ({self.backend.name} backend)")
+            stop_event.wait()
+
+        except Exception as e:
+            print(f"Failed to start recording: {e}")
+        finally:
+            encoder = self._take_encoder('_encoder')
+            if encoder is not None:
+                encoder.close()
+            if self.is_recording:
+                self.is_recording = False
+                print(f"Stopped recording for {filepath}.")
+            if segments is not None:
+                segments.close_segment()
+            if writer is not None:
+                writer.close()
+            if segments is not None:
+                segment_index.recording_complete(stream_sha256=segments.stream_hasher.hexdigest())
+
+    def start_timelapse(self, filepath, stop_event, interval, keep_tail_event, tail_seconds=TAIL_SECONDS,
+                        on_finalized=None):
+        """Captures a still every `interval` seconds for a time-lapse of the
+        test, keeping the last `tail_seconds` of full-rate video in memory
+        in case the test fails."""
+        if self.is_recording: return
+
+        frames_dir = frames_dir_for(filepath)
+        tail_h264 = os.path.splitext(filepath)[0] + '.tail.h264'
+        os.makedirs(frames_dir, exist_ok=True)
+        tail = deque(maxlen=int(self.framerate * tail_seconds))
+        count = len(os.listdir(frames_dir))
+
+        try:
+            encoder = SoftwareH264Encoder(self.backend.width, self.backend.height, self.framerate,
+                                          lambda unit, keyframe: tail.append((unit, keyframe)))
+            with self._encoders_lock:
+                self._encoder = encoder
+            self.is_recording = True
+            print(f"Started time-lapse for {filepath}, one frame every {interval}s")
+
+            next_capture = time.monotonic()
+            while not stop_event.is_set():
+                if time.monotonic() >= next_capture:
+                    done = threading.Event()
+                    self._stills.put((os.path.join(frames_dir, FRAME_PATTERN % count), done))
+                    if done.wait(5):
+                        count += 1
+                    next_capture += interval
+                stop_event.wait(min(0.1, max(0.0, next_capture - time.monotonic())))
+
+        except Exception as e:
+            print(f"Failed during time-lapse capture: {e}")
+        finally:
+            encoder = self._take_encoder('_encoder')
+            if encoder is not None:
+                encoder.close()
+            keep_tail = self.is_recording and keep_tail_event.is_set()
+            if self.is_recording:
+                self.is_recording = False
+                print(f"Stopped time-lapse for {filepath} after {count} frames.")
+            if keep_tail:
+                units = list(tail)
+                first_keyframe = next((i for i, (_, keyframe) in enumerate(units) if keyframe), len(units))
+                with open(tail_h264, 'wb') as f:
+                    f.writelines(unit for unit, _ in units[first_keyframe:])
+                finalize_tail(tail_h264, filepath, self.framerate)
+            finalize_timelapse(filepath, on_finalized)
+
+    def health(self):
+        health = super().health()
+        health['capture'] = self.capture_stats.snapshot() if self.capture_stats else None
+        return health
+
+    def shutdown(self):
+        """Stops all camera activity and releases the device."""
+        self.release()
+        if self.is_live: self._stop_live()
+        self.backend.stop()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        print("Camera shut down.")
@@ -0,0 +1,45 @@
+import hashlib
+import time
+
+# SHA-256 hashing of recordings as they are written, so proving a video is
+# unaltered never needs a second full read from the SD card.
+_CHUNK_SIZE = 1 << 20
+
+
+class HashingWriter:
+    """Wraps a binary file, hashing every byte written to it. An optional
+    second hasher accumulates the whole stream across several files."""
+    def __init__(self, file, stream_hasher=None):
+        self.file = file
+        self.hasher = hashlib.sha256()
+        self.stream_hasher = stream_hasher
+        self.bytes = 0
+        self.hash_seconds = 0.0
+
+    def write(self, data):
+        started = time.perf_counter()
+        self.hasher.update(data)
+        if self.stream_hasher is not None:
+            self.stream_hasher.update(data)
+        self.hash_seconds += time.perf_counter() - started
+        self.bytes += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+def sha256_file(path):
+    """Returns (hex digest, seconds taken) for a file."""
+    started = time.perf_counter()
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest(), time.perf_counter() - started
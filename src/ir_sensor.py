@@ -1,11 +1,15 @@
 import RPi.GPIO as GPIO
 import time
 import threading
+from src.ir_signal import EdgeRing, EDGE_CAPTURE
 
 class IRSensorMonitor:
-    def __init__(self, sensor_pin, inactivity_timeout=8):
+    def __init__(self, sensor_pin, inactivity_timeout=8, edge_capture=EDGE_CAPTURE):
         self.sensor_pin = sensor_pin
         self.inactivity_timeout = inactivity_timeout
+        # With edge capture, a GPIO interrupt timestamps every edge into
+        # this ring for the vibration analysis in src/ir_signal.py.
+        self.edges = EdgeRing() if edge_capture else None
         self.last_state = None
         self.last_state_change_time = None
         self.stop_event = threading.Event()
@@ -13,6 +17,8 @@ class IRSensorMonitor:
         self.callback = None
         self.callback_fired = False
 
+    def setup(self):
+        """Configures the sensor pin. Called by boot warm-up."""
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(self.sensor_pin, GPIO.IN)
 
@@ -23,17 +29,27 @@ class IRSensorMonitor:
         self.stop_event.clear()
         self.callback_fired = False
         self.callback = callback
-        self.monitor_thread = threading.Thread(target=self._monitor)
+        self.monitor_thread = threading.Thread(target=self._monitor, name='ir-monitor')
         self.monitor_thread.start()
+        if self.edges is not None:
+            GPIO.add_event_detect(self.sensor_pin, GPIO.BOTH, callback=self._on_edge)
         print(f"IR sensor monitoring started on pin {self.sensor_pin}")
 
     def stop_monitoring(self):
         """Stops the sensor monitoring thread."""
         self.stop_event.set()
+        if self.edges is not None:
+            GPIO.remove_event_detect(self.sensor_pin)
         if self.monitor_thread and self.monitor_thread.is_alive():
             self.monitor_thread.join()
         print("IR sensor monitoring stopped.")
 
+    def _on_edge(self, channel):
+        """GPIO interrupt callback. Also resets the inactivity timer, since
+        the 100ms poll can miss pulses shorter than that."""
+        self.edges.append(time.monotonic_ns(), GPIO.input(channel))
+        self.last_state_change_time = time.time()
+
     def _monitor(self):
         """The internal method that runs in a loop to check the sensor."""
         while not self.stop_event.is_set():
@@ -50,7 +66,7 @@ class IRSensorMonitor:
                     self.callback_fired = True
                     if self.callback:
                         # Use a thread to call the callback to avoid blocking
-                        threading.Thread(target=self.callback).start()
+                        threading.Thread(target=self.callback, name='ir-inactivity').start()
             time.sleep(0.1)  # Check the sensor state every 100ms
 
     def cleanup(self):
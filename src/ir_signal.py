@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import math
+import time
+import struct
+import threading
+from array import array
+import numpy as np
+
+# IR signal capture and vibration analysis. The inactivity check only knows
+# that the sensor stopped changing; the rate of change shows the conductor
+# slowing down well before that.
+#
+# With edge capture on (IR_EDGE_CAPTURE=1), every sensor edge is timestamped
+# by a GPIO interrupt into a preallocated ring of the last EDGE_CAPACITY
+# edges. While a test runs, each WINDOW_SECONDS window is reduced with NumPy
+# to a transition frequency (edges per second) and a jitter: the coefficient
+# of variation of the cycle period, measured between edges two apart so an
+# uneven duty cycle doesn't count as jitter.
+#
+# A slowdown is flagged when the recent frequency has fallen SLOWDOWN_FRACTION
+# below the baseline (the median of the first BASELINE_WINDOWS) and the
+# linear trend over the last TREND_WINDOWS is still falling.
+#
+# The series is stored next to the video as <name>.irsignal.bin:
+#   b'IRS1', uint32 header length, JSON header (space-padded to a multiple of
+#   4 bytes), then `count` little-endian float32 frequencies, `count` float32
+#   jitters (NaN where a window had too few edges), then the test's last
+#   `edges` edges as uint32 microseconds since the previous edge, followed by
+#   their int8 levels. The first delta is 0; the first edge's offset from the
+#   start of the test is the header's first_edge_us.
+IR_SIGNAL_SUFFIX = '.irsignal.bin'
+MAGIC = b'IRS1'
+EDGE_CAPTURE = os.environ.get('IR_EDGE_CAPTURE') == '1'
+EDGE_CAPACITY = int(os.environ.get('IR_EDGE_CAPACITY', 65536))
+WINDOW_SECONDS = 10
+BASELINE_WINDOWS = 6
+TREND_WINDOWS = 30
+RECENT_WINDOWS = 6
+SLOWDOWN_FRACTION = 0.15
+# Windows with fewer periods than this get no jitter.
+MIN_PERIODS = 4
+SAVE_EVERY_SECONDS = 60
+CHANNELS = ('frequency_hz', 'jitter')
+
+
+def ir_signal_path_for(video_path):
+    return os.path.splitext(video_path)[0] + IR_SIGNAL_SUFFIX
+
+
+class EdgeRing:
+    """The last `capacity` edges as monotonic nanosecond timestamps and
+    levels, in preallocated arrays. Appends come from the GPIO callback
+    thread and never allocate."""
+    def __init__(self, capacity=EDGE_CAPACITY):
+        self.lock = threading.Lock()
+        self.times = np.zeros(capacity, np.int64)
+        self.levels = np.zeros(capacity, np.int8)
+        self.capacity = capacity
+        self.total = 0                # edges ever appended
+
+    def append(self, time_ns, level):
+        with self.lock:
+            i = self.total % self.capacity
+            self.times[i] = time_ns
+            self.levels[i] = level
+            self.total += 1
+
+    def since(self, start_ns):
+        """Copies out the edges at or after `start_ns`, oldest first. Returns
+        (times, levels, lost), where lost says some of them were already
+        overwritten."""
+        with self.lock:
+            count = min(self.total, self.capacity)
+            head = self.total % self.capacity
+            if count < self.capacity:
+                times, levels = self.times[:count].copy(), self.levels[:count].copy()
+            else:
+                times = np.concatenate((self.times[head:], self.times[:head]))
+                levels = np.concatenate((self.levels[head:], self.levels[:head]))
+            total = self.total
+        first = int(np.searchsorted(times, start_ns))
+        lost = total > count and count > 0 and times[0] > start_ns
+        return times[first:], levels[first:], bool(lost)
+
+
+def window_stats(times_ns, start_ns, window_ns, windows):
+    """Transition frequency and period jitter for `windows` consecutive
+    windows starting at `start_ns`. Edges are assigned to windows by time and
+    periods by the edge that ends them."""
+    frequency = np.zeros(windows, np.float64)
+    jitter = np.full(windows, np.nan)
+    if windows <= 0:
+        return frequency, jitter
+    index = (times_ns - start_ns) // window_ns
+    inside = (index >= 0) & (index < windows)
+    frequency[:] = np.bincount(index[inside], minlength=windows)[:windows] / (window_ns / 1e9)
+    if len(times_ns) > 2:
+        periods = (times_ns[2:] - times_ns[:-2]) / 1e9
+        period_index = index[2:]
+        keep = (period_index >= 0) & (period_index < windows)
+        periods, period_index = periods[keep], period_index[keep]
+        count = np.bincount(period_index, minlength=windows)[:windows]
+        total = np.bincount(period_index, periods, minlength=windows)[:windows]
+        squares = np.bincount(period_index, periods * periods, minlength=windows)[:windows]
+        enough = count >= MIN_PERIODS
+        mean = total[enough] / count[enough]
+        variance = np.maximum(squares[enough] / count[enough] - mean * mean, 0.0)
+        jitter[enough] = np.sqrt(variance) / mean
+    return frequency, jitter
+
+
+def slowdown_trend(frequency, window_seconds=WINDOW_SECONDS):
+    """Compares recent frequency with the baseline and fits the recent
+    trend. Returns None until there are enough windows."""
+    frequency = np.asarray(frequency, np.float64)
+    if len(frequency) < BASELINE_WINDOWS + RECENT_WINDOWS:
+        return None
+    baseline = float(np.median(frequency[:BASELINE_WINDOWS]))
+    recent = float(np.median(frequency[-RECENT_WINDOWS:]))
+    tail = frequency[-TREND_WINDOWS:]
+    slope = float(np.polyfit(np.arange(len(tail)), tail, 1)[0]) * 60 / window_seconds
+    drop = 1 - recent / baseline if baseline > 0 else 0.0
+    return {
+        'baseline_hz': round(baseline, 3),
+        'recent_hz': round(recent, 3),
+        'drop': round(drop, 3),
+        'slope_hz_per_min': round(slope, 4),
+        'slowing': bool(drop >= SLOWDOWN_FRACTION and slope < 0)
+    }
+
+
+def read_ir_signal(path):
+    """Parses an IR signal file into its header plus 'series' (channel ->
+    values, NaN as None) and 'edges' ({'offsets_ms', 'levels'})."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError(f"{os.path.basename(path)} is not an IR signal file")
+    header_length = struct.unpack_from('<I', data, 4)[0]
+    header = json.loads(data[8:8 + header_length])
+    offset = 8 + header_length
+    header['series'] = {}
+    for channel in header['channels']:
+        values = np.frombuffer(data, '<f4', header['count'], offset)
+        offset += 4 * header['count']
+        header['series'][channel] = [None if math.isnan(v) else round(float(v), 4) for v in values]
+    deltas = np.frombuffer(data, '<u4', header['edges'], offset)
+    offset += 4 * header['edges']
+    levels = np.frombuffer(data, np.int8, header['edges'], offset)
+    offsets_ms = (header['first_edge_us'] + np.cumsum(deltas, dtype=np.int64) - deltas[0]) / 1000 \
+        if header['edges'] else np.zeros(0)
+    header['edges'] = {'offsets_ms': np.round(offsets_ms, 3).tolist(), 'levels': levels.tolist()}
+    return header
+
+
+class IRSignalRecorder:
+    """Reduces one test's IR edges to per-window frequency and jitter,
+    watches for a slowdown and saves the series every minute and when the
+    test stops."""
+    def __init__(self, video_path, edges, window_seconds=WINDOW_SECONDS):
+        self.path = ir_signal_path_for(video_path)
+        self.edges = edges
+        self.window_ns = int(window_seconds * 1e9)
+        self.window_seconds = window_seconds
+        self.start_ms = int(time.time() * 1000)
+        self.start_ns = time.monotonic_ns()
+        self.start_total = edges.total
+        self.frequency = array('f')
+        self.jitter = array('f')
+        self.trend = None
+        self.slowdown_at_ms = None
+        self.edges_lost = False
+        self.analysis_seconds = 0.0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='ir-signal', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        last_save = time.monotonic()
+        while not self.stop_event.wait(self.window_seconds):
+            self.analyze()
+            if time.monotonic() - last_save >= SAVE_EVERY_SECONDS:
+                self.save()
+                last_save = time.monotonic()
+
+    def analyze(self, now_ns=None):
+        """Adds every window completed since the last call."""
+        started = time.perf_counter()
+        now_ns = now_ns if now_ns is not None else time.monotonic_ns()
+        done = len(self.frequency)
+        windows = (now_ns - self.start_ns) // self.window_ns - done
+        if windows <= 0:
+            return
+        first_ns = self.start_ns + done * self.window_ns
+        # From a window earlier, so the first periods in the window are complete.
+        times, _, lost = self.edges.since(first_ns - self.window_ns)
+        self.edges_lost = self.edges_lost or lost
+        frequency, jitter = window_stats(times, first_ns, self.window_ns, windows)
+        self.frequency.extend(frequency.astype(np.float32))
+        self.jitter.extend(jitter.astype(np.float32))
+        self.trend = slowdown_trend(self.frequency, self.window_seconds)
+        if self.trend and self.trend['slowing'] and self.slowdown_at_ms is None:
+            self.slowdown_at_ms = self.start_ms + len(self.frequency) * self.window_seconds * 1000
+            print(f"WARNING: IR transition rate down {self.trend['drop']:.0%} from "
+                  f"{self.trend['baseline_hz']} Hz to {self.trend['recent_hz']} Hz and still falling.")
+        self.analysis_seconds += time.perf_counter() - started
+
+    def to_bytes(self):
+        times, levels, _ = self.edges.since(self.start_ns)
+        offsets_us = (times - self.start_ns) // 1000
+        deltas = np.diff(offsets_us, prepend=offsets_us[:1]) if len(offsets_us) else offsets_us
+        deltas = np.clip(deltas, 0, 0xFFFFFFFF).astype('<u4')
+        header = json.dumps({
+            'channels': list(CHANNELS),
+            'start_ms': self.start_ms,
+            'window_seconds': self.window_seconds,
+            'count': len(self.frequency),
+            'edges': len(times),
+            'first_edge_us': int(offsets_us[0]) if len(offsets_us) else 0,
+            'edges_lost': self.edges_lost,
+            'trend': self.trend,
+            'slowdown_at_ms': self.slowdown_at_ms
+        }, separators=(',', ':')).encode()
+        header += b' ' * (-len(header) % 4)
+        parts = [MAGIC, struct.pack('<I', len(header)), header]
+        for series in (self.frequency, self.jitter):
+            if sys.byteorder == 'big':
+                series = array('f', series)
+                series.byteswap()
+            parts.append(series.tobytes())
+        parts.append(deltas.tobytes())
+        parts.append(levels.astype(np.int8).tobytes())
+        return b''.join(parts)
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, self.path)
+
+    def status(self):
+        frequency = self.frequency[-1] if self.frequency else None
+        jitter = self.jitter[-1] if self.jitter else None
+        return {
+            'windows': len(self.frequency),
+            'frequency_hz': round(frequency, 3) if frequency is not None else None,
+            'jitter': round(jitter, 4) if jitter is not None and not math.isnan(jitter) else None,
+            'trend': self.trend,
+            'slowdown_at_ms': self.slowdown_at_ms
+        }
+
+    def stop(self):
+        """Stops analysis, writes the final series and returns a summary for
+        the log entry."""
+        self.stop_event.set()
+        self.thread.join()
+        self.analyze()
+        self.save()
+        frequency = np.asarray(self.frequency, np.float64)
+        jitter = np.asarray(self.jitter, np.float64)
+        summary = {
+            'edges': self.edges.total - self.start_total,
+            'windows': len(frequency),
+            'analysis_cost_ms': round(self.analysis_seconds * 1000 / max(len(frequency), 1), 3),
+            'slowing': bool(self.trend and self.trend['slowing'])
+        }
+        if len(frequency):
+            summary['frequency_hz'] = {'min': round(float(frequency.min()), 2),
+                                       'mean': round(float(frequency.mean()), 2),
+                                       'max': round(float(frequency.max()), 2)}
+        if np.isfinite(jitter).any():
+            summary['mean_jitter'] = round(float(np.nanmean(jitter)), 4)
+        if self.trend:
+            summary['trend'] = self.trend
+        if self.slowdown_at_ms is not None:
+            summary['slowdown_at_ms'] = self.slowdown_at_ms
+        if self.edges_lost:
+            summary['edges_lost'] = True
+        return summary
@@ -0,0 +1,131 @@
+import os
+import json
+import struct
+import bisect
+
+# Keyframe index for MP4 recordings, read straight from the sample tables in
+# the moov atom (stts/stss). No frame is decoded and, because recordings are
+# faststart, only the front of the file is read. The index is cached next to
+# the video as <name>.keyframes.json so it is built once per recording.
+INDEX_SUFFIX = '.keyframes.json'
+_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+
+def index_path_for(video_path):
+    return os.path.splitext(video_path)[0] + INDEX_SUFFIX
+
+
+def _boxes(data, offset=0, end=None):
+    """Yields (type, payload start, payload end) for the boxes in a buffer."""
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def _read_moov(f):
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, kind = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        if kind == b'moov':
+            return f.read(size - header_size)
+        if size == 0:
+            return None
+        f.seek(size - header_size, os.SEEK_CUR)
+
+
+def _find_video_stbl(moov):
+    """Returns (timescale, {box type: payload bytes}) for the video track."""
+    for kind, start, end in _boxes(moov):
+        if kind != b'trak':
+            continue
+        tables = {}
+        timescale = None
+        is_video = False
+        stack = [(start, end)]
+        while stack:
+            s, e = stack.pop()
+            for child, cs, ce in _boxes(moov, s, e):
+                if child in _CONTAINERS:
+                    stack.append((cs, ce))
+                elif child == b'hdlr':
+                    is_video = moov[cs + 8:cs + 12] == b'vide'
+                elif child == b'mdhd':
+                    version = moov[cs]
+                    timescale = struct.unpack_from('>I', moov, cs + (20 if version == 1 else 12))[0]
+                elif child in (b'stts', b'stss'):
+                    tables[child] = moov[cs:ce]
+        if is_video and timescale and b'stts' in tables:
+            return timescale, tables
+    return None, None
+
+
+def build_index(video_path):
+    """Returns {'duration': seconds, 'keyframes': [seconds, ...]}."""
+    with open(video_path, 'rb') as f:
+        moov = _read_moov(f)
+    if moov is None:
+        raise ValueError(f"{os.path.basename(video_path)} has no moov atom")
+    timescale, tables = _find_video_stbl(moov)
+    if timescale is None:
+        raise ValueError(f"{os.path.basename(video_path)} has no video track")
+
+    stts = tables[b'stts']
+    stts_count = struct.unpack_from('>I', stts, 4)[0]
+    runs = list(struct.iter_unpack('>II', stts[8:8 + 8 * stts_count]))
+    if b'stss' in tables:
+        stss = tables[b'stss']
+        stss_count = struct.unpack_from('>I', stss, 4)[0]
+        sync_samples = [n for (n,) in struct.iter_unpack('>I', stss[8:8 + 4 * stss_count])]
+    else:
+        # No sync sample table means every sample is a keyframe.
+        sync_samples = list(range(1, sum(count for count, _ in runs) + 1))
+
+    keyframes = []
+    i = 0
+    sample = 1
+    ticks = 0
+    for count, delta in runs:
+        run_end = sample + count
+        while i < len(sync_samples) and sync_samples[i] < run_end:
+            keyframes.append(round((ticks + (sync_samples[i] - sample) * delta) / timescale, 3))
+            i += 1
+        ticks += count * delta
+        sample = run_end
+    return {'duration': round(ticks / timescale, 3), 'keyframes': keyframes}
+
+
+def load_index(video_path):
+    """Returns the cached keyframe index, building it on first use."""
+    index_path = index_path_for(video_path)
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(video_path):
+        with open(index_path, 'r') as f:
+            return json.load(f)
+    index = build_index(video_path)
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def snap_to_keyframe(index, start):
+    """The latest keyframe at or before `start` (seconds)."""
+    keyframes = index['keyframes']
+    i = bisect.bisect_right(keyframes, start) - 1
+    return keyframes[max(i, 0)] if keyframes else 0.0
@@ -0,0 +1,218 @@
+import time
+import queue
+import struct
+import threading
+from src.metrics import EncoderStats, histogram
+
+# Low-bandwidth live view: H.264 from the lores stream, packaged as
+# fragmented MP4 for Media Source Extensions in the browser.
+#
+# The stream is an init segment (ftyp + moov) followed by one fragment per
+# frame (prft + moof + mdat), so nothing waits for a GOP to fill. The prft
+# (producer reference time) box carries the wall-clock time the frame was
+# captured, which the page compares with its own clock to show the
+# glass-to-browser latency.
+TIMESCALE = 90000
+LIVE_BITRATE = 1_000_000
+# Fragments buffered per viewer before a slow viewer is skipped ahead to
+# the next keyframe.
+MAX_QUEUED_FRAGMENTS = 60
+NTP_EPOCH_OFFSET = 2208988800
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+
+latency_seconds = histogram('live_view_latency_seconds', 'Glass-to-browser latency reported by live-view pages.',
+                            buckets=(0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0))
+
+
+def split_nal_units(data):
+    """Splits an Annex-B byte stream into NAL units (without start codes)."""
+    units = []
+    start = data.find(b'\x00\x00\x01')
+    while start >= 0:
+        start += 3
+        end = data.find(b'\x00\x00\x01', start)
+        if end < 0:
+            units.append(data[start:])
+        else:
+            # A four-byte start code leaves its leading zero on this unit.
+            units.append(data[start:end - 1] if data[end - 1] == 0 else data[start:end])
+        start = end
+    return [unit for unit in units if unit]
+
+
+def _box(kind, *payload):
+    body = b''.join(payload)
+    return struct.pack('>I4s', 8 + len(body), kind) + body
+
+
+def _full_box(kind, version, flags, *payload):
+    return _box(kind, struct.pack('>I', (version << 24) | flags), *payload)
+
+
+def init_segment(width, height, sps, pps):
+    """ftyp + moov for a single H.264 video track."""
+    avcc = _box(b'avcC', bytes([1, sps[1], sps[2], sps[3], 0xFF, 0xE1]),
+                struct.pack('>H', len(sps)), sps, b'\x01', struct.pack('>H', len(pps)), pps)
+    avc1 = _box(b'avc1', bytes(6), struct.pack('>H', 1), bytes(16),
+                struct.pack('>HHIIIH', width, height, 0x00480000, 0x00480000, 0, 1),
+                bytes(32), struct.pack('>Hh', 0x18, -1), avcc)
+    matrix = struct.pack('>9I', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    stbl = _box(b'stbl',
+                _full_box(b'stsd', 0, 0, struct.pack('>I', 1), avc1),
+                _full_box(b'stts', 0, 0, struct.pack('>I', 0)),
+                _full_box(b'stsc', 0, 0, struct.pack('>I', 0)),
+                _full_box(b'stsz', 0, 0, struct.pack('>II', 0, 0)),
+                _full_box(b'stco', 0, 0, struct.pack('>I', 0)))
+    minf = _box(b'minf',
+                _full_box(b'vmhd', 0, 1, bytes(8)),
+                _box(b'dinf', _full_box(b'dref', 0, 0, struct.pack('>I', 1), _full_box(b'url ', 0, 1))),
+                stbl)
+    mdia = _box(b'mdia',
+                _full_box(b'mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, TIMESCALE, 0, 0x55C4, 0)),
+                _full_box(b'hdlr', 0, 0, bytes(4), b'vide', bytes(12), b'Live\x00'),
+                minf)
+    trak = _box(b'trak',
+                _full_box(b'tkhd', 0, 3, struct.pack('>IIIII', 0, 0, 1, 0, 0), bytes(8),
+                          struct.pack('>hhHH', 0, 0, 0, 0), matrix, struct.pack('>II', width << 16, height << 16)),
+                mdia)
+    moov = _box(b'moov',
+                _full_box(b'mvhd', 0, 0, struct.pack('>IIIIIH', 0, 0, 1000, 0, 0x10000, 0x0100), bytes(10),
+                          matrix, bytes(24), struct.pack('>I', 2)),
+                trak,
+                _box(b'mvex', _full_box(b'trex', 0, 0, struct.pack('>IIIII', 1, 1, 0, 0, 0))))
+    ftyp = _box(b'ftyp', b'iso5', struct.pack('>I', 512), b'iso5iso6avc1mp41')
+    return ftyp + moov
+
+
+def fragment(sequence, decode_time, duration, sample, keyframe, capture_time):
+    """prft + moof + mdat holding one frame. `sample` is length-prefixed
+    NAL units; `capture_time` is wall-clock seconds."""
+    ntp_seconds = capture_time + NTP_EPOCH_OFFSET
+    ntp = (int(ntp_seconds) << 32) | int((ntp_seconds % 1) * (1 << 32))
+    prft = _full_box(b'prft', 1, 0, struct.pack('>IQQ', 1, ntp, decode_time))
+    flags = 0x02000000 if keyframe else 0x01010000
+    trun_flags = 0x000001 | 0x000100 | 0x000200 | 0x000400
+
+    def moof(data_offset):
+        return _box(b'moof',
+                    _full_box(b'mfhd', 0, 0, struct.pack('>I', sequence)),
+                    _box(b'traf',
+                         _full_box(b'tfhd', 0, 0x020000, struct.pack('>I', 1)),
+                         _full_box(b'tfdt', 1, 0, struct.pack('>Q', decode_time)),
+                         _full_box(b'trun', 0, trun_flags,
+                                   struct.pack('>IiIII', 1, data_offset, duration, len(sample), flags))))
+    size = len(moof(0))
+    return prft + moof(size + 8) + _box(b'mdat', sample)
+
+
+class LiveView:
+    """Packages H.264 access units from the live encoder as fMP4 and fans
+    the fragments out to any number of viewers."""
+    def __init__(self, width, height, framerate):
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.stats = EncoderStats('live', framerate)
+        self.lock = threading.Lock()
+        self.viewers = []
+        self.init = None
+        self.sequence = 0
+        self.first_timestamp_us = None
+
+    def reset(self):
+        """Called when the encoder (re)starts; timestamps restart with it."""
+        with self.lock:
+            self.init = None
+            self.sequence = 0
+            self.first_timestamp_us = None
+        self.stats.reset()
+
+    def write_unit(self, data, keyframe, timestamp_us=None):
+        """Takes one Annex-B access unit from the encoder. `timestamp_us` is
+        the capture time on the monotonic clock, if the encoder knows it."""
+        started = time.perf_counter()
+        now_us = time.monotonic() * 1_000_000
+        if timestamp_us is None or not 0 <= now_us - timestamp_us < 5_000_000:
+            timestamp_us = now_us
+        capture_time = time.time() - (now_us - timestamp_us) / 1_000_000
+
+        sps = pps = None
+        nal_units = []
+        for unit in split_nal_units(bytes(data)):
+            kind = unit[0] & 0x1f
+            if kind == NAL_SPS:
+                sps = unit
+            elif kind == NAL_PPS:
+                pps = unit
+            elif kind != NAL_AUD:
+                nal_units.append(struct.pack('>I', len(unit)) + unit)
+        if not nal_units:
+            return
+
+        with self.lock:
+            if sps and pps and self.init is None:
+                self.init = init_segment(self.width, self.height, sps, pps)
+            if self.init is None:
+                return
+            if self.first_timestamp_us is None:
+                if not keyframe:
+                    return
+                self.first_timestamp_us = timestamp_us
+            self.sequence += 1
+            decode_time = int((timestamp_us - self.first_timestamp_us) * TIMESCALE / 1_000_000)
+            chunk = fragment(self.sequence, decode_time, int(TIMESCALE / self.framerate), b''.join(nal_units),
+                             keyframe, capture_time)
+            viewers = list(self.viewers)
+        for viewer in viewers:
+            viewer.offer(chunk, keyframe)
+        self.stats.record(len(chunk), keyframe, timestamp_us, time.perf_counter() - started)
+
+    def subscribe(self):
+        viewer = _Viewer()
+        with self.lock:
+            self.viewers.append(viewer)
+        return viewer
+
+    def unsubscribe(self, viewer):
+        with self.lock:
+            if viewer in self.viewers:
+                self.viewers.remove(viewer)
+            return len(self.viewers)
+
+    def stream(self, viewer, timeout=5.0):
+        """Generator of response chunks for one viewer: the init segment,
+        then fragments starting at the next keyframe."""
+        while True:
+            try:
+                chunk = viewer.fragments.get(timeout=timeout)
+            except queue.Empty:
+                return
+            with self.lock:
+                init = self.init
+            if not viewer.started:
+                viewer.started = True
+                yield init
+            yield chunk
+
+
+class _Viewer:
+    def __init__(self):
+        self.fragments = queue.Queue(MAX_QUEUED_FRAGMENTS)
+        self.waiting_for_keyframe = True
+        self.started = False
+
+    def offer(self, chunk, keyframe):
+        if self.waiting_for_keyframe:
+            if not keyframe:
+                return
+            self.waiting_for_keyframe = False
+        try:
+            self.fragments.put_nowait(chunk)
+        except queue.Full:
+            # Too slow for the stream: drop what's queued and resume at the
+            # next keyframe rather than fall ever further behind.
+            while not self.fragments.empty():
+                self.fragments.get_nowait()
+            self.waiting_for_keyframe = True
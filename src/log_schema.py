@@ -0,0 +1,174 @@
+import os
+import json
+import datetime
+
+# --- Compact Log Schema (version 2) ---
+# The log file is {"schema": 2, "entries": [...]} with one compact entry per
+# line. Entries use epoch-millisecond timestamps (start_ms/end_ms), an integer
+# status and a precomputed actual_duration in seconds, so nothing needs to be
+# re-parsed when the log is read. Version 1 is the original bare list with ISO
+# 'time'/'end_time' strings and, in the oldest entries, 'video_path'.
+SCHEMA_VERSION = 2
+
+STATUS_RUNNING = 0
+STATUS_PASS = 1
+STATUS_FAIL = 2
+STATUS_NAMES = {STATUS_RUNNING: 'Running', STATUS_PASS: 'Pass', STATUS_FAIL: 'Fail'}
+STATUS_CODES = {name: code for code, name in STATUS_NAMES.items()}
+
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+REQUIRED_FIELDS = ('id', 'sample_code', 'start_ms', 'duration', 'status')
+
+
+def now_ms():
+    return int(datetime.datetime.now(datetime.timezone.utc).timestamp() * 1000)
+
+
+def iso_to_ms(value):
+    dt = datetime.datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=IST)
+    return int(dt.timestamp() * 1000)
+
+
+def ms_to_datetime(ms):
+    return datetime.datetime.fromtimestamp(ms / 1000, IST)
+
+
+def upgrade_entry(log):
+    """Converts a version 1 log entry to the compact schema. Fields the
+    schema doesn't know about are carried over unchanged."""
+    entry = {k: v for k, v in log.items() if k not in ('time', 'end_time', 'video_path') and v is not None}
+    if log.get('time'):
+        entry['start_ms'] = iso_to_ms(log['time'])
+    if log.get('end_time'):
+        entry['end_ms'] = iso_to_ms(log['end_time'])
+    if isinstance(log.get('status'), str):
+        entry['status'] = STATUS_CODES.get(log['status'], log['status'])
+    if not log.get('video_filename') and log.get('video_path'):
+        entry['video_filename'] = os.path.basename(log['video_path'])
+    if 'start_ms' in entry and 'end_ms' in entry:
+        entry['actual_duration'] = (entry['end_ms'] - entry['start_ms']) // 1000
+    return entry
+
+
+def to_api(entry):
+    """Returns the JSON shape the web pages and API clients use: ISO 'time'
+    and 'end_time' strings and a status name."""
+    log = dict(entry)
+    start_ms = log.pop('start_ms', None)
+    end_ms = log.pop('end_ms', None)
+    log['time'] = ms_to_datetime(start_ms).isoformat() if start_ms is not None else None
+    if end_ms is not None:
+        log['end_time'] = ms_to_datetime(end_ms).isoformat()
+    log['status'] = STATUS_NAMES.get(log.get('status'), log.get('status'))
+    return log
+
+
+def validate_entry(entry):
+    """Returns a list of problems with a compact entry (empty if valid)."""
+    errors = [f"missing {field}" for field in REQUIRED_FIELDS if field not in entry]
+    if entry.get('status') not in STATUS_NAMES and 'status' in entry:
+        errors.append(f"unknown status {entry['status']!r}")
+    for field in ('id', 'start_ms', 'end_ms', 'duration', 'actual_duration'):
+        if field in entry and not isinstance(entry[field], int):
+            errors.append(f"{field} is not an integer")
+    if 'end_ms' in entry and 'start_ms' in entry and entry['end_ms'] < entry['start_ms']:
+        errors.append("end_ms is before start_ms")
+    return errors
+
+
+def dumps_entry(entry):
+    return json.dumps(entry, separators=(',', ':'), ensure_ascii=False)
+
+
+def write_entries(f, entries):
+    """Writes entries (any iterable) as a version 2 log file."""
+    write_serialized(f, (dumps_entry(entry) for entry in entries))
+
+
+def write_serialized(f, lines):
+    """Writes already-serialized entries as a version 2 log file."""
+    f.write('{"schema":%d,"entries":[' % SCHEMA_VERSION)
+    first = True
+    for line in lines:
+        f.write('\n' if first else ',\n')
+        f.write(line)
+        first = False
+    f.write('\n]}\n')
+
+
+def load_entries(data):
+    """Returns compact entries from a parsed log file of either version."""
+    if isinstance(data, dict):
+        return data.get('entries', [])
+    return [upgrade_entry(log) for log in data]
+
+
+# --- Streaming Reader ---
+_CHUNK_SIZE = 1 << 16
+
+
+def iter_log_file(path):
+    """Yields (entry, version) for each entry of a log file of either version
+    without loading the whole file. Version 1 entries are yielded as-is."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = f.read(_CHUNK_SIZE)
+        pos = 0
+        eof = False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def skip_whitespace():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n':
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        skip_whitespace()
+        if pos >= len(buf):
+            return
+        if buf[pos] == '[':
+            version = 1
+        elif buf[pos] == '{':
+            version = SCHEMA_VERSION
+            # The header is small; find the start of the entries array.
+            while '"entries"' not in buf[pos:] and not eof:
+                fill()
+            start = buf.find('"entries"', pos)
+            if start < 0:
+                raise ValueError('log file has no "entries" array')
+            pos = buf.index('[', start)
+        else:
+            raise ValueError('log file is neither a list nor a schema object')
+        pos += 1
+
+        while True:
+            skip_whitespace()
+            if pos >= len(buf):
+                raise ValueError('log file ended inside the entries array')
+            if buf[pos] == ']':
+                return
+            if buf[pos] == ',':
+                pos += 1
+                skip_whitespace()
+            while True:
+                try:
+                    entry, end = decoder.raw_decode(buf, pos)
+                    break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    fill()
+            pos = end
+            yield entry, version
@@ -0,0 +1,157 @@
+import bisect
+import threading
+
+# In-memory search index over the test log, so the history page can find a
+# run by sample code, date and status without downloading every entry.
+#
+# Sample codes are matched case-insensitively. Prefix queries bisect a sorted
+# list of the distinct codes; substring queries of three or more characters
+# intersect trigram postings and then confirm each candidate code, and
+# shorter ones scan the distinct codes. Entries are kept ordered by start
+# time, so a date range is a slice and results come out newest first.
+#
+# The index is updated from write_logs() like the change feed: only entries
+# whose serialized form changed are re-indexed.
+TRIGRAM = 3
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def _trigrams(code):
+    return {code[i:i + TRIGRAM] for i in range(len(code) - TRIGRAM + 1)}
+
+
+class LogSearchIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}             # id -> entry
+        self.serialized = {}          # id -> compact JSON, to detect changes
+        self.starts = []              # start_ms of every entry, ascending...
+        self.start_ids = []           # ...and the matching ids
+        self.code_ids = {}            # lowercased sample code -> set of ids
+        self.codes = []               # sorted distinct lowercased codes
+        self.trigram_codes = {}       # trigram -> set of codes
+        self.status_ids = {}          # status code -> set of ids
+
+    def record(self, ids, serialized, entries):
+        """Brings the index in line with the log as written. Arguments are
+        parallel lists of entry ids, compact JSON and entries."""
+        with self.lock:
+            seen = set(ids)
+            for entry_id in [entry_id for entry_id in self.entries if entry_id not in seen]:
+                self._remove(entry_id)
+            changed = [(entry_id, entry_json, entry) for entry_id, entry_json, entry in zip(ids, serialized, entries)
+                       if self.serialized.get(entry_id) != entry_json]
+            # Loading a whole log is one sort rather than many insertions.
+            bulk = len(changed) > 64
+            for entry_id, entry_json, entry in changed:
+                self._remove(entry_id)
+                self._add(entry_id, entry_json, entry, bulk)
+            if bulk:
+                order = sorted(range(len(self.starts)), key=lambda i: (self.starts[i], self.start_ids[i]))
+                self.starts = [self.starts[i] for i in order]
+                self.start_ids = [self.start_ids[i] for i in order]
+                self.codes.sort()
+
+    def _add(self, entry_id, entry_json, entry, bulk=False):
+        self.entries[entry_id] = entry
+        self.serialized[entry_id] = entry_json
+        start_ms = entry.get('start_ms') or 0
+        if bulk:
+            self.starts.append(start_ms)
+            self.start_ids.append(entry_id)
+        else:
+            i = bisect.bisect_right(self.starts, start_ms)
+            self.starts.insert(i, start_ms)
+            self.start_ids.insert(i, entry_id)
+        self.status_ids.setdefault(entry.get('status'), set()).add(entry_id)
+        code = str(entry.get('sample_code') or '').lower()
+        ids = self.code_ids.get(code)
+        if ids is None:
+            ids = self.code_ids[code] = set()
+            if bulk:
+                self.codes.append(code)
+            else:
+                bisect.insort(self.codes, code)
+            for trigram in _trigrams(code):
+                self.trigram_codes.setdefault(trigram, set()).add(code)
+        ids.add(entry_id)
+
+    def _remove(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        del self.serialized[entry_id]
+        start_ms = entry.get('start_ms') or 0
+        i = bisect.bisect_left(self.starts, start_ms)
+        while self.start_ids[i] != entry_id:
+            i += 1
+        del self.starts[i]
+        del self.start_ids[i]
+        self.status_ids[entry.get('status')].discard(entry_id)
+        code = str(entry.get('sample_code') or '').lower()
+        ids = self.code_ids[code]
+        ids.discard(entry_id)
+        if not ids:
+            del self.code_ids[code]
+            del self.codes[bisect.bisect_left(self.codes, code)]
+            for trigram in _trigrams(code):
+                codes = self.trigram_codes[trigram]
+                codes.discard(code)
+                if not codes:
+                    del self.trigram_codes[trigram]
+
+    def _matching_codes(self, query, prefix):
+        if prefix:
+            start = bisect.bisect_left(self.codes, query)
+            end = bisect.bisect_left(self.codes, query + '\U0010ffff')
+            return self.codes[start:end]
+        if len(query) < TRIGRAM:
+            return [code for code in self.codes if query in code]
+        postings = sorted((self.trigram_codes.get(trigram, ()) for trigram in _trigrams(query)), key=len)
+        if not postings[0]:
+            return []
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return [code for code in candidates if query in code]
+
+    def search(self, sample_code=None, prefix=False, start_ms=None, end_ms=None, status=None,
+               limit=DEFAULT_LIMIT, offset=0):
+        """Returns (total, entries): the number of matches and one page of
+        them, newest first. `status` is a set of status codes; the time range
+        is on start_ms and end_ms is exclusive."""
+        with self.lock:
+            low = bisect.bisect_left(self.starts, start_ms) if start_ms is not None else 0
+            high = bisect.bisect_left(self.starts, end_ms) if end_ms is not None else len(self.starts)
+            high = max(low, high)
+
+            candidates = None
+            if sample_code:
+                codes = self._matching_codes(sample_code.lower(), prefix)
+                candidates = set().union(*map(self.code_ids.__getitem__, codes))
+            if status is not None:
+                by_status = set().union(*(self.status_ids.get(code, ()) for code in status))
+                candidates = by_status if candidates is None else candidates & by_status
+
+            wanted = offset + limit
+            if candidates is None:
+                total = high - low
+                page_ids = self.start_ids[max(low, high - wanted):high][::-1][offset:]
+            elif len(candidates) * 16 < high - low:
+                # Few matches: sort them rather than walk the time range.
+                matches = sorted(((self.entries[i].get('start_ms') or 0, i) for i in candidates), reverse=True)
+                if start_ms is not None or end_ms is not None:
+                    matches = [key for key in matches if (start_ms is None or key[0] >= start_ms) and
+                               (end_ms is None or key[0] < end_ms)]
+                total = len(matches)
+                page_ids = [entry_id for _, entry_id in matches[offset:wanted]]
+            else:
+                in_range = self.start_ids[low:high]
+                total = len(candidates) if high - low == len(self.starts) else len(candidates.intersection(in_range))
+                page_ids = []
+                for entry_id in reversed(in_range):
+                    if entry_id in candidates:
+                        page_ids.append(entry_id)
+                        if len(page_ids) == wanted:
+                            break
+                page_ids = page_ids[offset:]
+            return total, [self.entries[entry_id] for entry_id in page_ids]
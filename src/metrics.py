@@ -0,0 +1,208 @@
+import bisect
+import threading
+import time
+
+
+class Histogram:
+    """A fixed-bucket histogram. Observing is a bisect and two additions, so
+    it is cheap enough for per-frame use on the encoder threads."""
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+            self.max = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def cumulative(self):
+        """Returns (bounds, cumulative counts, count, sum); '+Inf' is last."""
+        with self.lock:
+            counts = list(self.counts)
+            total, value_sum = self.count, self.sum
+        running = 0
+        cumulative = []
+        for n in counts:
+            running += n
+            cumulative.append(running)
+        return list(self.buckets) + ['+Inf'], cumulative, total, value_sum
+
+    def snapshot(self):
+        """Returns cumulative bucket counts keyed by upper bound ('+Inf' last)."""
+        bounds, cumulative, total, value_sum = self.cumulative()
+        with self.lock:
+            value_max = self.max
+        return {
+            'buckets': {str(b): n for b, n in zip(bounds, cumulative)},
+            'count': total,
+            'sum': round(value_sum, 3),
+            'max': round(value_max, 3),
+            'mean': round(value_sum / total, 3) if total else 0.0
+        }
+
+
+# --- Prometheus Exposition ---
+# Histograms registered here are rendered by render_metrics() on every scrape;
+# everything else is passed in as already-collected samples, so a scrape
+# costs no more than formatting text.
+LATENCY_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_histograms = {}
+_histogram_help = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name, documentation, buckets=LATENCY_BUCKETS_S, **labels):
+    """Returns the registered histogram for a name and label set, creating it
+    on first use."""
+    key = (name, tuple(sorted(labels.items())))
+    with _registry_lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram(buckets)
+            _histogram_help[name] = documentation
+        return _histograms[key]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _render_histogram(lines, name, labels, hist):
+    bounds, cumulative, total, value_sum = hist.cumulative()
+    for bound, n in zip(bounds, cumulative):
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {n}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value_sum)}")
+    lines.append(f"{name}_count{_format_labels(labels)} {total}")
+
+
+def render_metrics(samples, extra_histograms=()):
+    """Renders the Prometheus text exposition format.
+
+    `samples` is a list of (name, help, type, [(labels dict, value), ...]);
+    samples with a value of None are skipped. `extra_histograms` is a list of
+    (name, help, labels dict, Histogram) not kept in the registry."""
+    lines = []
+    for name, documentation, kind, values in samples:
+        values = [(labels, v) for labels, v in values if v is not None]
+        if not values:
+            continue
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in values:
+            lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+
+    with _registry_lock:
+        registered = sorted(_histograms.items())
+        documentation = dict(_histogram_help)
+    grouped = {}
+    for (name, labels), hist in registered:
+        grouped.setdefault(name, []).append((labels, hist))
+    for name, help_text, labels, hist in extra_histograms:
+        documentation.setdefault(name, help_text)
+        grouped.setdefault(name, []).append((tuple(sorted(labels.items())), hist))
+    for name, entries in grouped.items():
+        lines.append(f"# HELP {name} {documentation[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, hist in entries:
+            _render_histogram(lines, name, labels, hist)
+    return '\n'.join(lines) + '\n'
+
+
+# --- Encoder Health ---
+FRAME_GAP_BUCKETS_MS = (5, 10, 20, 34, 50, 67, 100, 200, 500, 1000)
+WRITE_LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class EncoderStats:
+    """Frame, byte, gap and write-latency statistics for one encoder output.
+
+    A frame gap longer than 1.5 expected frame intervals is counted as
+    dropped frames, one for each missing interval."""
+    def __init__(self, name, framerate):
+        self.name = name
+        self.framerate = framerate
+        self.frame_interval_us = 1_000_000 / framerate
+        self.frame_gap_ms = Histogram(FRAME_GAP_BUCKETS_MS)
+        self.write_latency_ms = Histogram(WRITE_LATENCY_BUCKETS_MS)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.frames = 0
+            self.keyframes = 0
+            self.bytes = 0
+            self.dropped_frames = 0
+            self.started = time.monotonic()
+            self.last_timestamp_us = None
+        self.frame_gap_ms.reset()
+        self.write_latency_ms.reset()
+
+    def record(self, size, keyframe, timestamp_us, write_seconds):
+        """Records one frame written by the encoder's output."""
+        if timestamp_us is None:
+            timestamp_us = time.monotonic() * 1_000_000
+        with self.lock:
+            self.frames += 1
+            self.bytes += size
+            if keyframe:
+                self.keyframes += 1
+            gap_us = None
+            if self.last_timestamp_us is not None:
+                gap_us = timestamp_us - self.last_timestamp_us
+                if gap_us > 1.5 * self.frame_interval_us:
+                    self.dropped_frames += int(round(gap_us / self.frame_interval_us)) - 1
+            self.last_timestamp_us = timestamp_us
+        if gap_us is not None:
+            self.frame_gap_ms.observe(gap_us / 1000)
+        self.write_latency_ms.observe(write_seconds * 1000)
+
+    def set_framerate(self, framerate):
+        """Changes the expected frame rate used to estimate dropped frames."""
+        with self.lock:
+            self.framerate = framerate
+            self.frame_interval_us = 1_000_000 / framerate
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            frames, keyframes = self.frames, self.keyframes
+            total_bytes, dropped = self.bytes, self.dropped_frames
+        return {
+            'encoder': self.name,
+            'elapsed_seconds': round(elapsed, 1),
+            'frames': frames,
+            'keyframes': keyframes,
+            'bytes': total_bytes,
+            'dropped_frames': dropped,
+            'fps': round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+            'bytes_per_second': round(total_bytes / elapsed) if elapsed > 0 else 0,
+            'frame_gap_ms': self.frame_gap_ms.snapshot(),
+            'write_latency_ms': self.write_latency_ms.snapshot()
+        }
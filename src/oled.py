@@ -56,7 +56,7 @@ class OLEDDisplay:
         if not self.is_active or (self._update_thread and self._update_thread.is_alive()):
             return
         self._stop_event.clear()
-        self._update_thread = threading.Thread(target=self._update_status_loop)
+        self._update_thread = threading.Thread(target=self._update_status_loop, name='oled-updater')
         self._update_thread.daemon = True
         self._update_thread.start()
 
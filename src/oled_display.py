@@ -7,18 +7,30 @@ from PIL import Image, ImageDraw, ImageFont
 import adafruit_ssd1306
 import subprocess
 import threading
+from src.metrics import histogram
+
+_refresh_seconds = histogram('oled_refresh_seconds', 'Time to render and push one OLED status screen.')
 
 class OLEDDisplay:
     def __init__(self, i2c_port=1, i2c_address=0x3C):
-        print("Initializing OLEDDisplay...")
+        self.i2c_address = i2c_address
         self.is_active = False
         self.device = None
+        self.WIDTH = 128
+        self.HEIGHT = 64
+        # Lengthened by the thermal governor when the Pi runs hot.
+        self.refresh_seconds = 1.0
+        self._stop_event = threading.Event()
+        self._update_thread = None
+
+    def initialize(self):
+        """Opens the display over I2C. Called by boot warm-up; the display
+        stays inactive (every method a no-op) if it isn't connected."""
+        print("Initializing OLEDDisplay...")
         try:
-            self.WIDTH = 128
-            self.HEIGHT = 64
             self.i2c = board.I2C()
             time.sleep(0.1)
-            self.device = adafruit_ssd1306.SSD1306_I2C(self.WIDTH, self.HEIGHT, self.i2c, addr=i2c_address)
+            self.device = adafruit_ssd1306.SSD1306_I2C(self.WIDTH, self.HEIGHT, self.i2c, addr=self.i2c_address)
             self.is_active = True
             self.image = Image.new('1', (self.WIDTH, self.HEIGHT))
             self.draw = ImageDraw.Draw(self.image)
@@ -29,10 +41,9 @@ class OLEDDisplay:
             except IOError:
                 print("Font file not found. Using default font.")
                 self.font = ImageFont.load_default()
-            self._stop_event = threading.Event()
-            self._update_thread = None
         except Exception as e:
             print(f"Failed to initialize OLED display: {e}")
+        return self.is_active
 
     def display_initializing(self):
         if not self.is_active:
@@ -44,14 +55,16 @@ class OLEDDisplay:
 
     def _update_status_loop(self):
         while not self._stop_event.is_set():
+            started = time.perf_counter()
             self.display_system_status()
-            time.sleep(1.0)
+            _refresh_seconds.observe(time.perf_counter() - started)
+            self._stop_event.wait(self.refresh_seconds)
 
     def start_status_updates(self):
         if not self.is_active or (self._update_thread and self._update_thread.is_alive()):
             return
         self._stop_event.clear()
-        self._update_thread = threading.Thread(target=self._update_status_loop)
+        self._update_thread = threading.Thread(target=self._update_status_loop, name='oled-updater')
         self._update_thread.daemon = True
         self._update_thread.start()
 
@@ -0,0 +1,90 @@
+import time
+import datetime
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from src.metrics import Histogram
+
+# Burned-in evidence overlay (sample code, wall-clock time, elapsed time).
+# Glyphs are rasterized once into boolean masks; the text mask is only
+# recomposed when the text changes (once a second), and each frame costs two
+# NumPy writes into a small fixed region of the buffer, never a PIL redraw.
+FONT_PATH = 'src/PixelOperator.ttf'
+GLYPHS = '0123456789:-+./_ ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz?'
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+MARGIN = 8
+OVERLAY_COST_BUCKETS_US = (50, 100, 200, 300, 500, 1000, 2000, 5000)
+
+
+class GlyphAtlas:
+    """Monospaced boolean bitmaps for a fixed character set."""
+    def __init__(self, font_path=FONT_PATH, size=16):
+        try:
+            font = ImageFont.truetype(font_path, size)
+        except IOError:
+            font = ImageFont.load_default()
+        widths = [font.getbbox(c)[2] for c in GLYPHS]
+        self.cell_width = max(widths) + 1
+        self.cell_height = size + 2
+        self.masks = {}
+        for char in GLYPHS:
+            img = Image.new('L', (self.cell_width, self.cell_height), 0)
+            ImageDraw.Draw(img).text((0, 0), char, font=font, fill=255)
+            self.masks[char] = np.asarray(img) > 127
+
+    def render(self, text):
+        fallback = self.masks['?']
+        return np.hstack([self.masks.get(c, fallback) for c in text])
+
+
+class FrameOverlay:
+    """Text overlay for one test, drawn onto the lores (YUV420) and main
+    (RGB-type) camera buffers from picamera2's pre_callback."""
+    def __init__(self, sample_code, started, atlas, scale=2):
+        self.sample_code = sample_code[:32]
+        self.started = started
+        self.atlas = atlas
+        self.scale = scale
+        self._second = None
+        self._mask = None
+        self._mask_main = None
+        self.cost_us = Histogram(OVERLAY_COST_BUCKETS_US)
+
+    def _compose(self, now):
+        second = int(now)
+        if second == self._second:
+            return
+        elapsed = max(second - int(self.started), 0)
+        h, rem = divmod(elapsed, 3600)
+        m, s = divmod(rem, 60)
+        lines = [
+            self.sample_code,
+            datetime.datetime.fromtimestamp(second, IST).strftime('%Y-%m-%d %H:%M:%S'),
+            f"T+{h:02d}:{m:02d}:{s:02d}"
+        ]
+        rendered = [self.atlas.render(line) for line in lines]
+        width = max(r.shape[1] for r in rendered)
+        mask = np.vstack([np.pad(r, ((0, 0), (0, width - r.shape[1]))) for r in rendered])
+        self._mask = mask
+        self._mask_main = mask.repeat(self.scale, axis=0).repeat(self.scale, axis=1)
+        self._second = second
+
+    @staticmethod
+    def _draw(array, mask):
+        h = min(mask.shape[0], array.shape[0] - MARGIN)
+        w = min(mask.shape[1], array.shape[1] - MARGIN)
+        if h <= 0 or w <= 0:
+            return
+        region = array[MARGIN:MARGIN + h, MARGIN:MARGIN + w]
+        region[...] = 0
+        region[mask[:h, :w]] = 255
+
+    def apply(self, main_array=None, lores_array=None):
+        """Draws the overlay in place. For the YUV420 lores buffer only the
+        luma plane at the top of the array is written."""
+        started = time.perf_counter()
+        self._compose(time.time())
+        if lores_array is not None:
+            self._draw(lores_array, self._mask)
+        if main_array is not None:
+            self._draw(main_array, self._mask_main)
+        self.cost_us.observe((time.perf_counter() - started) * 1_000_000)
@@ -0,0 +1,61 @@
+import sys
+import threading
+import time
+import traceback
+
+# Sampling profiler for on-demand use. Nothing is installed or running until a
+# profile is requested, so there is no overhead when it is not in use.
+MAX_PROFILE_SECONDS = 60
+_profile_lock = threading.Lock()
+
+
+def _frame_stack(frame):
+    """Returns the stack of a frame as 'file:function' names, outermost first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = code.co_filename.rsplit('/', 1)[-1]
+        names.append(f"{filename}:{code.co_name}")
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+def sample_stacks(seconds, interval=0.01):
+    """Samples every thread's stack for `seconds` and returns the result in
+    collapsed-stack format ('thread;outer;...;inner count' per line), which
+    flamegraph.pl and speedscope read directly.
+
+    Returns None if another profile is already running."""
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        counts = {}
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = [names.get(thread_id, str(thread_id))] + _frame_stack(frame)
+                key = ';'.join(stack)
+                counts[key] = counts.get(key, 0) + 1
+            time.sleep(interval)
+        lines = [f"{stack} {n}" for stack, n in sorted(counts.items(), key=lambda item: -item[1])]
+        return '\n'.join(lines) + '\n'
+    finally:
+        _profile_lock.release()
+
+
+def dump_thread_stacks():
+    """Returns a text dump of every thread's current stack, by thread name."""
+    frames = sys._current_frames()
+    sections = []
+    for thread in threading.enumerate():
+        frame = frames.get(thread.ident)
+        header = f"Thread {thread.name} (ident={thread.ident}, daemon={thread.daemon})"
+        stack = ''.join(traceback.format_stack(frame)) if frame else '  <no frame>\n'
+        sections.append(header + '\n' + stack)
+    return '\n'.join(sections)
@@ -0,0 +1,120 @@
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+from src.video_tools import proxy_command
+
+# Low-bitrate proxy renditions for remote review, cached next to the original
+# as <name>.proxy.mp4. Proxies are disposable: when space runs short they are
+# evicted (oldest first) long before any original would be touched.
+PROXY_SUFFIX = '.proxy.mp4'
+PROXY_CACHE_MAX_BYTES = 2 * 1024 ** 3
+MIN_FREE_BYTES = 1024 ** 3
+_POLL_SECONDS = 0.5
+
+
+def proxy_path_for(video_path):
+    return os.path.splitext(video_path)[0] + PROXY_SUFFIX
+
+
+class ProxyTranscoder:
+    """Transcodes proxies one at a time on a background thread at the lowest
+    CPU priority. While `is_busy()` is true (a test is recording) the ffmpeg
+    process is paused with SIGSTOP so it can't compete with the recording."""
+    def __init__(self, directory, is_busy):
+        self.directory = directory
+        self.is_busy = is_busy
+        self.jobs = queue.Queue()
+        self.queued = set()
+        self.lock = threading.Lock()
+        self.current = None
+        self.paused = False
+        self.thread = None
+
+    def submit(self, video_filename):
+        """Queues a proxy for a finished recording, if it doesn't have one."""
+        video_path = os.path.join(self.directory, video_filename)
+        with self.lock:
+            if video_filename in self.queued or os.path.exists(proxy_path_for(video_path)):
+                return
+            self.queued.add(video_filename)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='proxy-transcoder', daemon=True)
+                self.thread.start()
+        self.jobs.put(video_filename)
+
+    def status(self):
+        return {'current': self.current, 'paused': self.paused, 'queued': self.jobs.qsize()}
+
+    def _run(self):
+        while True:
+            video_filename = self.jobs.get()
+            try:
+                self._transcode(video_filename)
+            except Exception as e:
+                print(f"Error creating proxy for {video_filename}: {e}")
+            finally:
+                with self.lock:
+                    self.queued.discard(video_filename)
+                self.current = None
+
+    def _transcode(self, video_filename):
+        video_path = os.path.join(self.directory, video_filename)
+        if not os.path.exists(video_path):
+            return
+        proxy_path = proxy_path_for(video_path)
+        tmp_path = proxy_path + '.tmp.mp4'
+        self.evict()
+        self.current = video_filename
+        # `nice` rather than preexec_fn, which can deadlock a threaded parent.
+        process = subprocess.Popen(
+            ['nice', '-n', '19'] + proxy_command(video_path, tmp_path),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        # Drain stderr on its own thread so a paused reader can't block ffmpeg.
+        stderr_lines = []
+        reader = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+        reader.start()
+        while process.poll() is None:
+            busy = self.is_busy()
+            if busy and not self.paused:
+                process.send_signal(signal.SIGSTOP)
+                self.paused = True
+            elif not busy and self.paused:
+                process.send_signal(signal.SIGCONT)
+                self.paused = False
+            time.sleep(_POLL_SECONDS)
+        self.paused = False
+        reader.join()
+        if process.returncode == 0:
+            os.replace(tmp_path, proxy_path)
+            print(f"Proxy created: {os.path.basename(proxy_path)}")
+        else:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"ffmpeg error creating proxy for {video_filename}: {b''.join(stderr_lines[-5:]).decode(errors='replace')}")
+
+    def evict(self, max_bytes=PROXY_CACHE_MAX_BYTES, min_free_bytes=MIN_FREE_BYTES):
+        """Deletes the oldest proxies until the cache fits in `max_bytes` and
+        the disk has at least `min_free_bytes` free."""
+        proxies = []
+        for name in os.listdir(self.directory):
+            if name.endswith(PROXY_SUFFIX):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                proxies.append((stat.st_mtime, stat.st_size, path))
+        proxies.sort()
+        total = sum(size for _, size, _ in proxies)
+        while proxies and (total > max_bytes or _free_bytes(self.directory) < min_free_bytes):
+            _, size, path = proxies.pop(0)
+            os.remove(path)
+            total -= size
+            print(f"Evicted proxy {os.path.basename(path)}")
+
+
+def _free_bytes(directory):
+    stat = os.statvfs(directory)
+    return stat.f_bavail * stat.f_frsize
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+from src import conversion
+from src.video_tools import remux_h264_to_mp4, concat_mp4, DEFAULT_FRAMERATE
+from src.integrity import HashingWriter, sha256_file
+
+# Length of each recording segment. A crash or power loss costs at most the
+# segment that was being written when it happened.
+SEGMENT_SECONDS = 60
+
+
+def segment_index_path(video_path):
+    """Path of the segment index that belongs to a test's final MP4."""
+    return os.path.splitext(video_path)[0] + '.segments.json'
+
+
+class SegmentIndex:
+    """Tracks the segments of one recording in a small JSON file next to the
+    video, so a crashed recording can be finalized on the next start.
+
+    Segment status moves recording -> pending -> finalized (or failed); the
+    index itself moves recording -> complete -> joined."""
+    def __init__(self, video_path, framerate=DEFAULT_FRAMERATE, segment_seconds=SEGMENT_SECONDS, on_finalized=None):
+        self.video_path = video_path
+        self.on_finalized = on_finalized
+        self.directory = os.path.dirname(video_path)
+        self.path = segment_index_path(video_path)
+        self.lock = threading.Lock()
+        self.data = {
+            'video_filename': os.path.basename(video_path),
+            'framerate': framerate,
+            'segment_seconds': segment_seconds,
+            'status': 'recording',
+            'hashed_bytes': 0,
+            'hash_seconds': 0.0,
+            'segments': []
+        }
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        index = cls(os.path.join(os.path.dirname(path), data['video_filename']))
+        index.data = data
+        return index
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _segment_base(self, number):
+        base = os.path.splitext(self.data['video_filename'])[0]
+        return f"{base}.seg{number:04d}"
+
+    def new_segment(self):
+        """Registers the next segment and returns the path to record it to."""
+        with self.lock:
+            number = len(self.data['segments'])
+            base = self._segment_base(number)
+            self.data['segments'].append({
+                'index': number,
+                'h264': base + '.h264',
+                'mp4': base + '.mp4',
+                'started': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'status': 'recording'
+            })
+            self._save()
+            return os.path.join(self.directory, base + '.h264')
+
+    def segment_closed(self, h264_path, sha256=None, size=None, hash_seconds=0.0):
+        """Marks a finished segment pending, records the hash computed while
+        it was written, and queues its finalization."""
+        name = os.path.basename(h264_path)
+        with self.lock:
+            segment = next(s for s in self.data['segments'] if s['h264'] == name)
+            segment['status'] = 'pending'
+            if sha256:
+                segment['sha256'] = sha256
+                segment['bytes'] = size
+                self.data['hashed_bytes'] += size
+                self.data['hash_seconds'] += hash_seconds
+            self._save()
+        conversion.submit(self._finalize_segment, segment['index'])
+
+    def recording_complete(self, stream_sha256=None):
+        """Marks the recording finished and queues the join behind any
+        segment finalizations that are still waiting."""
+        with self.lock:
+            self.data['status'] = 'complete'
+            if stream_sha256:
+                self.data['stream_sha256'] = stream_sha256
+            self._save()
+        conversion.submit(self._join)
+
+    def _set_segment_status(self, number, status):
+        with self.lock:
+            self.data['segments'][number]['status'] = status
+            self._save()
+
+    def _finalize_segment(self, number):
+        segment = self.data['segments'][number]
+        h264_path = os.path.join(self.directory, segment['h264'])
+        mp4_path = os.path.join(self.directory, segment['mp4'])
+        if not os.path.exists(h264_path) or os.path.getsize(h264_path) == 0:
+            print(f"Segment {segment['h264']} is missing or empty, skipping.")
+            self._set_segment_status(number, 'failed')
+            return
+        if 'sha256' not in segment:
+            # Interrupted by a crash before the inline hash was recorded.
+            segment['sha256'], _ = sha256_file(h264_path)
+            segment['bytes'] = os.path.getsize(h264_path)
+            segment['hashed_after_recovery'] = True
+        ok, stderr = remux_h264_to_mp4(h264_path, mp4_path, framerate=self.data['framerate'])
+        if ok:
+            os.remove(h264_path)
+            self._set_segment_status(number, 'finalized')
+            print(f"Finalized segment {segment['mp4']}")
+        else:
+            self._set_segment_status(number, 'failed')
+            print(f"ffmpeg error finalizing {segment['h264']}: {stderr}")
+
+    def _join(self):
+        """Combines the finalized segments into the test's single MP4."""
+        finalized = [os.path.join(self.directory, s['mp4'])
+                     for s in self.data['segments'] if s['status'] == 'finalized']
+        if not finalized:
+            print(f"No finalized segments for {self.data['video_filename']}.")
+            return
+        if len(finalized) == 1:
+            os.replace(finalized[0], self.video_path)
+        else:
+            ok, stderr = concat_mp4(finalized, self.video_path)
+            if not ok:
+                # Leave the segments in place; each one is a playable MP4.
+                print(f"ffmpeg error joining {self.data['video_filename']}: {stderr}")
+                return
+            for path in finalized:
+                os.remove(path)
+        # Hashed straight after it is written, while it is still in the page cache.
+        video_sha256, seconds = sha256_file(self.video_path)
+        with self.lock:
+            self.data['status'] = 'joined'
+            self.data['video_sha256'] = video_sha256
+            self.data['video_hash_seconds'] = round(seconds, 3)
+            self._save()
+        print(f"Recording finalized: {self.video_path}")
+        if self.on_finalized:
+            self.on_finalized(self.integrity())
+
+    def integrity(self):
+        """The recording's hashes and the cost of computing them inline."""
+        data = self.data
+        hashed_bytes = data.get('hashed_bytes', 0)
+        return {
+            'video_sha256': data.get('video_sha256'),
+            'stream_sha256': data.get('stream_sha256'),
+            'segments': [{'index': s['index'], 'sha256': s.get('sha256'), 'bytes': s.get('bytes')}
+                         for s in data['segments'] if s['status'] == 'finalized'],
+            'hashed_bytes': hashed_bytes,
+            'inline_hash_seconds': round(data.get('hash_seconds', 0.0), 3),
+            'inline_hash_ns_per_byte': round(data.get('hash_seconds', 0.0) * 1e9 / hashed_bytes, 3) if hashed_bytes else None,
+            'video_hash_seconds': data.get('video_hash_seconds')
+        }
+
+
+class SegmentWriter:
+    """Writes an H.264 stream as a series of fixed-length segment files.
+
+    A new segment is only started on a keyframe, so every segment decodes on
+    its own. Each closed segment is handed to the SegmentIndex, which
+    finalizes it in the background while the next one records. Bytes are
+    SHA-256 hashed as they are written, per segment and for the whole stream.
+
+    With a WriteBehindWriter, files are written through its buffer and a
+    segment is handed off only once it is fully on storage."""
+    def __init__(self, segment_index, segment_seconds=SEGMENT_SECONDS, writer=None):
+        self.segment_index = segment_index
+        self.segment_seconds = segment_seconds
+        self.writer = writer
+        self.stream_hasher = hashlib.sha256()
+        self.file = None
+        self._path = None
+        self._segment_started = None
+        self._open_next()
+
+    def _open_next(self):
+        self._path = self.segment_index.new_segment()
+        raw = self.writer.open(self._path) if self.writer is not None else open(self._path, 'wb')
+        self.file = HashingWriter(raw, self.stream_hasher)
+        self._segment_started = time.monotonic()
+
+    def _hand_off(self, finished_file, finished_path):
+        def closed():
+            self.segment_index.segment_closed(finished_path, sha256=finished_file.hexdigest(),
+                                              size=finished_file.bytes, hash_seconds=finished_file.hash_seconds)
+        if self.writer is not None:
+            # Closing only queues the close; hand off once the bytes are written.
+            finished_file.file.close(on_closed=closed)
+        else:
+            finished_file.close()
+            closed()
+
+    def roll(self, keyframe):
+        """Called before each frame is written. Starts a new segment if this
+        frame is a keyframe and the current segment is full; returns True
+        if `file` changed."""
+        if not keyframe or time.monotonic() - self._segment_started < self.segment_seconds:
+            return False
+        finished_file, finished_path = self.file, self._path
+        self._open_next()
+        self._hand_off(finished_file, finished_path)
+        return True
+
+    def close_segment(self):
+        """Closes the segment being written and hands it off for finalization."""
+        if self.file is not None:
+            self._hand_off(self.file, self._path)
+            self.file = None
+
+
+def recover_segments(directory):
+    """Finalizes recordings left unfinished by a crash or power loss."""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if not name.endswith('.segments.json'):
+            continue
+        try:
+            index = SegmentIndex.load(os.path.join(directory, name))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not read segment index {name}: {e}")
+            continue
+        if index.data['status'] == 'joined':
+            continue
+        print(f"Recovering interrupted recording {index.data['video_filename']}")
+        for segment in index.data['segments']:
+            if segment['status'] in ('recording', 'pending'):
+                segment['status'] = 'pending'
+                conversion.submit(index._finalize_segment, segment['index'])
+        index.recording_complete()
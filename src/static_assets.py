@@ -0,0 +1,171 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import threading
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Pages and static files, precompressed once and served from memory.
+#
+# Files under /static/ get a content hash in their name
+# (lineawesome-webfont.3f2a9c1e0b7d.ttf) and are served as immutable, so a
+# browser never asks for them again. Pages keep their URLs, so they are
+# served with a strong ETag and `no-cache`: a repeat load is a conditional
+# request answered with an empty 304. References to /static/<name> in a
+# page are rewritten to the fingerprinted name before the page is hashed.
+#
+# Each file is stored gzip- and (when the brotli module is installed)
+# brotli-compressed in the build directory, named by its hash, so a restart
+# only compresses what changed. A page edited while the server runs is
+# rebuilt on its next request.
+PAGES = ('index.html', 'history.html', 'system-info.html', 'player.html')
+FINGERPRINTED = ('lineawesome-webfont.ttf',)
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+HASH_LENGTH = 12
+# A compressed copy is kept only if it saves at least 10%.
+MIN_SAVING = 0.9
+_EXTENSIONS = {'gzip': '.gz', 'br': '.br'}
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def accepted_encodings(header):
+    """Returns the content codings an Accept-Encoding header allows."""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class Asset:
+    def __init__(self, name, digest, mimetype, variants, mtime, fingerprinted):
+        self.name = name
+        self.digest = digest
+        self.mimetype = mimetype
+        self.variants = variants          # encoding -> bytes; 'identity' always present
+        self.mtime = mtime
+        self.fingerprinted = fingerprinted
+
+    def negotiate(self, accept_encoding):
+        """Returns (encoding, body, etag) for the best variant the client accepts."""
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                return encoding, self.variants[encoding], f'"{self.digest}-{encoding}"'
+        return 'identity', self.variants['identity'], f'"{self.digest}"'
+
+    def matches(self, if_none_match):
+        """True if an If-None-Match header names any variant of this content."""
+        return bool(if_none_match) and (if_none_match.strip() == '*' or self.digest in if_none_match)
+
+
+class AssetStore:
+    def __init__(self, source_dir, build_dir, pages=PAGES, fingerprinted=FINGERPRINTED):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.page_names = pages
+        self.fingerprinted_names = fingerprinted
+        self.lock = threading.Lock()
+        self.pages = {}                   # page name -> Asset
+        self.files = {}                   # fingerprinted file name -> Asset
+        self.urls = {}                    # original name -> /static/ URL
+
+    def build(self):
+        """Fingerprints and compresses every asset, removing stale builds."""
+        os.makedirs(self.build_dir, exist_ok=True)
+        with self.lock:
+            for name in self.fingerprinted_names:
+                asset = self._build(name, fingerprinted=True)
+                self.files[asset.name] = asset
+                self.urls[name] = '/static/' + asset.name
+            for name in self.page_names:
+                self.pages[name] = self._build(name, fingerprinted=False)
+            keep = {self._build_name(asset) for asset in list(self.files.values()) + list(self.pages.values())}
+            for filename in os.listdir(self.build_dir):
+                if os.path.splitext(filename)[0] not in keep and filename not in keep:
+                    os.remove(os.path.join(self.build_dir, filename))
+        return self
+
+    @staticmethod
+    def _build_name(asset):
+        if asset.fingerprinted:
+            return asset.name
+        stem, ext = os.path.splitext(asset.name)
+        return f'{stem}.{asset.digest}{ext}'
+
+    def _rewrite(self, text):
+        for name, url in self.urls.items():
+            text = re.sub(r'/static/' + re.escape(name) + r'\b', url, text)
+        return text
+
+    def _build(self, name, fingerprinted):
+        path = os.path.join(self.source_dir, name)
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if mimetype == 'text/html':
+            data = self._rewrite(data.decode('utf-8')).encode('utf-8')
+            mimetype = 'text/html; charset=utf-8'
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        stem, ext = os.path.splitext(name)
+        asset = Asset(f'{stem}.{digest}{ext}' if fingerprinted else name, digest, mimetype,
+                      {'identity': data}, mtime, fingerprinted)
+
+        build_path = os.path.join(self.build_dir, self._build_name(asset))
+        if not os.path.exists(build_path):
+            self._write(build_path, data)
+        for encoding in ('gzip', 'br') if brotli else ('gzip',):
+            variant_path = build_path + _EXTENSIONS[encoding]
+            if os.path.exists(variant_path):
+                with open(variant_path, 'rb') as f:
+                    compressed = f.read()
+            else:
+                compressed = _compress(data, encoding)
+                self._write(variant_path, compressed)
+            if len(compressed) < len(data) * MIN_SAVING:
+                asset.variants[encoding] = compressed
+        return asset
+
+    @staticmethod
+    def _write(path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def page(self, name):
+        """Returns the Asset for a page, rebuilding it if the source changed."""
+        asset = self.pages[name]
+        try:
+            changed = os.stat(os.path.join(self.source_dir, name)).st_mtime_ns != asset.mtime
+        except OSError:
+            changed = False
+        if changed:
+            with self.lock:
+                asset = self.pages[name] = self._build(name, fingerprinted=False)
+        return asset
+
+    def file(self, filename):
+        """Returns the Asset for a fingerprinted file name, or None."""
+        return self.files.get(filename)
+
+    def url_for(self, name):
+        return self.urls[name]
@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import math
+import time
+import struct
+import threading
+from array import array
+import psutil
+
+# Per-test system telemetry, so a failed test can be checked for thermal
+# throttling or a starved encoder after the fact.
+#
+# Samples are taken once a second into float32 arrays (one per channel).
+# The last hour stays at 1 s resolution; older samples are folded into 1 min
+# means as the test runs, so an 8-hour test holds about 3,600 + 420 samples
+# per channel (~100 KB) no matter how long it runs.
+#
+# The series is stored next to the video as <name>.telemetry.bin:
+#   b'TLM1', uint32 header length, JSON header (space-padded to a multiple of
+#   4 bytes), then for each tier, for each channel, `count` little-endian
+#   float32 values. Missing readings are NaN. The header lists the channels
+#   and, per tier, start_ms, interval_seconds and count.
+TELEMETRY_SUFFIX = '.telemetry.bin'
+MAGIC = b'TLM1'
+SAMPLE_SECONDS = 1
+FINE_WINDOW_SECONDS = 3600
+COARSE_SECONDS = 60
+SAVE_EVERY_SECONDS = 60
+CHANNELS = ('cpu_temp_c', 'cpu_percent', 'memory_percent', 'disk_read_bps', 'disk_write_bps', 'ir_state')
+_TEMPERATURE_PATH = '/sys/class/thermal/thermal_zone0/temp'
+
+
+def telemetry_path_for(video_path):
+    return os.path.splitext(video_path)[0] + TELEMETRY_SUFFIX
+
+
+def _read_temperature():
+    try:
+        with open(_TEMPERATURE_PATH, 'r') as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return math.nan
+
+
+class TieredSeries:
+    """Fixed-interval samples for several channels, at full resolution for
+    the most recent window and as coarse means before that."""
+    def __init__(self, channels, start_ms, interval=SAMPLE_SECONDS, window=FINE_WINDOW_SECONDS,
+                 coarse_interval=COARSE_SECONDS):
+        self.channels = channels
+        self.interval = interval
+        self.coarse_interval = coarse_interval
+        self.fold = coarse_interval // interval
+        self.max_fine = window // interval
+        self.start_ms = start_ms
+        self.fine_start_ms = start_ms
+        self.fine = [array('f') for _ in channels]
+        self.coarse = [array('f') for _ in channels]
+        # Exact per-channel totals over the whole test, for the summary.
+        self.stats = [[math.inf, -math.inf, 0.0, 0] for _ in channels]
+
+    def append(self, values):
+        for series, stats, value in zip(self.fine, self.stats, values):
+            if value is None or math.isnan(value):
+                series.append(math.nan)
+                continue
+            series.append(value)
+            stats[0] = min(stats[0], value)
+            stats[1] = max(stats[1], value)
+            stats[2] += value
+            stats[3] += 1
+        if len(self.fine[0]) >= self.max_fine + self.fold:
+            for fine, coarse in zip(self.fine, self.coarse):
+                block = [v for v in fine[:self.fold] if not math.isnan(v)]
+                coarse.append(sum(block) / len(block) if block else math.nan)
+                del fine[:self.fold]
+            self.fine_start_ms += self.coarse_interval * 1000
+
+    def __len__(self):
+        return len(self.fine[0]) + len(self.coarse[0]) * self.fold
+
+    def to_bytes(self):
+        tiers = [
+            {'start_ms': self.start_ms, 'interval_seconds': self.coarse_interval, 'count': len(self.coarse[0])},
+            {'start_ms': self.fine_start_ms, 'interval_seconds': self.interval, 'count': len(self.fine[0])}
+        ]
+        header = json.dumps({'channels': list(self.channels), 'tiers': tiers}, separators=(',', ':')).encode()
+        header += b' ' * (-len(header) % 4)
+        parts = [MAGIC, struct.pack('<I', len(header)), header]
+        for tier in (self.coarse, self.fine):
+            for series in tier:
+                if sys.byteorder == 'big':
+                    series = array('f', series)
+                    series.byteswap()
+                parts.append(series.tobytes())
+        return b''.join(parts)
+
+    def summary(self):
+        """Min/mean/max per channel over the whole test, at full resolution."""
+        return {name: {'min': round(low, 1), 'mean': round(total / count, 1), 'max': round(high, 1)}
+                for name, (low, high, total, count) in zip(self.channels, self.stats) if count}
+
+
+def read_telemetry(path):
+    """Parses a telemetry file into {'channels', 'tiers': [{..., 'series': {channel: [values]}}]}
+    with NaN readings as None."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError(f"{os.path.basename(path)} is not a telemetry file")
+    header_length = struct.unpack_from('<I', data, 4)[0]
+    header = json.loads(data[8:8 + header_length])
+    offset = 8 + header_length
+    for tier in header['tiers']:
+        tier['series'] = {}
+        for channel in header['channels']:
+            values = struct.unpack_from(f"<{tier['count']}f", data, offset)
+            offset += 4 * tier['count']
+            tier['series'][channel] = [None if math.isnan(v) else round(v, 2) for v in values]
+    return header
+
+
+class TelemetryRecorder:
+    """Samples system telemetry once a second for one test, saving the
+    series to disk every minute and when the test stops."""
+    def __init__(self, video_path, ir_state=lambda: None):
+        self.path = telemetry_path_for(video_path)
+        self.ir_state = ir_state
+        self.series = TieredSeries(CHANNELS, int(time.time() * 1000))
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='telemetry', daemon=True)
+        self.sample_seconds = 0.0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _cpu_busy(self, times):
+        idle = times.idle + getattr(times, 'iowait', 0.0)
+        return sum(times) - idle, sum(times)
+
+    def _run(self):
+        # CPU load is computed from our own cpu_times() deltas so it doesn't
+        # reset the counter psutil.cpu_percent() shares with /api/stats.
+        last_busy, last_total = self._cpu_busy(psutil.cpu_times())
+        last_disk = psutil.disk_io_counters()
+        last_time = time.monotonic()
+        last_save = last_time
+        next_sample = last_time + SAMPLE_SECONDS
+        while not self.stop_event.wait(max(0.0, next_sample - time.monotonic())):
+            started = time.perf_counter()
+            now = time.monotonic()
+            elapsed = now - last_time
+            busy, total = self._cpu_busy(psutil.cpu_times())
+            disk = psutil.disk_io_counters()
+            cpu_percent = 100.0 * (busy - last_busy) / (total - last_total) if total > last_total else math.nan
+            read_bps = write_bps = math.nan
+            if disk and last_disk and elapsed > 0:
+                read_bps = (disk.read_bytes - last_disk.read_bytes) / elapsed
+                write_bps = (disk.write_bytes - last_disk.write_bytes) / elapsed
+            ir_state = self.ir_state()
+            self.series.append((_read_temperature(), cpu_percent, psutil.virtual_memory().percent,
+                                read_bps, write_bps, ir_state))
+            last_busy, last_total, last_disk, last_time = busy, total, disk, now
+            next_sample += SAMPLE_SECONDS
+            self.sample_seconds += time.perf_counter() - started
+            if now - last_save >= SAVE_EVERY_SECONDS:
+                self.save()
+                last_save = now
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.series.to_bytes())
+        os.replace(tmp_path, self.path)
+
+    def stop(self):
+        """Stops sampling, writes the final series and returns a summary for
+        the log entry."""
+        self.stop_event.set()
+        self.thread.join()
+        self.save()
+        return {
+            'samples': len(self.series),
+            'sample_cost_ms': round(self.sample_seconds * 1000 / max(len(self.series), 1), 3),
+            **self.series.summary()
+        }
@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import threading
+
+
+class TestQueue:
+    """A persistent FIFO of pending tests, stored as JSON next to the logs so
+    it survives a restart. Each entry holds the start parameters of a test
+    plus its queue id and the time it was queued (epoch milliseconds)."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return []
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def list(self):
+        with self.lock:
+            return [dict(entry) for entry in self.entries]
+
+    def add(self, params):
+        """Appends a test to the queue and returns the new entry."""
+        with self.lock:
+            now_ms = int(time.time() * 1000)
+            entry_id = max([e['id'] for e in self.entries] + [now_ms - 1]) + 1
+            entry = dict(params, id=entry_id, queued_at=now_ms)
+            self.entries.append(entry)
+            self._save()
+            return dict(entry)
+
+    def remove(self, entry_id):
+        """Cancels a queued test. Returns False if it is not in the queue."""
+        with self.lock:
+            remaining = [e for e in self.entries if e['id'] != entry_id]
+            if len(remaining) == len(self.entries):
+                return False
+            self.entries = remaining
+            self._save()
+            return True
+
+    def reorder(self, entry_ids):
+        """Moves the given ids to the front in the given order; entries not
+        listed keep their relative order behind them. Repeated ids count once."""
+        entry_ids = list(dict.fromkeys(entry_ids))
+        with self.lock:
+            by_id = {e['id']: e for e in self.entries}
+            unknown = [i for i in entry_ids if i not in by_id]
+            if unknown:
+                return unknown
+            listed = set(entry_ids)
+            self.entries = [by_id[i] for i in entry_ids] + [e for e in self.entries if e['id'] not in listed]
+            self._save()
+            return []
+
+    def pop_next(self):
+        """Removes and returns the test at the head of the queue, or None."""
+        with self.lock:
+            if not self.entries:
+                return None
+            entry = self.entries.pop(0)
+            self._save()
+            return entry
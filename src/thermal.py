@@ -0,0 +1,143 @@
+import os
+import json
+import threading
+from collections import deque, namedtuple
+from src.log_schema import now_ms
+
+# Thermal governor. A Pi in an enclosed fixture heats up, and once it passes
+# ~80 °C the firmware throttles the CPU, which starves the recording. The
+# governor watches the CPU temperature and load average and steps the
+# optional work down before that happens: the live-feed frame rate and JPEG
+# quality, the OLED refresh rate and background proxy transcodes. The
+# recording itself is never touched.
+#
+# Levels step up as soon as a threshold is crossed but only step down once
+# the temperature is HYSTERESIS_C below it, so the settings don't flap.
+ThermalLevel = namedtuple('ThermalLevel',
+                          'name min_temp_c stream_max_fps stream_quality oled_refresh_seconds pause_background')
+LEVELS = (
+    ThermalLevel('normal', None, None, 85, 1.0, False),
+    ThermalLevel('warm', 70.0, 15, 75, 2.0, False),
+    ThermalLevel('hot', 75.0, 8, 65, 5.0, True),
+    ThermalLevel('critical', 80.0, 4, 50, 10.0, True),
+)
+HYSTERESIS_C = 3.0
+# Load average per core above which the next level up is used regardless
+# of temperature.
+MAX_LOAD_PER_CORE = 0.9
+POLL_SECONDS = 5
+MAX_EVENTS = 500
+
+
+class ThermalGovernor:
+    def __init__(self, read_temperature, events_path=None, poll_seconds=POLL_SECONDS):
+        self.read_temperature = read_temperature
+        self.events_path = events_path
+        self.poll_seconds = poll_seconds
+        self.level_index = 0
+        # The level from temperature alone, before any load bump. Hysteresis
+        # is applied against this, so the bump can't compound across polls.
+        self.temperature_index = 0
+        self.temperature = None
+        self.load_per_core = None
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.listeners = []
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @property
+    def level(self):
+        return LEVELS[self.level_index]
+
+    def on_change(self, listener):
+        """Registers `listener(level)`. It is called with the current level
+        on every poll, so components created later still pick it up."""
+        self.listeners.append(listener)
+        listener(self.level)
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='thermal-governor', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _temperature_level(self, temperature):
+        index = 0
+        for i, level in enumerate(LEVELS):
+            if level.min_temp_c is None or temperature is None:
+                continue
+            # Staying at a level only needs the lower, hysteresis threshold.
+            threshold = level.min_temp_c - (HYSTERESIS_C if i <= self.temperature_index else 0.0)
+            if temperature >= threshold:
+                index = i
+        return index
+
+    def _target_level(self, temperature_index, load_per_core):
+        if load_per_core is not None and load_per_core > MAX_LOAD_PER_CORE:
+            return min(temperature_index + 1, len(LEVELS) - 1)
+        return temperature_index
+
+    def poll(self):
+        self.temperature = self.read_temperature()
+        self.load_per_core = round(os.getloadavg()[0] / (os.cpu_count() or 1), 2)
+        self.temperature_index = self._temperature_level(self.temperature)
+        index = self._target_level(self.temperature_index, self.load_per_core)
+        if index != self.level_index:
+            self._log_change(self.level_index, index)
+            self.level_index = index
+        for listener in self.listeners:
+            try:
+                listener(self.level)
+            except Exception as e:
+                print(f"Thermal governor listener failed: {e}")
+
+    def _log_change(self, old_index, new_index):
+        old, new = LEVELS[old_index], LEVELS[new_index]
+        event = {
+            'time_ms': now_ms(),
+            'from': old.name,
+            'to': new.name,
+            'temperature_c': self.temperature,
+            'load_per_core': self.load_per_core,
+            'stream_max_fps': new.stream_max_fps,
+            'stream_quality': new.stream_quality,
+            'oled_refresh_seconds': new.oled_refresh_seconds,
+            'pause_background': new.pause_background
+        }
+        self.events.append(event)
+        print(f"Thermal governor: {old.name} -> {new.name} at {self.temperature} °C, load {self.load_per_core}/core "
+              f"(live feed {new.stream_max_fps or 'full'} fps q{new.stream_quality}, OLED every "
+              f"{new.oled_refresh_seconds}s, background work {'paused' if new.pause_background else 'allowed'})")
+        if self.events_path:
+            try:
+                with open(self.events_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(event, separators=(',', ':')) + '\n')
+            except OSError as e:
+                print(f"Could not record thermal event: {e}")
+
+    def events_since(self, since_ms):
+        return [event for event in self.events if event['time_ms'] >= since_ms]
+
+    def status(self):
+        level = self.level
+        return {
+            'level': level.name,
+            'temperature_c': self.temperature,
+            'load_per_core': self.load_per_core,
+            'stream_max_fps': level.stream_max_fps,
+            'stream_quality': level.stream_quality,
+            'oled_refresh_seconds': level.oled_refresh_seconds,
+            'pause_background': level.pause_background,
+            'events': list(self.events)[-20:]
+        }
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Thermal governor poll failed: {e}")
+            self.stop_event.wait(self.poll_seconds)
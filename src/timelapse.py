@@ -0,0 +1,70 @@
+import os
+import shutil
+from src import conversion
+from src.video_tools import encode_image_sequence, remux_h264_to_mp4
+from src.integrity import sha256_file
+
+# Playback rate of the finished time-lapse video.
+TIMELAPSE_PLAYBACK_FPS = 30
+# Seconds of full-rate video kept in memory and saved if the test fails.
+TAIL_SECONDS = 10
+MIN_INTERVAL_SECONDS = 1
+FRAME_PATTERN = 'frame_%06d.jpg'
+
+
+def frames_dir_for(video_path):
+    """Directory the time-lapse stills for a test are captured into."""
+    return os.path.splitext(video_path)[0] + '.frames'
+
+
+def tail_path_for(video_path):
+    """Path of the full-rate clip saved when a time-lapse test fails."""
+    return os.path.splitext(video_path)[0] + '.tail.mp4'
+
+
+def _encode(frames_dir, video_path, on_finalized=None):
+    if not os.path.isdir(frames_dir) or not os.listdir(frames_dir):
+        print(f"No time-lapse frames captured for {video_path}.")
+        return
+    ok, stderr = encode_image_sequence(os.path.join(frames_dir, FRAME_PATTERN), video_path,
+                                       framerate=TIMELAPSE_PLAYBACK_FPS)
+    if ok:
+        shutil.rmtree(frames_dir)
+        print(f"Time-lapse encoded: {video_path}")
+        if on_finalized:
+            # Hashed straight after the encode, while the file is still in the page cache.
+            video_sha256, seconds = sha256_file(video_path)
+            on_finalized({'video_sha256': video_sha256, 'video_hash_seconds': round(seconds, 3)})
+    else:
+        # Keep the stills so the encode can be retried on the next start.
+        print(f"ffmpeg error encoding time-lapse {video_path}: {stderr}")
+
+
+def _finalize_tail(h264_path, mp4_path, framerate):
+    ok, stderr = remux_h264_to_mp4(h264_path, mp4_path, framerate=framerate)
+    if ok:
+        os.remove(h264_path)
+        print(f"Saved failure clip {mp4_path}")
+    else:
+        print(f"ffmpeg error converting failure clip {h264_path}: {stderr}")
+
+
+def finalize_timelapse(video_path, on_finalized=None):
+    """Queues the encode of a test's captured stills into its MP4."""
+    conversion.submit(_encode, frames_dir_for(video_path), video_path, on_finalized)
+
+
+def finalize_tail(h264_path, video_path, framerate):
+    """Queues the remux of a saved full-rate failure clip."""
+    conversion.submit(_finalize_tail, h264_path, tail_path_for(video_path), framerate)
+
+
+def recover_timelapses(directory):
+    """Encodes time-lapse stills left behind by a crash or power loss."""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.frames') and os.path.isdir(os.path.join(directory, name)):
+            video_path = os.path.join(directory, name[:-len('.frames')] + '.mp4')
+            print(f"Recovering interrupted time-lapse {os.path.basename(video_path)}")
+            finalize_timelapse(video_path)
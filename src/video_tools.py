@@ -0,0 +1,204 @@
+import os
+import struct
+import subprocess
+import datetime
+
+# Frame rate the camera records at. Raw .h264 streams carry no timestamps,
+# so ffmpeg has to be told the rate when muxing them into MP4.
+DEFAULT_FRAMERATE = 30
+
+
+def _run_ffmpeg(command):
+    """Runs an ffmpeg command, returning (ok, stderr)."""
+    result = subprocess.run(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    return result.returncode == 0, result.stderr
+
+
+def probe_ffmpeg():
+    """Returns ffmpeg's version line, or raises if ffmpeg can't be run."""
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                text=True, check=True)
+    except FileNotFoundError:
+        raise RuntimeError("ffmpeg is not installed; recordings will stay .h264 and won't play in the browser. "
+                           "Install it with: sudo apt-get install ffmpeg")
+    return result.stdout.split('\n', 1)[0]
+
+
+def remux_h264_to_mp4(h264_file, mp4_file, framerate=DEFAULT_FRAMERATE, creation_time=None):
+    """Muxes a raw H.264 stream into a faststart MP4 without re-encoding.
+
+    The moov atom is moved to the front of the file so browsers can start
+    playback and seek before the whole file has been downloaded."""
+    if creation_time is None:
+        creation_time = datetime.datetime.now(datetime.timezone.utc)
+    command = [
+        'ffmpeg',
+        '-fflags', '+genpts',
+        '-framerate', str(framerate),
+        '-i', h264_file,
+        '-c:v', 'copy',              # Fast, no re-encoding
+        '-movflags', '+faststart',   # Index at the front of the file
+        '-metadata', f"creation_time={creation_time.isoformat()}",
+        '-y',                        # Overwrite if exists
+        mp4_file
+    ]
+    return _run_ffmpeg(command)
+
+
+def is_faststart(mp4_file):
+    """Returns True if the moov atom comes before mdat in an MP4 file.
+
+    Only the top-level box headers are read, so this is cheap even for
+    multi-gigabyte recordings."""
+    try:
+        with open(mp4_file, 'rb') as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, kind = struct.unpack('>I4s', header)
+                if kind == b'moov':
+                    return True
+                if kind == b'mdat':
+                    return False
+                if size == 1:
+                    size = struct.unpack('>Q', f.read(8))[0]
+                    f.seek(size - 16, os.SEEK_CUR)
+                elif size == 0:
+                    return False
+                else:
+                    f.seek(size - 8, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return False
+
+
+def make_faststart(mp4_file):
+    """Rewrites an existing MP4 in place with its index at the front.
+
+    The remux goes to a temporary file first and replaces the original only
+    on success, so an interrupted run never damages the recording."""
+    tmp_file = mp4_file + '.faststart.tmp'
+    command = [
+        'ffmpeg',
+        '-i', mp4_file,
+        '-map', '0',
+        '-c', 'copy',
+        '-movflags', '+faststart',
+        '-f', 'mp4',
+        '-y',
+        tmp_file
+    ]
+    ok, stderr = _run_ffmpeg(command)
+    if not ok:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False, stderr
+    os.replace(tmp_file, mp4_file)
+    return True, ''
+
+
+def faststart_directory(directory):
+    """Fixes every MP4 in a directory that still has its index at the end.
+
+    Returns a dict of counts: fixed, skipped (already faststart) and failed."""
+    counts = {'fixed': 0, 'skipped': 0, 'failed': 0}
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith('.mp4'):
+            continue
+        path = os.path.join(directory, name)
+        if is_faststart(path):
+            counts['skipped'] += 1
+            continue
+        ok, stderr = make_faststart(path)
+        if ok:
+            print(f"Faststart applied: {name}")
+            counts['fixed'] += 1
+        else:
+            print(f"ffmpeg error fixing {name}: {stderr}")
+            counts['failed'] += 1
+    return counts
+
+
+def concat_mp4(mp4_files, output_file):
+    """Joins MP4 segments into one faststart MP4 with a stream copy."""
+    list_file = output_file + '.concat.txt'
+    with open(list_file, 'w') as f:
+        for path in mp4_files:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    command = [
+        'ffmpeg',
+        '-f', 'concat',
+        '-safe', '0',
+        '-i', list_file,
+        '-c', 'copy',
+        '-movflags', '+faststart',
+        '-y',
+        output_file
+    ]
+    try:
+        return _run_ffmpeg(command)
+    finally:
+        os.remove(list_file)
+
+
+def encode_image_sequence(pattern, mp4_file, framerate=DEFAULT_FRAMERATE):
+    """Encodes a numbered JPEG sequence (e.g. frame_%06d.jpg) into a compact
+    faststart H.264 MP4. Cost scales with the number of images, not with how
+    long they took to capture."""
+    command = [
+        'ffmpeg',
+        '-framerate', str(framerate),
+        '-i', pattern,
+        '-c:v', 'libx264',
+        '-preset', 'veryfast',
+        '-crf', '26',
+        '-pix_fmt', 'yuv420p',
+        '-movflags', '+faststart',
+        '-y',
+        mp4_file
+    ]
+    return _run_ffmpeg(command)
+
+
+def proxy_command(mp4_file, proxy_file, height=360, bitrate='600k'):
+    """ffmpeg command for a small proxy rendition for remote review."""
+    return [
+        'ffmpeg',
+        '-i', mp4_file,
+        '-vf', f'scale=-2:{height}',
+        '-c:v', 'libx264',
+        '-preset', 'veryfast',
+        '-b:v', bitrate,
+        '-maxrate', bitrate,
+        '-bufsize', '1200k',
+        '-threads', '1',
+        '-movflags', '+faststart',
+        '-an',
+        '-y',
+        proxy_file
+    ]
+
+
+def cut_clip(mp4_file, clip_file, start, duration):
+    """Cuts a clip with a stream copy. `start` should be a keyframe time so
+    the clip begins on a GOP boundary and needs no re-encode."""
+    command = [
+        'ffmpeg',
+        '-ss', f'{start:.3f}',
+        '-i', mp4_file,
+        '-t', f'{duration:.3f}',
+        '-map', '0',
+        '-c', 'copy',
+        '-avoid_negative_ts', 'make_zero',
+        '-movflags', '+faststart',
+        '-y',
+        clip_file
+    ]
+    return _run_ffmpeg(command)
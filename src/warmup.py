@@ -0,0 +1,97 @@
+import time
+import threading
+
+# Starts the rig's devices in parallel in the background at boot, so the
+# server answers at once and no request pays for (or queues behind) camera
+# start-up. Each device has its own thread; /healthz and /readyz report
+# their states and how long each took.
+PENDING = 'pending'
+STARTING = 'starting'
+READY = 'ready'
+FAILED = 'failed'
+
+
+class Device:
+    def __init__(self, name, initialize, required):
+        self.name = name
+        self.initialize = initialize
+        self.required = required
+        self.state = PENDING
+        self.error = None
+        self.detail = None
+        self.started_at = None
+        self.seconds = None
+
+    def status(self):
+        status = {'state': self.state, 'required': self.required}
+        if self.seconds is not None:
+            status['init_seconds'] = round(self.seconds, 3)
+        elif self.started_at is not None:
+            status['elapsed_seconds'] = round(time.monotonic() - self.started_at, 3)
+        if self.detail is not None:
+            status['detail'] = self.detail
+        if self.error is not None:
+            status['error'] = self.error
+        return status
+
+
+class Warmup:
+    def __init__(self):
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.on_ready = []
+        self.started_at = None
+        self.remaining = 0
+
+    def add(self, name, initialize, required=True):
+        """Registers `initialize()`, which brings the device up or raises. A
+        return value other than None is reported as the device's detail."""
+        self.devices[name] = Device(name, initialize, required)
+
+    def when_ready(self, callback):
+        """Calls `callback()` once every device has finished starting,
+        whether or not it succeeded."""
+        self.on_ready.append(callback)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.remaining = len(self.devices)
+        for device in self.devices.values():
+            threading.Thread(target=self._run, args=(device,), name=f'warmup-{device.name}', daemon=True).start()
+        return self
+
+    def _run(self, device):
+        device.state = STARTING
+        device.started_at = time.monotonic()
+        try:
+            device.detail = device.initialize()
+            device.state = READY
+        except Exception as e:
+            device.error = str(e)
+            device.state = FAILED
+        device.seconds = time.monotonic() - device.started_at
+        print(f"Warm-up: {device.name} {device.state} in {device.seconds:.2f}s"
+              + (f" ({device.error})" if device.error else ""))
+        with self.lock:
+            self.remaining -= 1
+            finished = self.remaining == 0
+        if finished:
+            self.done.set()
+            for callback in self.on_ready:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Warm-up completion callback failed: {e}")
+
+    def ready(self):
+        """True once every required device is up."""
+        return all(device.state == READY for device in self.devices.values() if device.required)
+
+    def status(self):
+        return {
+            'ready': self.ready(),
+            'warming_up': not self.done.is_set(),
+            'uptime_seconds': round(time.monotonic() - self.started_at, 3) if self.started_at else None,
+            'devices': {name: device.status() for name, device in self.devices.items()}
+        }
@@ -0,0 +1,215 @@
+import os
+import time
+import threading
+from collections import deque
+from src.metrics import histogram
+
+# Write-behind buffering for recordings. The encoder's output thread only
+# appends to an in-memory buffer; a writer thread moves it to the SD card in
+# large, aligned writes. A slow flash write (SD cards stall for hundreds of
+# milliseconds while they erase) then delays the writer, not the encoder.
+#
+# The buffer is bounded. If it fills the encoder waits for room rather than
+# lose data, and that wait is counted as back-pressure. An alarm is raised
+# once the buffer passes ALARM_FRACTION full and cleared when it drains
+# below CLEAR_FRACTION.
+#
+# RECORD_FSYNC selects when data is forced to the card: 'close' (each
+# segment as it is closed, the default), 'interval' (also every
+# RECORD_FSYNC_INTERVAL seconds while writing) or 'none'.
+BUFFER_BYTES = int(float(os.environ.get('RECORD_BUFFER_MB', 32)) * 1024 * 1024)
+WRITE_SIZE = 1024 * 1024
+FSYNC_POLICY = os.environ.get('RECORD_FSYNC', 'close')
+FSYNC_INTERVAL_SECONDS = float(os.environ.get('RECORD_FSYNC_INTERVAL', 5))
+FSYNC_POLICIES = ('none', 'close', 'interval')
+ALARM_FRACTION = 0.8
+CLEAR_FRACTION = 0.5
+
+_write_seconds = histogram('record_buffer_write_seconds', 'Time for one write from the recording buffer to storage.')
+_fsync_seconds = histogram('record_buffer_fsync_seconds', 'Time for one fsync of a recording segment.')
+_stall_seconds = histogram('record_buffer_stall_seconds', 'Time the encoder waited for room in a full recording buffer.')
+
+
+class WriteBehindFile:
+    """One file being written through a WriteBehindWriter."""
+    def __init__(self, writer, path):
+        self.writer = writer
+        self.path = path
+
+    def write(self, data):
+        self.writer._put(self, data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self, on_closed=None):
+        """Queues the close. `on_closed()` runs on the writer thread once
+        every byte is written (and synced, by policy) and the file is closed."""
+        self.writer._put(self, None, on_closed)
+
+
+class WriteBehindWriter:
+    """A bounded write-behind buffer and the thread that drains it, shared
+    by every segment of one recording so writes stay in order."""
+    def __init__(self, capacity=BUFFER_BYTES, write_size=WRITE_SIZE, fsync_policy=FSYNC_POLICY,
+                 fsync_interval=FSYNC_INTERVAL_SECONDS):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync_policy}'; use one of {', '.join(FSYNC_POLICIES)}")
+        self.capacity = capacity
+        self.write_size = write_size
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.condition = threading.Condition()
+        self.pending = deque()           # (file, data or None, on_closed)
+        self.buffered = 0                # bytes accepted but not yet written
+        self.peak_buffered = 0
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.alarm = False
+        self.alarms = 0
+        self.bytes_written = 0
+        self.writes = 0
+        self.fsyncs = 0
+        self.max_write_seconds = 0.0
+        self.error = None
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='record-writer', daemon=True)
+        self._thread.start()
+
+    def open(self, path):
+        return WriteBehindFile(self, path)
+
+    def _put(self, file, data, on_closed=None):
+        if data is not None and not isinstance(data, bytes):
+            data = bytes(data)
+        size = len(data) if data is not None else 0
+        with self.condition:
+            if self.buffered + size > self.capacity and self.buffered:
+                started = time.perf_counter()
+                while self.buffered + size > self.capacity and self.buffered and self.error is None:
+                    self.condition.wait(0.1)
+                waited = time.perf_counter() - started
+                self.stalls += 1
+                self.stall_seconds += waited
+                _stall_seconds.observe(waited)
+            self.pending.append((file, data, on_closed))
+            self.buffered += size
+            self.peak_buffered = max(self.peak_buffered, self.buffered)
+            if not self.alarm and self.buffered >= self.capacity * ALARM_FRACTION:
+                self.alarm = True
+                self.alarms += 1
+                print(f"WARNING: recording buffer {self.buffered / self.capacity:.0%} full "
+                      f"({self.buffered // 1024} KiB); storage is not keeping up.")
+            self.condition.notify_all()
+
+    def _run(self):
+        fd = None
+        current = None
+        staged = bytearray()
+        last_fsync = time.monotonic()
+        while True:
+            with self.condition:
+                while not self.pending and not self._stopping:
+                    self.condition.wait()
+                if not self.pending:
+                    break
+                file, data, on_closed = self.pending.popleft()
+            staged_data = False
+            try:
+                if file is not current:
+                    fd = os.open(file.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                    current = file
+                if data is not None:
+                    staged += data
+                    staged_data = True
+                    # Whole multiples of write_size only, so every write
+                    # starts at an aligned file offset.
+                    whole = len(staged) - len(staged) % self.write_size
+                    if whole:
+                        self._write(fd, staged, whole)
+                        del staged[:whole]
+                    if self.fsync_policy == 'interval' and time.monotonic() - last_fsync >= self.fsync_interval:
+                        self._fsync(fd)
+                        last_fsync = time.monotonic()
+                else:
+                    if staged:
+                        self._write(fd, staged, len(staged))
+                        staged.clear()
+                    if self.fsync_policy != 'none':
+                        self._fsync(fd)
+                        last_fsync = time.monotonic()
+                    os.close(fd)
+                    fd = current = None
+            except Exception as e:
+                # Discard what can't be written and keep draining, so the
+                # encoder never blocks on a failed card.
+                if self.error is None:
+                    print(f"Recording writer failed on {file.path}: {e}")
+                self.error = str(e)
+                with self.condition:
+                    self.buffered -= len(staged) + (len(data) if data is not None and not staged_data else 0)
+                    self.condition.notify_all()
+                staged.clear()
+                if data is None:
+                    if fd is not None:
+                        try:
+                            os.close(fd)
+                        except OSError:
+                            pass
+                    fd = current = None
+            if on_closed is not None:
+                try:
+                    on_closed()
+                except Exception as e:
+                    print(f"Recording writer close callback failed for {file.path}: {e}")
+
+    def _write(self, fd, data, length):
+        started = time.perf_counter()
+        view = memoryview(data)[:length]
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        elapsed = time.perf_counter() - started
+        _write_seconds.observe(elapsed)
+        self.writes += 1
+        self.bytes_written += length
+        self.max_write_seconds = max(self.max_write_seconds, elapsed)
+        with self.condition:
+            self.buffered -= length
+            if self.alarm and self.buffered < self.capacity * CLEAR_FRACTION:
+                self.alarm = False
+            self.condition.notify_all()
+
+    def _fsync(self, fd):
+        started = time.perf_counter()
+        os.fsync(fd)
+        _fsync_seconds.observe(time.perf_counter() - started)
+        self.fsyncs += 1
+
+    def close(self, timeout=None):
+        """Waits for everything queued to reach storage, then stops the
+        writer thread. Returns False if it timed out."""
+        with self.condition:
+            self._stopping = True
+            self.condition.notify_all()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def snapshot(self):
+        return {
+            'capacity_bytes': self.capacity,
+            'buffered_bytes': self.buffered,
+            'peak_buffered_bytes': self.peak_buffered,
+            'peak_fill': round(self.peak_buffered / self.capacity, 3),
+            'stalls': self.stalls,
+            'stall_seconds': round(self.stall_seconds, 3),
+            'alarm': self.alarm,
+            'alarms': self.alarms,
+            'writes': self.writes,
+            'bytes_written': self.bytes_written,
+            'max_write_ms': round(self.max_write_seconds * 1000, 1),
+            'fsyncs': self.fsyncs,
+            'fsync_policy': self.fsync_policy,
+            'error': self.error
+        }
@@ -0,0 +1,102 @@
+# Pull-based mirror of test history from one or more rigs' /api/changes feed.
+# Only entries changed since the last pull are transferred.
+# Usage: python sync_client.py <mirror_dir> <rig_url> [<rig_url> ...] [--interval SECONDS]
+#   e.g. python sync_client.py mirror http://rig-01:8080 http://rig-02:8080 --interval 60
+#
+# For each rig the mirror holds <name>.logs.json (entries keyed by id, compact
+# schema) and <name>.state.json (feed epoch and cursor). Point it at any server
+# that speaks the same feed, e.g. a local stand-in, to test it.
+import os
+import re
+import sys
+import json
+import time
+import urllib.request
+import urllib.parse
+
+
+def http_get_json(url, timeout=30):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+def _rig_name(base_url):
+    return re.sub(r'[^a-zA-Z0-9_.-]', '_', urllib.parse.urlparse(base_url).netloc or base_url)
+
+
+def _load(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def sync_rig(base_url, mirror_dir, fetch_json=http_get_json, limit=500):
+    """Pulls all pending changes from one rig into the mirror. Returns the
+    number of changes applied."""
+    os.makedirs(mirror_dir, exist_ok=True)
+    name = _rig_name(base_url)
+    state_path = os.path.join(mirror_dir, f"{name}.state.json")
+    logs_path = os.path.join(mirror_dir, f"{name}.logs.json")
+    state = _load(state_path, {'epoch': None, 'cursor': 0})
+    entries = _load(logs_path, {})
+
+    applied = 0
+    while True:
+        query = urllib.parse.urlencode({'since': state['cursor'], 'limit': limit})
+        page = fetch_json(f"{base_url.rstrip('/')}/api/changes?{query}")
+        if page['epoch'] != state['epoch']:
+            stale_cursor = state['cursor'] != 0
+            if state['epoch'] is not None:
+                print(f"{name}: change feed was reset, resyncing from scratch.")
+            entries = {}
+            state = {'epoch': page['epoch'], 'cursor': 0}
+            if stale_cursor:
+                # This page was fetched with the old feed's cursor; start over.
+                continue
+        for change in page['changes']:
+            key = str(change['id'])
+            if change['op'] == 'delete':
+                entries.pop(key, None)
+            else:
+                entries[key] = change['entry']
+            applied += 1
+        state['cursor'] = page['cursor']
+        # Save the entries before the cursor so a crash never skips changes.
+        _save(logs_path, entries)
+        _save(state_path, state)
+        if not page['more']:
+            return applied
+
+
+def main(argv):
+    interval = None
+    if '--interval' in argv:
+        i = argv.index('--interval')
+        interval = float(argv[i + 1])
+        argv = argv[:i] + argv[i + 2:]
+    if len(argv) < 2:
+        print("Usage: python sync_client.py <mirror_dir> <rig_url> [<rig_url> ...] [--interval SECONDS]")
+        return 2
+    mirror_dir, urls = argv[0], argv[1:]
+    while True:
+        for url in urls:
+            try:
+                applied = sync_rig(url, mirror_dir)
+                print(f"{url}: {applied} changes applied.")
+            except Exception as e:
+                print(f"{url}: sync failed: {e}")
+        if interval is None:
+            return 0
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))